@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Library.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.streams import STREAM_PATH_RE, comments_stream  # noqa: E402 (после настройки Django)
+
+
+async def application(scope, receive, send):
+    """
+    Потоки server-sent events обслуживаются без Django-цикла запроса (core.streams):
+    соединение держит корутина, а не поток. Остальное - обычное приложение Django.
+    """
+    if scope['type'] == 'http' and STREAM_PATH_RE.match(scope['path']):
+        return await comments_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
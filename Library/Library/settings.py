@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,10 +44,17 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
 ]
 
+# Все middleware - синхронные и асинхронные: под ASGI асинхронные представления (core.views.book_async)
+# выполняются в цикле событий, синхронный middleware перевёл бы всю цепочку в поток
+
 MIDDLEWARE = [
+    'core.staticfiles.PrecompressedStaticMiddleware',
+    'core.metrics.PerformanceMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -57,6 +65,9 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Валидаторы условного GET должны быть видны скриптам и с другого origin
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
+
 ROOT_URLCONF = 'Library.urls'
 
 TEMPLATES = [
@@ -80,14 +91,101 @@ WSGI_APPLICATION = 'Library.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+# Профиль выбирается переменной окружения LIBRARY_DB_PROFILE:
+#     'default' - настройки Django по умолчанию (разработка, тесты),
+#     'production' - SQLite для параллельных запросов: WAL, прагмы (PRAGMAS, core.sqlite),
+#         BEGIN IMMEDIATE в transaction.atomic (core.db.sqlite3), постоянные соединения с проверкой.
+# Сравнение профилей под нагрузкой: manage.py stress_sqlite
 
-DATABASES = {
+DATABASE_PROFILES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
+    },
+    'production': {
+        'ENGINE': 'core.db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'LIBRARY_CONN_CHECKS': True,
+        'PRAGMAS': {
+            'journal_mode': 'WAL',          # читатели не блокируют писателя и наоборот
+            'synchronous': 'NORMAL',        # в WAL не теряет целостность, fsync только на checkpoint
+            'busy_timeout': 20000,          # мс ожидания блокировки вместо "database is locked"
+            'mmap_size': 268435456,         # 256 МБ файла БД читаются через отображение в память
+            'cache_size': -65536,           # 64 МБ страничного кэша на соединение
+            'temp_store': 'MEMORY',         # временные таблицы и сортировки в памяти
+        },
+    },
+}
+
+DATABASE_PROFILE = os.environ.get('LIBRARY_DB_PROFILE', 'default')
+
+DATABASES = {
+    'default': {
+        **DATABASE_PROFILES[DATABASE_PROFILE],
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Реплики для чтения (core.routers): LIBRARY_DB_REPLICAS=2 - replica_1, replica_2,
+# локальные копии db.sqlite3, обновляемые manage.py refresh_replicas [--every <секунды>].
+# С репликами кэш ответов должен быть общим для процессов (core.cache.SQLiteCache): refresh_replicas
+# сбрасывает его поколение, чтобы ответы, собранные по отстававшей копии, не жили дольше неё.
+
+DATABASE_REPLICAS = [f'replica_{i}' for i in range(1, int(os.environ.get('LIBRARY_DB_REPLICAS', 0)) + 1)]
+
+for replica in DATABASE_REPLICAS:
+    DATABASES[replica] = {
+        **DATABASE_PROFILES[DATABASE_PROFILE],
+        'NAME': BASE_DIR / f'db.{replica}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# После записи клиент столько секунд читает основную БД (видит свои изменения)
+
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# 'responses' - кэш ответов читающих API (core.cache.ResponseCache) в общем для всех рабочих процессов файле SQLite:
+# поколение, увеличенное записью в одном процессе, видят все.
+# 'fragments' - кэш фрагментов страниц (core.fragments) в своём файле и со своим пределом записей: большие
+# фрагменты не вытесняют ответы API и наоборот, версии записей общие для всех процессов.
+# Тесты подменяют файловые кэши на память процесса (core.testrunner).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'fragments': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': BASE_DIR / 'fragments.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+RESPONSE_CACHE_ENABLED = True
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Кэш фрагментов страниц по версии записи (core.fragments): бэкенд; сколько секунд фрагмент свежий;
+# сколько ещё секунд устаревший фрагмент отдаётся, пока его перерисовывает один запрос
+
+FRAGMENT_CACHE_ENABLED = True
+
+FRAGMENT_CACHE_ALIAS = 'fragments'
+
+FRAGMENT_CACHE_TIMEOUT = 300
+
+FRAGMENT_CACHE_STALE = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -129,6 +227,131 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [Path(BASE_DIR / 'static')]
 
+# Сборка статики (manage.py collectstatic, core.staticfiles): имена с хэшем содержимого и сжатые варианты .gz/.br;
+# из STATIC_ROOT её отдаёт core.staticfiles.PrecompressedStaticMiddleware с Cache-Control immutable
+
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+
+# Пагинация списка книг /lib/api/books/
+# BOOKS_PAGINATION: 'cursor' - по ключу (title, id), 'page' - по номеру страницы (COUNT + OFFSET)
+# BOOKS_TOTAL_PAGES: 'estimated' - оценка по статистике БД без COUNT(*), 'exact' - COUNT(*) на каждой странице,
+# None - не выдавать
+
+BOOKS_PAGINATION = 'cursor'
+
+BOOKS_PAGE_SIZE = 3
+
+BOOKS_MAX_PAGE_SIZE = 100
+
+BOOKS_TOTAL_PAGES = 'estimated'
+
+# Лента комментариев /lib/api/comments/
+
+COMMENTS_PAGE_SIZE = 20
+
+COMMENTS_MAX_PAGE_SIZE = 100
+
+# Поток новых комментариев /lib/api/comments/<book_id>/stream/ (core.streams, только под ASGI):
+# период пустых сообщений, чтобы прокси не закрывали соединение, секунды; длина очереди подписчика
+
+COMMENTS_STREAM_HEARTBEAT = 15
+
+COMMENTS_STREAM_QUEUE_SIZE = 100
+
+# Отложенная запись комментариев пакетами (core.writebehind): None - выключена, 'wait' - ответ после записи пакета,
+# 'provisional' - ответ 202 сразу; размер пакета; сколько секунд ждать добора пакета; длина очереди;
+# сколько секунд запрос ждёт места в заполненной очереди до 503; PRAGMA synchronous потока записи (None - профиля БД)
+
+COMMENTS_WRITE_BEHIND = None
+
+COMMENTS_WRITE_BEHIND_BATCH = 100
+
+COMMENTS_WRITE_BEHIND_INTERVAL = 0.05
+
+COMMENTS_WRITE_BEHIND_QUEUE = 1000
+
+COMMENTS_WRITE_BEHIND_PUT_TIMEOUT = 1.0
+
+COMMENTS_WRITE_BEHIND_SYNCHRONOUS = None
+
+# Ограничение частоты записи в API корзинами токенов (core.throttling): нормы на клиента и на всю группу эндпоинтов
+# ('books', 'authors', 'comments'), '60/min' - всплеск до 60 записей, затем 1 в секунду; файл SQLite с корзинами,
+# общий для рабочих процессов (None - корзины в памяти процесса, у каждого процесса своя норма; так - в тестах,
+# core.testrunner)
+
+WRITE_THROTTLE_ENABLED = True
+
+WRITE_THROTTLE_RATES = {'books': '60/min', 'authors': '60/min', 'comments': '120/min'}
+
+WRITE_THROTTLE_GLOBAL_RATES = {'books': '600/min', 'authors': '600/min', 'comments': '1200/min'}
+
+WRITE_THROTTLE_LOCATION = BASE_DIR / 'throttle.sqlite3'
+
+# Кэш поиска авторов по ФИО (core.relations.authors_cache): число ключей и время жизни записи, секунды
+
+AUTHORS_RESOLVER_CACHE_SIZE = 10000
+
+AUTHORS_RESOLVER_CACHE_TTL = 300
+
+# Сколько последних комментариев книги отдаётся с ?expand=comments (core.fieldsets)
+
+BOOK_LATEST_COMMENTS = 5
+
+# Пакетные GET ?ids= и POST массива в списках книг, авторов и комментариев (core.batch):
+# не больше id или элементов за запрос
+
+BATCH_MAX_SIZE = 100
+
+# Быстрый путь чтения API (core.readers) вместо ModelSerializer, см. core.views.FastReadMixin
+
+FAST_READ_ENABLED = True
+
+# Метрики запросов (core.metrics): гистограммы для GET /metrics и заголовок Server-Timing;
+# доля запросов с разбивкой по БД/сериализации/рендерингу (1.0 - каждый запрос, для отладки);
+# адреса (REMOTE_ADDR), с которых /metrics доступен без входа; токен для заголовка
+# Authorization: Bearer <токен> (None - не принимать), сотрудникам (is_staff) /metrics доступен всегда
+
+METRICS_ENABLED = True
+
+METRICS_SAMPLE_RATE = 0.05
+
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+METRICS_TOKEN = os.environ.get('LIBRARY_METRICS_TOKEN')
+
+# Профилирование запросов (core.profiling): каталог профилей и журнала медленных SQL; доля запросов,
+# профилируемых без заголовка X-Profile; срок действия токена X-Profile, секунды;
+# порог медленного SQL, миллисекунды (None - не отслеживать). Сводка - manage.py perf_report
+
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+PROFILE_SAMPLE_RATE = 0
+
+PROFILE_TOKEN_MAX_AGE = 3600
+
+SLOW_QUERY_MS = 100
+
+# JSON через orjson, если он установлен (иначе стандартный json), вывод тот же, что у JSONRenderer;
+# ограничение частоты записи (core.throttling); NUM_PROXIES - сколько своих прокси перед приложением
+# (LIBRARY_NUM_PROXIES): клиент определяется по стольким последним адресам X-Forwarded-For, 0 - по REMOTE_ADDR
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.WriteThrottle',
+    ),
+    'NUM_PROXIES': int(os.environ.get('LIBRARY_NUM_PROXIES', 0)),
+}
+
+# Тесты: кэши core.cache.SQLiteCache подменяются на кэши в памяти процесса
+
+TEST_RUNNER = 'core.testrunner.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,180 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .cache import response_cache
+from .denormalize import refresh_authors_display
+from .fragments import fragment_cache
+from .models import Books, Authors, Comments
+from .readers import ValuesSerializer
+from .relations import BOOK_KEY, authors_cache, author_item, get_or_create_by_keys, key_of, \
+    resolve_authors_by_key, unique_author_key
+from .signals import touch
+from .streams import comments_hub
+
+# Пакетные чтение и запись для синхронизации каталога (книги, авторы, комментарии):
+#     GET  <список>?ids=3,1,2   - записи по id одним запросом (плюс запросы связей сериализатора),
+#                                 {"results": [...в порядке ids...], "missing": [ненайденные id]};
+#     POST <список> [{...}, ...] - все элементы проверяются вместе; при любой ошибке - 400 со списком ошибок
+#                                 по элементам ({} у правильных) и ничего не пишется; иначе одна транзакция
+#                                 с bulk_create и {"results": [...]} в порядке элементов.
+# Не больше BATCH_MAX_SIZE id или элементов за запрос. bulk_create не вызывает сигналы core.signals,
+# поэтому их действия (счётчики, authors_display, updated_at, кэши и фрагменты, поток комментариев) повторены здесь.
+
+
+def batch_max_size():
+    return getattr(settings, 'BATCH_MAX_SIZE', 100)
+
+
+def parse_ids(value):
+    """
+    Список id из параметра ids ("3,1,2") без повторов, в исходном порядке; ошибка формата - ValidationError (400)
+    """
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if not items or not all(item.isdigit() for item in items):
+        raise ValidationError({'ids': 'Ожидается список целых чисел через запятую'})
+    ids = list(dict.fromkeys(int(item) for item in items))
+    if len(ids) > batch_max_size():
+        raise ValidationError({'ids': f'Не больше {batch_max_size()} id за запрос'})
+    return ids
+
+
+def fetch_in_order(queryset, ids, values=False):
+    """
+    Записи queryset по списку id одним запросом: (записи в порядке ids, ненайденные id).
+    values=True - queryset из values() (core.readers): через filter, in_bulk в Django 3.2 с values() не работает.
+    """
+    if values:
+        found = {row['id']: row for row in queryset.filter(pk__in=ids)}
+    else:
+        found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found], [pk for pk in ids if pk not in found]
+
+
+def bulk_create_with_ids(model, objs):
+    """
+    bulk_create с заполненными id. SQLite в Django 3.2 их не возвращает, но в одной транзакции со вставкой
+    блокировка записи у нас, и вставленные строки - последние len(objs) id таблицы (AUTOINCREMENT).
+    """
+    with transaction.atomic():
+        objs = model.objects.bulk_create(objs)
+        if objs and not connection.features.can_return_rows_from_bulk_insert:
+            ids = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objs)])
+            for obj, pk in zip(objs, reversed(ids)):
+                obj.pk = pk
+    return objs
+
+
+def link_books_authors(links):
+    """
+    Связи книга-автор из пар (id книги, id автора), повторы и уже существующие пропускаются
+    """
+    through = Books.authors.through
+    through.objects.bulk_create([through(books_id=book_id, authors_id=author_id)
+                                 for book_id, author_id in dict.fromkeys(links)], ignore_conflicts=True)
+
+
+def create_books(items):
+    """
+    Книги из проверенных данных BookSerializer; авторы всех книг ищутся/создаются вместе (resolve_authors)
+    """
+    books = bulk_create_with_ids(Books, [Books(title=item['title'], year=item.get('year')) for item in items])
+    ids_by_key = resolve_authors_by_key(author for item in items for author in item['authors'])
+    links = [(book.pk, author_id) for book, item in zip(books, items)
+             for author in map(author_item, item['authors']) for author_id in ids_by_key[author['natural_key']]]
+    if links:
+        link_books_authors(links)
+        touch(Authors, {author_id for _, author_id in links})
+        refresh_authors_display([book.pk for book in books])
+    return books
+
+
+def create_authors(items):
+    """
+    Авторы из проверенных данных AuthorsWriteSerializer; книги всех авторов ищутся/создаются вместе
+    """
+    with unique_author_key():
+        authors = bulk_create_with_ids(Authors, [
+            Authors(**{field: value for field, value in author_item(item).items() if field != 'books'})
+            for item in items])
+    for author in authors:
+        authors_cache.evict(key=author.natural_key)
+    books_by_key = get_or_create_by_keys(Books, BOOK_KEY, [book for item in items for book in item['books']])
+    links = [(book.pk, author.pk) for author, item in zip(authors, items)
+             for book_data in item['books'] for book in books_by_key[key_of(book_data, BOOK_KEY)]]
+    if links:
+        link_books_authors(links)
+        book_ids = list({book_id for book_id, _ in links})
+        touch(Books, book_ids)
+        refresh_authors_display(book_ids)
+        fragment_cache.bump('book', book_ids)
+    return authors
+
+
+def create_comments(items):
+    """
+    Комментарии из проверенных данных CommentsWriteSerializer; comments_count книг - UPDATE на каждое
+    различное число добавленных комментариев, подписчики потока получают комментарии после фиксации
+    """
+    comments = bulk_create_with_ids(Comments, [Comments(content=item['content'], book=item['book']) for item in items])
+    added = defaultdict(int)
+    for comment in comments:
+        added[comment.book_id] += 1
+    book_ids_by_count = defaultdict(list)
+    for book_id, count in added.items():
+        book_ids_by_count[count].append(book_id)
+    now = timezone.now()
+    for count, book_ids in book_ids_by_count.items():
+        Books.objects.filter(pk__in=book_ids).update(comments_count=F('comments_count') + count, updated_at=now)
+
+    def publish():
+        for comment in comments:
+            comments_hub.publish(comment.book_id, {
+                'id': comment.pk, 'time_creation': comment.time_creation, 'content': comment.content})
+    transaction.on_commit(publish)
+    return comments
+
+
+class BatchMixin:
+    """
+    Пакетные GET ?ids= и POST массива для представления-списка (описание - в начале модуля).
+    POST представления передаёт массив в batch_post. batch_serializer_class - сериализатор записи,
+    batch_create - функция: проверенные элементы -> созданные записи.
+    """
+    batch_serializer_class = None
+    batch_create = None
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        ids = parse_ids(request.query_params['ids'])
+        values = issubclass(self.get_serializer_class(), ValuesSerializer)
+        rows, missing = fetch_in_order(self.filter_queryset(self.get_queryset()), ids, values=values)
+        return Response({'results': self.get_serializer(rows, many=True).data, 'missing': missing})
+
+    def batch_post(self, request):
+        if len(request.data) > batch_max_size():
+            raise ValidationError({'non_field_errors': [f'Не больше {batch_max_size()} элементов за запрос']})
+        serializer = self.batch_serializer_class(data=request.data, many=True,
+                                                 context=self.get_batch_context(request.data))
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            objs = self.batch_create(serializer.validated_data)
+            response_cache.invalidate()
+        serializer = self.batch_serializer_class(self.get_batch_results(objs), many=True)
+        return Response({'results': serializer.data}, status=status.HTTP_201_CREATED)
+
+    def get_batch_context(self, items):
+        return {}
+
+    def get_batch_results(self, objs):
+        """
+        Созданные записи для вывода batch_serializer_class (подгрузка связей - в представлении)
+        """
+        return objs
@@ -0,0 +1,272 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+
+class SQLiteCache(BaseCache):
+    """
+    Бэкенд кэша Django в отдельном файле SQLite (WAL): общий для всех рабочих процессов на одной машине.
+    CACHES = {'responses': {'BACKEND': 'core.cache.SQLiteCache', 'LOCATION': '/var/tmp/library-cache.sqlite3'}}
+    При превышении MAX_ENTRIES удаляются записи с ближайшим сроком истечения, число удалённых - в evictions.
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._local = threading.local()
+        self.evictions = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _expires(expiry):
+        return expiry if expiry is not None else float('inf')
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._connection().execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        placeholders = ','.join('?' * len(made))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires >= ?', (*made, time.time()))
+        return {made[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expires(self.get_backend_timeout(timeout))
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                           (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+        self._cull(connection)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expires(self.get_backend_timeout(timeout))
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE key = ? AND expires < ?', (key, time.time()))
+        cursor = connection.execute('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                    (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        expires = self._expires(self.get_backend_timeout(timeout))
+        cursor = self._connection().execute('UPDATE cache SET expires = ? WHERE key = ? AND expires >= ?',
+                                            (expires, key, time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """
+        Атомарно для всех процессов: чтение и запись в одной IMMEDIATE-транзакции
+        """
+        made_key = self.make_key(key, version=version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT value FROM cache WHERE key = ? AND expires >= ?',
+                                     (made_key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?',
+                               (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), made_key))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        return self._connection().execute('SELECT 1 FROM cache WHERE key = ? AND expires >= ?',
+                                          (key, time.time())).fetchone() is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        connection.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries + (count // self._cull_frequency if self._cull_frequency else 0)
+            cursor = connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires LIMIT ?)', (excess,))
+            self.evictions += cursor.rowcount
+
+    def close(self, **kwargs):
+        # Соединение живёт в потоке всё время работы процесса, как и у LocMemCache
+        pass
+
+
+class ResponseCache:
+    """
+    Кэш готовых (отрендеренных) ответов читающих API.
+    Ключ - путь с параметрами и заголовок Accept. Актуальность - по номеру поколения:
+    любое изменение книг/авторов/комментариев (core.signals) увеличивает поколение в том же бэкенде,
+    и все ранее сохранённые ответы становятся устаревшими без перебора ключей.
+    Поколение и ответ читаются одним get_many.
+    Кэшируются только ответы JSON на запросы без входа: в HTML browsable API - имя пользователя и CSRF-токен.
+    Запрос с cookie сессии или заголовком Authorization (возможно, с входом) идёт мимо кэша.
+    """
+    generation_key = 'generation'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'responses')]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+
+    @staticmethod
+    def cacheable(request):
+        """
+        Запрос без входа - без обращения к сессии, годится и для асинхронных представлений
+        """
+        return settings.SESSION_COOKIE_NAME not in request.COOKIES and 'HTTP_AUTHORIZATION' not in request.META
+
+    @staticmethod
+    def storable(response):
+        renderer = getattr(response, 'accepted_renderer', None)
+        media_type = renderer.media_type if renderer is not None else response.get('Content-Type', '')
+        return response.status_code == 200 and media_type.startswith('application/json')
+
+    @staticmethod
+    def make_key(request):
+        source = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        return f"response:{hashlib.sha1(source.encode('utf-8')).hexdigest()}"
+
+    def get(self, request):
+        """
+        Возвращает (ключ, поколение, HttpResponse или None)
+        """
+        key = self.make_key(request)
+        found = self.backend.get_many([self.generation_key, key])
+        generation = found.get(self.generation_key, 0)
+        entry = found.get(key)
+        if entry is None:
+            self.misses += 1
+            return key, generation, None
+        if entry[0] != generation:
+            self.stale += 1
+            self.misses += 1
+            return key, generation, None
+        self.hits += 1
+        _, content, headers = entry
+        response = HttpResponse(content)
+        for header, value in headers.items():
+            response[header] = value
+        return key, generation, response
+
+    def respond(self, request):
+        """
+        Как get, но готовый ответ клиенту: валидаторы сохранены вместе с ответом - 304 без обращения к БД.
+        Заголовок X-Cache: HIT.
+        """
+        key, generation, cached = self.get(request)
+        if cached is not None:
+            not_modified = get_conditional_response(
+                request, etag=cached.get('ETag'), last_modified=parse_http_date_safe(cached.get('Last-Modified', '')))
+            cached = not_modified or cached
+            cached['X-Cache'] = 'HIT'
+        return key, generation, cached
+
+    stored_headers = ('Content-Type', 'Vary', 'ETag', 'Last-Modified')
+
+    def set(self, key, generation, response):
+        headers = {header: response[header] for header in self.stored_headers if response.has_header(header)}
+        entry = (generation, response.content, headers)
+        self.backend.set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        self.stores += 1
+
+    def bump_generation(self):
+        try:
+            self.backend.incr(self.generation_key)
+        except ValueError:
+            if not self.backend.add(self.generation_key, 1, None):
+                self.backend.incr(self.generation_key)
+        self.invalidations += 1
+
+    def invalidate(self):
+        """
+        Поколение увеличивается сразу (процесс-писатель не прочитает своё старое) и после фиксации транзакции
+        (ответы, закэшированные параллельными читателями до фиксации, тоже устаревают).
+        """
+        self.bump_generation()
+        transaction.on_commit(self.bump_generation)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'stores': self.stores,
+            'invalidations': self.invalidations,
+            'evictions': getattr(self.backend, 'evictions', None),
+        }
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Отдаёт GET-ответ из response_cache без обращения к БД и сериализаторам
+    (или 304 по сохранённым ETag/Last-Modified). Заголовок X-Cache: HIT/MISS.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not response_cache.enabled:
+            return super().dispatch(request, *args, **kwargs)
+        # Клиенту, закреплённому за основной БД после записи (core.routers), - мимо кэша и его счётчиков:
+        # сохранённые ответы могли быть собраны по отстающей реплике. Клиенту со входом - тоже (см. ResponseCache)
+        if getattr(request, 'db_sticky', False) or not response_cache.cacheable(request):
+            response = super().dispatch(request, *args, **kwargs)
+            response['X-Cache'] = 'BYPASS'
+            return response
+
+        key, generation, cached = response_cache.respond(request)
+        if cached is not None:
+            return cached
+
+        response = super().dispatch(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        if response_cache.storable(response) and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(lambda rendered: response_cache.set(key, generation, rendered))
+        return response
@@ -0,0 +1,93 @@
+import hashlib
+
+from django.db.models import F, Max, Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import TableDeletions
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET: ETag и Last-Modified считаются по отметкам updated_at (get_validators),
+    без сериализации. При совпадении If-None-Match / If-Modified-Since сразу отдаётся 304.
+
+    get_validators возвращает (состояние, дата изменения) или None, если валидаторов нет (например, 404).
+    Состояние - любое значение, меняющееся вместе с содержимым ответа.
+    """
+    def get_validators(self, request):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        self.args, self.kwargs = args, kwargs
+        validators = self.get_validators(request)
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        not_modified, headers = conditional_response(request, validators)
+        response = not_modified or super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+
+def conditional_response(request, validators):
+    """
+    (304 или None, заголовки ETag/Last-Modified для ответа) по валидаторам (состояние, дата изменения)
+    """
+    state, last_modified = validators
+    source = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}|{state}"
+    etag = quote_etag(hashlib.sha1(source.encode('utf-8')).hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    headers = {'ETag': etag}
+    if timestamp is not None:
+        headers['Last-Modified'] = http_date(timestamp)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+    return not_modified, headers
+
+
+def table_state(model):
+    """
+    Состояние таблицы целиком одним запросом без перебора строк: последняя отметка изменения (MAX по индексу
+    updated_at) и счётчик удалений (TableDeletions, ведёт record_deletion)
+    """
+    latest = model.objects.order_by('-updated_at').values('updated_at')[:1]
+    row = (TableDeletions.objects.filter(pk=model._meta.db_table).annotate(last_updated=Subquery(latest))
+           .values_list('deletions', 'deleted_at', 'last_updated').first())
+    if row is None:
+        deletions, deleted_at = 0, None
+        last_updated = model.objects.aggregate(last=Max('updated_at'))['last']
+    else:
+        deletions, deleted_at, last_updated = row
+    last = max(filter(None, (last_updated, deleted_at)), default=None)
+    return (deletions, last and last.isoformat()), last
+
+
+def record_deletion(model):
+    """
+    Удаление строки model: счётчик удалений таблицы и его время (Last-Modified списка)
+    """
+    now = timezone.now()
+    table = model._meta.db_table
+    if not TableDeletions.objects.filter(pk=table).update(deletions=F('deletions') + 1, deleted_at=now):
+        TableDeletions.objects.get_or_create(pk=table, defaults={'deletions': 1, 'deleted_at': now})
+
+
+def row_state(model, **lookups):
+    """
+    Состояние одной записи по updated_at, None - записи нет
+    """
+    last = model.objects.filter(**lookups).values_list('updated_at', flat=True).first()
+    if last is None:
+        return None
+    return last.isoformat(), last
+
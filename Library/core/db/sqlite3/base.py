@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite, в котором transaction.atomic() начинает транзакцию с BEGIN IMMEDIATE.
+    При обычном BEGIN транзакция, которая сначала читает, а потом пишет, получает "database is locked"
+    сразу, без ожидания busy_timeout, если другой писатель успел зафиксировать изменения.
+    IMMEDIATE берёт блокировку записи в начале, и конкурирующие писатели ждут друг друга.
+    ENGINE = 'core.db.sqlite3' (профиль 'production' в Library/settings.py)
+    """
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
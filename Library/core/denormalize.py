@@ -0,0 +1,94 @@
+from django.db.models import Count
+
+from .models import Books, Authors, author_full_name
+from .relations import KEYS_PER_QUERY
+
+# Денормализованные поля для чтения:
+#     Authors.full_name       - ФИО в одну строку,
+#     Books.authors_display   - список ФИО авторов книги (по возрастанию id автора),
+#     Books.comments_count    - число комментариев.
+# Поддерживаются сигналами (core.signals), массовые операции вызывают refresh_authors_display сами.
+# Проверка и исправление расхождений - manage.py check_denormalized [--repair].
+
+CHECK_CHUNK = 1000
+
+
+def chunks(items, size=KEYS_PER_QUERY):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def authors_display_of(book_ids):
+    """
+    Словарь id книги -> список ФИО авторов, один запрос
+    """
+    names = {pk: [] for pk in book_ids}
+    rows = (Books.authors.through.objects.filter(books_id__in=book_ids)
+            .order_by('books_id', 'authors_id').values_list('books_id', 'authors__full_name'))
+    for book_id, full_name in rows:
+        names[book_id].append(full_name)
+    return names
+
+
+def refresh_authors_display(book_ids):
+    """
+    Пересчитывает Books.authors_display: запрос на чтение и bulk_update на каждые KEYS_PER_QUERY книг
+    """
+    for chunk in chunks(book_ids):
+        names = authors_display_of(chunk)
+        Books.objects.bulk_update([Books(pk=pk, authors_display=value) for pk, value in names.items()],
+                                  ['authors_display'])
+
+
+def check_books(repair=False):
+    """
+    Сверяет authors_display и comments_count со связями и комментариями, порциями по CHECK_CHUNK книг.
+    Возвращает число расхождений (при repair - исправленных).
+    """
+    wrong = 0
+    last_pk = 0
+    while True:
+        books = list(Books.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .only('id', 'authors_display', 'comments_count')[:CHECK_CHUNK])
+        if not books:
+            return wrong
+        last_pk = books[-1].pk
+        book_ids = [book.pk for book in books]
+        names = {}
+        for chunk in chunks(book_ids):
+            names.update(authors_display_of(chunk))
+        counts = dict(Books.objects.filter(pk__in=book_ids).annotate(total=Count('comments'))
+                      .order_by().values_list('pk', 'total'))
+        changed = []
+        for book in books:
+            if book.authors_display != names[book.pk] or book.comments_count != counts[book.pk]:
+                book.authors_display = names[book.pk]
+                book.comments_count = counts[book.pk]
+                changed.append(book)
+        wrong += len(changed)
+        if repair and changed:
+            Books.objects.bulk_update(changed, ['authors_display', 'comments_count'])
+
+
+def check_authors(repair=False):
+    """
+    Сверяет Authors.full_name с ФИО
+    """
+    wrong = 0
+    last_pk = 0
+    while True:
+        authors = list(Authors.objects.filter(pk__gt=last_pk).order_by('pk')
+                       .only('id', 'surname', 'name', 'patronymic', 'full_name')[:CHECK_CHUNK])
+        if not authors:
+            return wrong
+        last_pk = authors[-1].pk
+        changed = []
+        for author in authors:
+            full_name = author_full_name(author.surname, author.name, author.patronymic)
+            if author.full_name != full_name:
+                author.full_name = full_name
+                changed.append(author)
+        wrong += len(changed)
+        if repair and changed:
+            Authors.objects.bulk_update(changed, ['full_name'])
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+
+from .models import Comments
+
+# Состав книги в ответах чтения (/lib/api/books/, /lib/api/book/<pk>/):
+#     ?fields=id,title      - только перечисленные поля верхнего уровня,
+#     ?expand=comments      - последние BOOK_LATEST_COMMENTS комментариев (от новых к старым),
+#     ?expand=authors       - авторы объектами {id, full_name, year} вместо строк ФИО.
+# Без параметров - поля BOOK_DEFAULT_FIELDS без вложенных данных. Queryset строится по запрошенному:
+# колонки и связи, которые не попадут в ответ, не выбираются (id и title - ключ пагинации - выбираются всегда).
+
+BOOK_FIELDS = ('id', 'title', 'year', 'authors', 'comments_count', 'comments')
+BOOK_DEFAULT_FIELDS = ('id', 'title', 'year', 'authors', 'comments_count')
+BOOK_EXPANDABLE = ('authors', 'comments')
+
+# Колонки Books под каждое поле ответа (развёрнутые authors и comments - отдельными запросами)
+BOOK_COLUMNS = {'year': 'year', 'authors': 'authors_display', 'comments_count': 'comments_count'}
+
+
+def split_param(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class BookFieldset:
+    """
+    Запрошенный состав книги: fields - поля в порядке BOOK_FIELDS, expand - развёрнутые связи
+    """
+    def __init__(self, fields=BOOK_DEFAULT_FIELDS, expand=()):
+        expand = frozenset(expand)
+        if 'comments' in fields:
+            expand |= {'comments'}
+        self.expand = expand
+        self.fields = tuple(field for field in BOOK_FIELDS if field in fields or field in expand)
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Из параметров fields и expand запроса (DRF или Django); неизвестные имена - ValidationError (400)
+        """
+        if request is None:
+            return cls()
+        params = getattr(request, 'query_params', request.GET)
+        fields = split_param(params.get('fields', '')) or BOOK_DEFAULT_FIELDS
+        expand = split_param(params.get('expand', ''))
+        errors = {}
+        unknown = sorted(set(fields) - set(BOOK_FIELDS))
+        if unknown:
+            errors['fields'] = f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(BOOK_FIELDS)}"
+        unknown = sorted(set(expand) - set(BOOK_EXPANDABLE))
+        if unknown:
+            errors['expand'] = f"Нельзя развернуть: {', '.join(unknown)}. Доступны: {', '.join(BOOK_EXPANDABLE)}"
+        if errors:
+            raise ValidationError(errors)
+        return cls(fields, expand)
+
+    @property
+    def columns(self):
+        columns = ['id', 'title']
+        for field in self.fields:
+            if field in BOOK_COLUMNS and not (field == 'authors' and self.expands('authors')):
+                columns.append(BOOK_COLUMNS[field])
+        return columns
+
+    def expands(self, relation):
+        return relation in self.expand
+
+
+def latest_comments_limit():
+    return getattr(settings, 'BOOK_LATEST_COMMENTS', 5)
+
+
+def top_comments(book_ids, limit=None):
+    """
+    Последние limit комментариев каждой из книг book_ids одним запросом: номер комментария в своей книге -
+    ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY time_creation DESC, id DESC) в подзапросе по этим книгам.
+    Строк не больше len(book_ids) * limit, порядок - по книге, внутри книги от новых к старым.
+    """
+    book_ids = list(book_ids)
+    if not book_ids:
+        return Comments.objects.none()
+    ranked = (Comments.objects.filter(book_id__in=book_ids)
+              .annotate(position=Window(RowNumber(), partition_by=[F('book_id')],
+                                        order_by=[F('time_creation').desc(), F('id').desc()]))
+              .values('id', 'position'))
+    # Фильтр по оконной функции Django 3.2 не строит - внешний SELECT по готовому SQL подзапроса
+    sql, params = ranked.query.sql_with_params()
+    latest = RawSQL(f'SELECT id FROM ({sql}) AS ranked WHERE position <= %s',
+                    (*params, limit or latest_comments_limit()))
+    return Comments.objects.filter(id__in=latest).order_by('book_id', '-time_creation', '-id')
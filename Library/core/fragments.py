@@ -0,0 +1,93 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+# Кэш фрагментов HTML-страниц, привязанных к записи ({% cachefragment 'book' pk %}, core.templatetags.fragments).
+# Ключ - имя фрагмента и id записи, актуальность - по версии записи: core.signals (и массовые операции)
+# меняют версию книги при сохранении/удалении книги, изменении её авторов и связей книга-автор.
+# Комментарии версию не меняют - блок комментариев на странице остаётся динамическим.
+# Запись живёт FRAGMENT_CACHE_TIMEOUT секунд, затем ещё FRAGMENT_CACHE_STALE секунд отдаётся устаревшей,
+# пока её перерисовывает один запрос (stale-while-revalidate): популярная страница не идёт в БД всеми
+# запросами разом. Смена версии - всегда промах, изменённые данные не показываются.
+
+# Сколько секунд перерисовка держит блокировку от параллельных перерисовок
+REFRESH_LOCK_SECONDS = 10
+
+
+class FragmentCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refreshes = 0
+
+    @property
+    def backend(self):
+        return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'fragments')]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'FRAGMENT_CACHE_ENABLED', True)
+
+    @staticmethod
+    def version_key(name, pk):
+        return f'fragment-version:{name}:{pk}'
+
+    @staticmethod
+    def fragment_key(name, pk):
+        return f'fragment:{name}:{pk}'
+
+    def render(self, name, pk, render):
+        """
+        HTML фрагмента из кэша или render() (с сохранением). Версия и фрагмент читаются одним get_many.
+        """
+        if not self.enabled:
+            return render()
+        version_key, fragment_key = self.version_key(name, pk), self.fragment_key(name, pk)
+        found = self.backend.get_many([version_key, fragment_key])
+        version, entry = found.get(version_key), found.get(fragment_key)
+        if entry is not None and entry[0] == version:
+            if entry[2] > time.time():
+                self.hits += 1
+                return mark_safe(entry[1])
+            if not self.backend.add(f'{fragment_key}:refresh', 1, REFRESH_LOCK_SECONDS):
+                # Перерисовывает другой запрос - пока отдаём устаревшее
+                self.stale += 1
+                return mark_safe(entry[1])
+            self.refreshes += 1
+        else:
+            self.misses += 1
+        html = render()
+        self.store(fragment_key, version, html)
+        return html
+
+    def store(self, fragment_key, version, html):
+        fresh = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300)
+        stale = getattr(settings, 'FRAGMENT_CACHE_STALE', 60)
+        self.backend.set(fragment_key, (version, str(html), time.time() + fresh), fresh + stale)
+        self.backend.delete(f'{fragment_key}:refresh')
+
+    def bump(self, name, pks):
+        """
+        Новые версии записей: сохранённые фрагменты перестают совпадать. Сразу и после фиксации транзакции
+        (фрагмент, перерисованный параллельным читателем до фиксации, тоже устаревает).
+        """
+        keys = [self.version_key(name, pk) for pk in pks]
+        if not keys:
+            return
+
+        def set_versions():
+            version = uuid.uuid4().hex
+            self.backend.set_many({key: version for key in keys}, None)
+        set_versions()
+        transaction.on_commit(set_versions)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'refreshes': self.refreshes}
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,141 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core import urls
+from core.models import Books, Comments
+
+# Маршруты core.urls, которые замер пропускает: поток SSE работает только под ASGI (под WSGI - пустой 204)
+SKIP_ROUTES = {'api/comments/<int:book_id>/stream/'}
+
+# Параметры запроса для маршрутов, которым без них нечего делать
+QUERY_STRINGS = {'api/search/': 'q=путь'}
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет GET-запросы ко всем маршрутам core.urls внутри процесса (django.test.Client): '
+            'задержка p50/p95/p99, запросы к БД и пик памяти на запрос. '
+            'Результат можно сохранить (--output) и сравнить с сохранённым ранее (--compare).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Запросов к каждому маршруту')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Не отключать кэш ответов (по умолчанию замеряется сборка ответа)')
+        parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+        parser.add_argument('--compare', help='JSON-файл прошлого прогона: вывести изменения')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше 0')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)['endpoints']
+
+        targets = self.targets()
+        client = Client()
+        results = {}
+        with override_settings(RESPONSE_CACHE_ENABLED=options['with_cache'],
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for route, url in targets:
+                results[route] = self.measure(client, url, options['requests'])
+
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'requests': options['requests'], 'cache': options['with_cache'], 'endpoints': results},
+                          file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Сохранено: {options['output']}")
+
+    @staticmethod
+    def targets():
+        """
+        [(маршрут, URL)]: параметры подставляются из книги с наибольшим числом комментариев
+        """
+        book = Books.objects.order_by('-comments_count', 'id').first()
+        if book is None:
+            raise CommandError('В БД нет книг: manage.py seed_library')
+        samples = {
+            'book': book.pk,
+            'author': book.authors.order_by('id').values_list('id', flat=True).first(),
+            'comment': Comments.objects.filter(book=book).order_by('id').values_list('id', flat=True).first(),
+        }
+        prefix = reverse('books_list')[:-len('books/')]
+
+        targets = []
+        for pattern in urls.urlpatterns:
+            route = str(pattern.pattern)
+            # <int:pk> - объект по первому слову маршрута после api/ (book, author, comment)
+            kind = route.split('/')[1 if route.startswith('api/') else 0]
+            url = prefix + route
+            for name in pattern.pattern.converters:
+                value = samples['book'] if name == 'book_id' else samples.get(kind, samples['book'])
+                url = url.replace(f'<int:{name}>', str(value))
+            if route in SKIP_ROUTES or 'None' in url:
+                continue
+            if route in QUERY_STRINGS:
+                url = f'{url}?{QUERY_STRINGS[route]}'
+            targets.append((route, url))
+        return targets
+
+    @staticmethod
+    def measure(client, url, requests):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: {response.status_code}')
+
+        # Запросы к БД считаются обёрткой курсора: connection.queries очищается сигналом request_started
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        timings = []
+        with connection.execute_wrapper(count):
+            for _ in range(requests):
+                started = time.perf_counter()
+                client.get(url)
+                timings.append(time.perf_counter() - started)
+
+        # Память - отдельным запросом: tracemalloc замедляет выполнение и исказил бы задержку
+        tracemalloc.start()
+        try:
+            client.get(url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        percentiles = statistics.quantiles(timings, n=100, method='inclusive') if requests > 1 else timings * 99
+        return {
+            'url': url,
+            'p50_ms': round(percentiles[49] * 1000, 3),
+            'p95_ms': round(percentiles[94] * 1000, 3),
+            'p99_ms': round(percentiles[98] * 1000, 3),
+            'queries': round(len(queries) / requests, 2),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(f"{'route':<36}{'p50, ms':>9}{'p95, ms':>9}{'p99, ms':>9}{'queries':>9}{'peak, KB':>10}")
+        for route, result in results.items():
+            line = (f"{route:<36}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                    f"{result['queries']:>9g}{result['peak_kb']:>10.1f}")
+            previous = (baseline or {}).get(route)
+            if previous:
+                line += (f"   p95 {self.change(previous['p95_ms'], result['p95_ms'])}"
+                         f", queries {result['queries'] - previous['queries']:+g}"
+                         f", peak {self.change(previous['peak_kb'], result['peak_kb'])}")
+            self.stdout.write(line)
+
+    @staticmethod
+    def change(before, after):
+        return f'{100 * (after - before) / before:+.0f}%' if before else '-'
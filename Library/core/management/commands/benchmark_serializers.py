@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.denormalize import refresh_authors_display
+from core.models import Books, Authors, Comments
+from core.readers import AuthorsValuesSerializer, BooksValuesSerializer, CommentsValuesSerializer
+from core.relations import author_item
+from core.renderers import FastJSONRenderer, orjson
+from core.serializers import AuthorsReadSerializer, BooksSerializer, CommentsListSerializer
+
+PREFIX = 'Бенчмарк'
+
+# (название, queryset, сериализатор DRF, быстрый сериализатор)
+CASES = (
+    ('books', lambda: Books.objects.filter(title__startswith=PREFIX).order_by('title', 'id'),
+     BooksSerializer, BooksValuesSerializer),
+    ('authors', lambda: Authors.objects.filter(surname__startswith=PREFIX).order_by('id'),
+     AuthorsReadSerializer, AuthorsValuesSerializer),
+    ('comments', lambda: Comments.objects.filter(content__startswith=PREFIX).order_by('-time_creation', '-id'),
+     CommentsListSerializer, CommentsValuesSerializer),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время сериализации и рендеринга JSON: сериализаторы DRF против быстрого пути '
+            '(core.readers + FastJSONRenderer). Данные создаются во временной транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='Число строк в ответе')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов на каждый замер (берётся медиана)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"JSON: {'orjson' if orjson else 'json (orjson не установлен)'}")
+        self.stdout.write(f"{'endpoint':<10}{'rows':>6}{'drf, ms':>10}{'fast, ms':>10}{'x':>7}")
+        with transaction.atomic():
+            self.fill(max(options['sizes']))
+            for name, queryset, serializer_class, fast_class in CASES:
+                for size in options['sizes']:
+                    slow, slow_content = self.measure(serializer_class, JSONRenderer(), queryset, size,
+                                                      options['repeat'])
+                    fast, fast_content = self.measure(fast_class, FastJSONRenderer(), queryset, size,
+                                                      options['repeat'])
+                    if slow_content != fast_content:
+                        raise CommandError(f'{name}, {size}: вывод быстрого пути отличается')
+                    self.stdout.write(f'{name:<10}{size:>6}{slow * 1000:>10.2f}{fast * 1000:>10.2f}'
+                                      f'{slow / fast:>7.1f}')
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(serializer_class, renderer, queryset, size, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = list(serializer_class.setup_eager_loading(queryset())[:size])
+            content = renderer.render(serializer_class(rows, many=True).data)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings), content
+
+    @staticmethod
+    def fill(count, authors_per_book=2, comments_per_book=3):
+        """
+        count книг, авторов и комментариев (авторов и комментариев - больше, чем нужно для выборки)
+        """
+        Books.objects.bulk_create(Books(title=f'{PREFIX} {i:05}', year=1900 + i % 120) for i in range(count))
+        book_ids = list(Books.objects.filter(title__startswith=PREFIX).order_by('title').values_list('id', flat=True))
+        Authors.objects.bulk_create(
+            Authors(**author_item({'surname': f'{PREFIX} {i:05}', 'name': 'Имя', 'patronymic': 'Отчество'}))
+            for i in range(count))
+        author_ids = list(Authors.objects.filter(surname__startswith=PREFIX).order_by('surname')
+                          .values_list('id', flat=True))
+
+        through = Books.authors.through
+        through.objects.bulk_create(
+            through(books_id=book_id, authors_id=author_ids[(i + j) % count])
+            for i, book_id in enumerate(book_ids) for j in range(authors_per_book))
+        Comments.objects.bulk_create(
+            Comments(content=f'{PREFIX}: комментарий {j} к книге {i}', book_id=book_id)
+            for i, book_id in enumerate(book_ids) for j in range(comments_per_book))
+        refresh_authors_display(book_ids)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache import response_cache
+from core.denormalize import check_authors, check_books
+
+
+class Command(BaseCommand):
+    help = 'Проверяет денормализованные поля (ФИО авторов, число комментариев) и при --repair исправляет их'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Исправить найденные расхождения')
+
+    def handle(self, *args, **options):
+        repair = options['repair']
+        with transaction.atomic():
+            # Сначала авторы: authors_display книг собирается из Authors.full_name
+            authors = check_authors(repair)
+            books = check_books(repair)
+        if repair and (authors or books):
+            response_cache.bump_generation()
+
+        action = 'Исправлено' if repair else 'Найдено расхождений'
+        message = f'{action}: авторов - {authors}, книг - {books}'
+        if authors or books:
+            self.stdout.write(self.style.WARNING(message) if not repair else self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
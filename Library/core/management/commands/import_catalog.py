@@ -0,0 +1,172 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.cache import response_cache
+from core.denormalize import refresh_authors_display
+from core.fragments import fragment_cache
+from core.models import Books, Authors
+from core.relations import AUTHOR_KEY, BOOK_KEY, author_item, key_of, get_or_create_by_keys
+from core.signals import touch
+
+
+def read_jsonl(stream):
+    """
+    Строка JSONL - книга в формате POST /lib/api/books/:
+    {"title": "Геном", "year": 1999, "authors": [{"surname": "Лукьяненко", "name": "Сергей", "patronymic": "Васильевич"}]}
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream, delimiter):
+    """
+    CSV с заголовком title,year,authors. Авторы в одной колонке через ";" в виде "Фамилия Имя Отчество".
+    """
+    for row in csv.DictReader(stream, delimiter=delimiter):
+        authors = []
+        for full_name in (row.get('authors') or '').split(';'):
+            parts = full_name.split()
+            if len(parts) >= 2:
+                authors.append({'surname': parts[0], 'name': parts[1],
+                                'patronymic': ' '.join(parts[2:]) or None})
+        yield {'title': row.get('title'), 'year': row.get('year') or None, 'authors': authors}
+
+
+class KeyIndex:
+    """
+    Индекс натуральный ключ -> id записей в памяти. Хранит только ключи и числа,
+    поэтому строки файла не накапливаются.
+    """
+    def __init__(self, model, key_fields):
+        self.model = model
+        self.key_fields = key_fields
+        self.ids = {}
+
+    def preload(self):
+        for row in self.model.objects.values_list('id', *self.key_fields).iterator(chunk_size=10000):
+            self.ids.setdefault(tuple(row[1:]), []).append(row[0])
+
+    def resolve(self, items):
+        """
+        Возвращает id для каждого элемента, недостающие записи создаются одним bulk_create на пачку
+        """
+        missing = [item for item in items if key_of(item, self.key_fields) not in self.ids]
+        created = 0
+        if missing:
+            for key, objs in get_or_create_by_keys(self.model, self.key_fields, missing).items():
+                self.ids[key] = [obj.pk for obj in objs]
+            created = len({key_of(item, self.key_fields) for item in missing})
+        return [self.ids[key_of(item, self.key_fields)] for item in items], created
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт каталога книг и авторов из CSV/JSONL пачками (bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV/JSONL, "-" - стандартный ввод')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной транзакции')
+        parser.add_argument('--delimiter', default=',', help='Разделитель колонок CSV')
+        parser.add_argument('--progress-every', type=int, default=10, help='Печатать скорость каждые N пачек')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            if file_format == 'csv':
+                rows = read_csv(stream, options['delimiter'])
+            else:
+                rows = read_jsonl(stream)
+            self.import_rows(rows, options['batch_size'], options['progress_every'])
+        except (ValueError, csv.Error) as exc:
+            raise CommandError(f'Ошибка чтения {path}: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def import_rows(self, rows, batch_size, progress_every):
+        authors_index = KeyIndex(Authors, AUTHOR_KEY)
+        books_index = KeyIndex(Books, BOOK_KEY)
+        authors_index.preload()
+        books_index.preload()
+
+        self.totals = {'rows': 0, 'skipped': 0, 'books': 0, 'authors': 0, 'links': 0}
+        started = time.monotonic()
+        batch_number = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            self.import_batch(batch, authors_index, books_index)
+            # bulk_create не посылает сигналов - кэш ответов сбрасываем сами
+            response_cache.bump_generation()
+            batch_number += 1
+            if progress_every and batch_number % progress_every == 0:
+                self.report(started)
+        self.report(started, final=True)
+
+    def import_batch(self, batch, authors_index, books_index):
+        books_data, authors_per_book = [], []
+        for row in batch:
+            if not row.get('title'):
+                self.totals['skipped'] += 1
+                continue
+            year = row.get('year')
+            books_data.append({'title': row['title'], 'year': int(year) if year is not None else None})
+            authors_per_book.append([
+                author_item({'surname': a['surname'], 'name': a['name'], 'patronymic': a.get('patronymic'),
+                             'year': a.get('year')})
+                for a in row.get('authors') or []
+            ])
+
+        through = Books.authors.through
+        with transaction.atomic():
+            book_ids, created_books = books_index.resolve(books_data)
+            flat_authors = [author for authors in authors_per_book for author in authors]
+            author_ids, created_authors = authors_index.resolve(flat_authors)
+
+            links = set()
+            position = 0
+            for ids_of_book, authors in zip(book_ids, authors_per_book):
+                for ids_of_author in author_ids[position:position + len(authors)]:
+                    links.update((book_id, author_id) for book_id in ids_of_book for author_id in ids_of_author)
+                position += len(authors)
+            # Существующие связи пропускаются на уровне уникального индекса промежуточной таблицы
+            through.objects.bulk_create(
+                (through(books_id=book_id, authors_id=author_id) for book_id, author_id in links),
+                batch_size=1000, ignore_conflicts=True,
+            )
+            # Связи с уже существующими записями меняют их ответы API (ETag/Last-Modified)
+            linked_books = {book_id for book_id, _ in links}
+            touch(Books, linked_books)
+            touch(Authors, {author_id for _, author_id in links})
+            refresh_authors_display(linked_books)
+            fragment_cache.bump('book', linked_books)
+
+        self.totals['rows'] += len(batch)
+        self.totals['books'] += created_books
+        self.totals['authors'] += created_authors
+        self.totals['links'] += len(links)
+
+    def report(self, started, final=False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        message = (f"строк: {self.totals['rows']} ({self.totals['rows'] / elapsed:.0f} строк/с), "
+                   f"новых книг: {self.totals['books']}, новых авторов: {self.totals['authors']}, "
+                   f"связей: {self.totals['links']}, пропущено: {self.totals['skipped']}")
+        if final:
+            self.stdout.write(self.style.SUCCESS(f'Импорт завершён за {elapsed:.1f} с. {message}'))
+        else:
+            self.stdout.write(message)
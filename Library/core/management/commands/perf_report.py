@@ -0,0 +1,95 @@
+import glob
+import json
+import os
+import pstats
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import SLOW_QUERIES_FILE, function_name, make_token, profile_dir
+
+# Полный просмотр таблиц каталога в EXPLAIN QUERY PLAN (SQLite 3.36+: "SCAN t", раньше "SCAN TABLE t");
+# просмотр по индексу ("SCAN t USING INDEX ...") полным не считается
+FULL_SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?(core_books_authors|core_books|core_authors|core_comments)\b(?! USING)')
+
+# Списки параметров IN разной длины - один и тот же запрос
+PLACEHOLDERS_RE = re.compile(r'\((?:%s, )+%s\)')
+
+
+def normalize_sql(sql):
+    return PLACEHOLDERS_RE.sub('(%s, ...)', ' '.join(sql.split()))
+
+
+class Command(BaseCommand):
+    help = ('Сводка по сохранённым профилям запросов и медленным SQL (core.profiling): самые затратные функции, '
+            'самые медленные запросы и полные просмотры таблиц core_books, core_authors, core_comments и связей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Каталог профилей (по умолчанию PROFILE_DIR)')
+        parser.add_argument('--limit', type=int, default=15, help='Строк в каждой таблице')
+        parser.add_argument('--token', action='store_true',
+                            help='Только вывести значение заголовка X-Profile для профилирования запроса')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(make_token())
+            return
+        directory = options['dir'] or profile_dir()
+        self.report_profiles(sorted(glob.glob(os.path.join(directory, '*.prof'))), options['limit'])
+        self.report_queries(os.path.join(directory, SLOW_QUERIES_FILE), options['limit'])
+
+    def report_profiles(self, files, limit):
+        if not files:
+            self.stdout.write('Профилей нет')
+            return
+        stats = pstats.Stats(*files)
+        self.stdout.write(f'Профилей: {len(files)}, общее время: {stats.total_tt:.3f} с.')
+
+        rows = [(function, primitive, calls, own, total) for function, (primitive, calls, own, total, _)
+                in stats.stats.items()]
+        project = str(settings.BASE_DIR)
+        self.table('Собственное время (все функции)', sorted(rows, key=lambda row: -row[3])[:limit])
+        self.table('Накопленное время (код проекта)',
+                   sorted((row for row in rows if row[0][0].startswith(project)), key=lambda row: -row[4])[:limit])
+
+    def table(self, title, rows):
+        self.stdout.write(f"\n{title}\n{'calls':>10}{'own, s':>10}{'total, s':>10}  function")
+        for function, primitive, calls, own, total in rows:
+            calls_text = str(calls) if calls == primitive else f'{calls}/{primitive}'
+            self.stdout.write(f'{calls_text:>10}{own:>10.4f}{total:>10.4f}  {function_name(function)}')
+
+    def report_queries(self, path, limit):
+        if not os.path.exists(path):
+            self.stdout.write('\nМедленных SQL нет')
+            return
+        queries = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'max_ms': 0.0, 'routes': set(), 'plan': []})
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                query = queries[normalize_sql(entry['sql'])]
+                query['count'] += 1
+                query['ms'] += entry['ms']
+                query['max_ms'] = max(query['max_ms'], entry['ms'])
+                query['routes'].add(entry['route'])
+                query['plan'] = entry['plan']
+
+        self.stdout.write(f"\nМедленные SQL: {len(queries)}\n{'count':>7}{'max, ms':>10}{'sum, ms':>10}  sql")
+        for sql, query in sorted(queries.items(), key=lambda item: -item[1]['ms'])[:limit]:
+            self.stdout.write(f"{query['count']:>7}{query['max_ms']:>10.1f}{query['ms']:>10.1f}  {sql[:200]}")
+
+        scans = [(sql, query, FULL_SCAN_RE.findall(' | '.join(query['plan']))) for sql, query in queries.items()]
+        scans = [scan for scan in scans if scan[2]]
+        if not scans:
+            self.stdout.write('\nПолных просмотров таблиц каталога нет')
+            return
+        self.stdout.write(self.style.WARNING(f'\nПолные просмотры таблиц: {len(scans)}'))
+        for sql, query, tables in scans:
+            self.stdout.write(self.style.WARNING(
+                f"{', '.join(sorted(set(tables)))} - {', '.join(sorted(query['routes']))}"))
+            self.stdout.write(f'    {sql[:200]}')
+            for step in query['plan']:
+                self.stdout.write(f'      {step}')
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс поиска (FTS5) по книгам, авторам и комментариям'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Полнотекстовый поиск доступен только на SQLite (FTS5)')
+        started = time.monotonic()
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Индекс пересобран за {time.monotonic() - started:.1f} с.'))
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.cache import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Обновляет реплики для чтения (DATABASE_REPLICAS) - копии основной БД SQLite через backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=None,
+                            help='Повторять каждые N секунд (без параметра - один раз)')
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('Реплики не настроены: LIBRARY_DB_REPLICAS=<число> (Library/settings.py)')
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Копирование через backup API - только для SQLite')
+
+        while True:
+            started = time.monotonic()
+            for alias in replicas:
+                self.refresh(alias)
+            # Ответы, закэшированные по отстававшим копиям, устаревают вместе с ними
+            response_cache.bump_generation()
+            self.stdout.write(f'Реплики обновлены за {time.monotonic() - started:.2f} с.: {", ".join(replicas)}')
+            if options['every'] is None:
+                return
+            time.sleep(max(options['every'] - (time.monotonic() - started), 0))
+
+    @staticmethod
+    def refresh(alias):
+        """
+        Копия страниц основной БД в файл реплики. Читатели реплики ждут окончания (busy_timeout),
+        постоянные соединения реплики видят новые данные со следующей транзакции.
+        """
+        source = connections['default']
+        source.ensure_connection()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'], timeout=30)
+        try:
+            source.connection.backup(target, pages=0)
+        finally:
+            target.close()
@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core import search
+from core.cache import response_cache
+from core.models import Books, Authors, Comments
+from core.relations import author_item, authors_cache
+
+SURNAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков', 'Фёдоров',
+    'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев',
+    'Орлов', 'Андреев', 'Макаров', 'Никитин', 'Захаров', 'Зайцев', 'Соловьёв', 'Борисов', 'Яковлев', 'Григорьев',
+    'Романов', 'Воробьёв', 'Сергеев', 'Кузьмин', 'Фролов', 'Александров', 'Дмитриев', 'Королёв', 'Гусев', 'Киселёв',
+    'Ильин', 'Максимов', 'Поляков', 'Сорокин', 'Виноградов', 'Ковалёв', 'Белов', 'Медведев', 'Антонов', 'Тарасов',
+    'Жуков', 'Баранов', 'Филиппов', 'Комаров', 'Давыдов', 'Беляев', 'Герасимов', 'Богданов', 'Осипов', 'Сидоров',
+)
+NAMES = (
+    'Александр', 'Алексей', 'Андрей', 'Антон', 'Аркадий', 'Борис', 'Вадим', 'Валентин', 'Василий', 'Виктор',
+    'Владимир', 'Вячеслав', 'Геннадий', 'Георгий', 'Григорий', 'Даниил', 'Денис', 'Дмитрий', 'Евгений', 'Егор',
+    'Иван', 'Игорь', 'Илья', 'Кирилл', 'Константин', 'Лев', 'Леонид', 'Максим', 'Михаил', 'Никита',
+    'Николай', 'Олег', 'Павел', 'Пётр', 'Роман', 'Сергей', 'Станислав', 'Степан', 'Фёдор', 'Юрий',
+)
+PATRONYMICS = (
+    'Александрович', 'Алексеевич', 'Андреевич', 'Борисович', 'Васильевич', 'Викторович', 'Владимирович',
+    'Геннадьевич', 'Григорьевич', 'Дмитриевич', 'Евгеньевич', 'Иванович', 'Игоревич', 'Константинович',
+    'Михайлович', 'Николаевич', 'Олегович', 'Павлович', 'Петрович', 'Романович', 'Сергеевич', 'Степанович',
+    'Фёдорович', 'Юрьевич', None,
+)
+ADJECTIVES = (
+    'Тёмный', 'Последний', 'Северный', 'Забытый', 'Железный', 'Тихий', 'Белый', 'Долгий', 'Чужой', 'Ночной',
+    'Золотой', 'Старый', 'Красный', 'Холодный', 'Далёкий', 'Потерянный', 'Морской', 'Лесной', 'Звёздный', 'Новый',
+)
+NOUNS = (
+    'путь', 'город', 'берег', 'ветер', 'сад', 'остров', 'дом', 'мост', 'лес', 'век',
+    'караван', 'маяк', 'рассвет', 'перевал', 'колокол', 'архив', 'поезд', 'замок', 'горизонт', 'шторм',
+)
+GENITIVES = (
+    '', '', '', ' империи', ' капитана', ' севера', ' времени', ' героев', ' реки', ' короля', ' памяти', ' войны',
+)
+SENTENCES = (
+    'Прочитал за один вечер.', 'Сюжет затягивает с первых страниц.', 'Концовка показалась скомканной.',
+    'Отличный язык, рекомендую.', 'Перечитываю уже третий раз.', 'Середина немного провисает.',
+    'Герои живые и узнаваемые.', 'Ждал большего после аннотации.', 'Хорошая книга для дороги.',
+    'Атмосфера передана прекрасно.', 'Не понравился перевод.', 'Лучшее, что читал в этом году.',
+)
+
+# Комментарии до этого момента, с шагом около минуты (для ленты по time_creation, id)
+COMMENTS_START = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = ('Генерирует воспроизводимый каталог (книги, авторы, связи, комментарии) заданного размера '
+            'для нагрузочных замеров. Одинаковый --seed на пустой БД даёт одинаковые данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--authors', type=int, default=500)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Строк в одной транзакции')
+
+    def handle(self, *args, **options):
+        if min(options['books'], options['authors']) < 1 or options['comments'] < 0:
+            raise CommandError('Нужна хотя бы одна книга и один автор')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        # Индекс поиска пересобирается один раз в конце, а не триггером на каждую строку
+        search.drop_triggers()
+        try:
+            authors = self.create_authors(options['authors'])
+            book_ids = self.create_books(options['books'], authors)
+            comments = self.create_comments(options['comments'], book_ids)
+            self.count_comments(book_ids)
+        finally:
+            if search.table_exists():
+                search.rebuild()
+        authors_cache.clear()
+        response_cache.bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано за {time.monotonic() - started:.1f} с.: авторов - {len(authors)}, "
+            f"книг - {len(book_ids)}, комментариев - {comments}"))
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def batches(self, items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def skewed(self, count):
+        """
+        Индекс 0..count-1 с перекосом к началу: у части книг и авторов намного больше комментариев и книг
+        """
+        return int(count * self.rng.random() ** 3)
+
+    def author_names(self, start, count):
+        # Сочетание ФИО определяется номером автора, все сочетания различны (в т.ч. при повторном запуске);
+        # на больших объёмах к фамилии добавляется номер
+        combinations = len(SURNAMES) * len(NAMES) * len(PATRONYMICS)
+        order = list(range(start, start + count))
+        self.rng.shuffle(order)
+        for i in order:
+            surname = SURNAMES[i % len(SURNAMES)]
+            if i >= combinations:
+                surname = f'{surname}-{i // combinations + 1}'
+            rest = i % combinations // len(SURNAMES)
+            yield surname, NAMES[rest % len(NAMES)], PATRONYMICS[rest // len(NAMES) % len(PATRONYMICS)]
+
+    def create_authors(self, count):
+        """
+        Возвращает [(id, ФИО одной строкой)]
+        """
+        first_id = self.next_id(Authors)
+        authors = []
+        rows = (
+            Authors(pk=first_id + i, year=self.rng.randint(1800, 2000),
+                    **author_item({'surname': surname, 'name': name, 'patronymic': patronymic}))
+            for i, (surname, name, patronymic) in enumerate(self.author_names(first_id - 1, count))
+        )
+        for batch in self.batches(rows):
+            with transaction.atomic():
+                Authors.objects.bulk_create(batch)
+            authors.extend((author.pk, author.full_name) for author in batch)
+        return authors
+
+    def create_books(self, count, authors):
+        first_id = self.next_id(Books)
+        through = Books.authors.through
+        book_ids = []
+        for batch in self.batches(range(count)):
+            books, links = [], []
+            for i in batch:
+                chosen = sorted({authors[self.skewed(len(authors))] for _ in range(self.rng.choices((1, 2, 3),
+                                                                                                   (70, 25, 5))[0])})
+                title = (f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}'
+                         f'{self.rng.choice(GENITIVES)}')
+                books.append(Books(pk=first_id + i, title=title, year=self.rng.randint(1850, 2023),
+                                   authors_display=[full_name for _, full_name in chosen]))
+                links.extend((first_id + i, author_id) for author_id, _ in chosen)
+            with transaction.atomic():
+                Books.objects.bulk_create(books)
+                self.insert_many(f'INSERT INTO {through._meta.db_table} (books_id, authors_id) VALUES (%s, %s)',
+                                 links)
+            book_ids.extend(book.pk for book in books)
+        return book_ids
+
+    def create_comments(self, count, book_ids):
+        # Комментарии - executemany без моделей: на миллионах строк это в разы быстрее bulk_create,
+        # а time_creation задаётся явно (auto_now_add в bulk_create поставил бы всем текущее время)
+        sql = f'INSERT INTO {Comments._meta.db_table} (time_creation, content, book_id) VALUES (%s, %s, %s)'
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = (
+            (adapt(COMMENTS_START + timedelta(minutes=i, seconds=self.rng.randint(0, 59))),
+             ' '.join(self.rng.sample(SENTENCES, self.rng.randint(1, 3))),
+             book_ids[self.skewed(len(book_ids))])
+            for i in range(count)
+        )
+        for batch in self.batches(rows):
+            with transaction.atomic():
+                self.insert_many(sql, batch)
+        return count
+
+    @staticmethod
+    def insert_many(sql, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def count_comments(self, book_ids):
+        comments = (Comments.objects.filter(book=OuterRef('pk')).order_by().values('book')
+                    .annotate(total=Count('id')).values('total'))
+        for batch in self.batches(book_ids):
+            Books.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).update(
+                comments_count=Coalesce(Subquery(comments, output_field=IntegerField()), 0))
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+# Нагрузка как у API: читатель - страница книг и их комментарии, писатель - POST комментария
+# в транзакции, которая сначала читает книгу, потом пишет (как BookAPI.put и сигналы комментария).
+READ_SQL = (
+    'SELECT id, title, year, authors_display FROM core_books ORDER BY title, id LIMIT 20',
+    'SELECT id, time_creation, content, book_id FROM core_comments WHERE book_id IN ({}) ORDER BY time_creation',
+)
+
+
+class Command(BaseCommand):
+    help = ('Параллельные чтение и запись в копию БД для каждого профиля из DATABASE_PROFILES: '
+            'операции в секунду и доля ошибок "database is locked"')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--writers', type=int, default=4, help='Потоков записи')
+        parser.add_argument('--seconds', type=float, default=5, help='Длительность прогона каждого профиля')
+
+    def handle(self, *args, **options):
+        unknown = set(options['profiles']) - set(settings.DATABASE_PROFILES)
+        if unknown:
+            raise CommandError(f'Нет профилей: {", ".join(sorted(unknown))}')
+
+        self.stdout.write(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'read err':>10}{'write err':>10}")
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'stress.sqlite3')
+                self.copy_database(path)
+                stats = self.run(profile, path, options)
+            self.stdout.write(
+                f"{profile:<12}{stats['reads'] / options['seconds']:>10.0f}"
+                f"{stats['writes'] / options['seconds']:>10.0f}"
+                f"{self.rate(stats['read_errors'], stats['reads']):>10}"
+                f"{self.rate(stats['write_errors'], stats['writes']):>10}")
+
+    @staticmethod
+    def rate(errors, done):
+        total = errors + done
+        return f'{100 * errors / total:.1f}%' if total else '-'
+
+    @staticmethod
+    def copy_database(path):
+        """
+        Копия текущей БД через backup API (работает и для БД в памяти), хотя бы с одной книгой
+        """
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+            if target.execute('SELECT COUNT(*) FROM core_books').fetchone()[0] == 0:
+                target.execute("INSERT INTO core_books (title, year, updated_at, authors_display, comments_count) "
+                               "VALUES ('Книга', 2000, ?, '[]', 0)", (timezone.now().isoformat(),))
+                target.commit()
+        finally:
+            target.close()
+
+    def run(self, profile, path, options):
+        alias = f'stress_{profile}'
+        connections.databases[alias] = {**settings.DATABASE_PROFILES[profile], 'NAME': path}
+        stats = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def worker(operation, done, failed):
+            count = errors = 0
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        operation(connections[alias])
+                        count += 1
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        errors += 1
+            finally:
+                connections[alias].close()
+                with lock:
+                    stats[done] += count
+                    stats[failed] += errors
+
+        threads = ([threading.Thread(target=worker, args=(self.read, 'reads', 'read_errors'))
+                    for _ in range(options['readers'])]
+                   + [threading.Thread(target=worker, args=(self.write, 'writes', 'write_errors'))
+                      for _ in range(options['writers'])])
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            del connections.databases[alias]
+        return stats
+
+    @staticmethod
+    def read(db):
+        with db.cursor() as cursor:
+            cursor.execute(READ_SQL[0])
+            book_ids = [row[0] for row in cursor.fetchall()]
+            if book_ids:
+                cursor.execute(READ_SQL[1].format(','.join('%s' for _ in book_ids)), book_ids)
+                cursor.fetchall()
+
+    @staticmethod
+    def write(db):
+        now = db.ops.adapt_datetimefield_value(timezone.now())
+        with transaction.atomic(using=db.alias), db.cursor() as cursor:
+            cursor.execute('SELECT id FROM core_books ORDER BY random() LIMIT 1')
+            book_id = cursor.fetchone()[0]
+            cursor.execute('INSERT INTO core_comments (time_creation, content, book_id) VALUES (%s, %s, %s)',
+                           [now, 'Нагрузочный комментарий', book_id])
+            cursor.execute('UPDATE core_books SET updated_at = %s, comments_count = comments_count + 1 '
+                           'WHERE id = %s', [now, book_id])
@@ -0,0 +1,299 @@
+import asyncio
+import hmac
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import BasePermission
+
+# Метрики запросов: время представления, запросы к БД (число и время), сериализация, рендеринг, размер ответа.
+# PerformanceMiddleware считает время и размер каждого запроса, а подробную разбивку - для доли запросов
+# METRICS_SAMPLE_RATE: для них же ставится заголовок Server-Timing (видно в DevTools браузера).
+# Гистограммы копятся в памяти процесса и отдаются в текстовом формате Prometheus: GET /metrics
+# (при нескольких рабочих процессах у каждого свои значения). /metrics доступен только адресам METRICS_ALLOWED_IPS
+# (REMOTE_ADDR, X-Forwarded-For не учитывается), по заголовку Authorization: Bearer METRICS_TOKEN
+# и сотрудникам (is_staff), остальным - 403. На тех же условиях доступна статистика /lib/api/stats/ (MetricsAllowed).
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """
+    Гистограмма Prometheus с метками: по каждому набору меток - счётчики корзин, сумма и число наблюдений
+    """
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total:.6g}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """
+    Счётчик Prometheus с метками (names - имена меток), регистрируется в COUNTERS для GET /metrics
+    """
+    def __init__(self, name, help_text, names):
+        self.name = name
+        self.help_text = help_text
+        self.names = names
+        self._series = {}
+        self._lock = threading.Lock()
+        COUNTERS.append(self)
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + value
+
+    def values(self):
+        with self._lock:
+            return dict(self._series)
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values().items()):
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('library_request_duration_seconds', 'Время обработки запроса', DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('library_response_size_bytes', 'Размер тела ответа', SIZE_BUCKETS)
+SQL_QUERIES = Histogram('library_request_sql_queries', 'Запросов к БД на запрос (выборка)', QUERIES_BUCKETS)
+SQL_DURATION = Histogram('library_request_sql_seconds', 'Время запросов к БД (выборка)', DURATION_BUCKETS)
+SERIALIZE_DURATION = Histogram('library_request_serialize_seconds', 'Время сериализации (выборка)',
+                               DURATION_BUCKETS)
+RENDER_DURATION = Histogram('library_request_render_seconds', 'Время рендеринга JSON (выборка)', DURATION_BUCKETS)
+
+HISTOGRAMS = (REQUEST_DURATION, RESPONSE_SIZE, SQL_QUERIES, SQL_DURATION, SERIALIZE_DURATION, RENDER_DURATION)
+
+# Счётчики других модулей (core.throttling)
+COUNTERS = []
+
+
+class RequestTimings:
+    """
+    Разбивка времени одного (выбранного в выборку) запроса. execute - обёртка курсора (connection.execute_wrapper)
+    """
+    __slots__ = ('sql_count', 'sql_time', 'serialize_time', 'render_time')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Обёртка курсора каждого соединения (core.signals): запрос учитывается в разбивке текущего запроса из выборки.
+    Разбивка ищется в контексте, а не на соединении: под ASGI ORM работает в потоке sync_to_async
+    со своими соединениями, контекст же переходит в поток вместе с вызовом.
+    """
+    current = timings.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    return current.execute(execute, sql, params, many, context)
+
+
+def add_serialize_time(seconds):
+    current = timings.get()
+    if current is not None:
+        current.serialize_time += seconds
+
+
+def add_render_time(seconds):
+    current = timings.get()
+    if current is not None:
+        current.render_time += seconds
+
+
+class SerializerTimingMixin:
+    """
+    Время сериализации API-представления: от создания сериализатора до возврата ответа из обработчика
+    (get_serializer ... finalize_response), включая запросы к БД, которые сериализатор делает сам
+    """
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        self._serialize_started = time.perf_counter()
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        started = getattr(self, '_serialize_started', None)
+        if started is not None:
+            add_serialize_time(time.perf_counter() - started)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route
+
+
+class Measurement:
+    """
+    Результат measure: разбивка (RequestTimings, только для выборки) и полное время запроса
+    """
+    __slots__ = ('timings', 'elapsed')
+
+    def __init__(self, current):
+        self.timings = current
+        self.elapsed = None
+
+
+@contextmanager
+def measure():
+    """
+    Замер обработки запроса; для выборки METRICS_SAMPLE_RATE - с разбивкой (RequestTimings)
+    """
+    sampled = random.random() < getattr(settings, 'METRICS_SAMPLE_RATE', 0.05)
+    measurement = Measurement(RequestTimings() if sampled else None)
+    token = timings.set(measurement.timings)
+    started = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.elapsed = time.perf_counter() - started
+        timings.reset(token)
+
+
+def record(request, response, measurement):
+    current, elapsed = measurement.timings, measurement.elapsed
+    labels = (('method', request.method), ('route', route_label(request)))
+    REQUEST_DURATION.observe(labels, elapsed)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(labels, len(response.content))
+    if current is not None:
+        SQL_QUERIES.observe(labels, current.sql_count)
+        SQL_DURATION.observe(labels, current.sql_time)
+        if current.serialize_time:
+            SERIALIZE_DURATION.observe(labels, current.serialize_time)
+        if current.render_time:
+            RENDER_DURATION.observe(labels, current.render_time)
+        response['Server-Timing'] = server_timing(current, elapsed)
+    return response
+
+
+class PerformanceMiddleware(MiddlewareMixin):
+    """
+    Первым в MIDDLEWARE: время запроса и размер ответа в гистограммы по маршруту (имя URL или шаблон пути),
+    для выборки - запросы к БД, сериализация, рендеринг и заголовок Server-Timing
+    """
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+        with measure() as measurement:
+            response = self.get_response(request)
+        return record(request, response, measurement)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+        with measure() as measurement:
+            response = await self.get_response(request)
+        return record(request, response, measurement)
+
+
+def server_timing(current, elapsed):
+    metrics = [f'db;dur={current.sql_time * 1000:.2f};desc="{current.sql_count} queries"']
+    if current.serialize_time:
+        metrics.append(f'serialize;dur={current.serialize_time * 1000:.2f}')
+    if current.render_time:
+        metrics.append(f'render;dur={current.render_time * 1000:.2f}')
+    metrics.append(f'total;dur={elapsed * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+def exposition():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    for counter in COUNTERS:
+        lines.extend(counter.exposition())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+class MetricsAllowed(BasePermission):
+    """
+    Доступ к служебной статистике API на тех же условиях, что и к /metrics (metrics_allowed)
+    """
+    def has_permission(self, request, view):
+        return metrics_allowed(request)
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в текстовом формате Prometheus (GET /metrics)
+    """
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
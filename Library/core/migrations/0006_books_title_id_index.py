@@ -0,0 +1,21 @@
+# Generated by Django 3.2.13 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_books_year'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='books',
+            options={'ordering': ['title'], 'verbose_name': 'Книга', 'verbose_name_plural': 'Книги'},
+        ),
+        migrations.AddIndex(
+            model_name='books',
+            index=models.Index(fields=['title', 'id'], name='core_books_title_id_idx'),
+        ),
+    ]
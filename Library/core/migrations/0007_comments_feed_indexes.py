@@ -0,0 +1,21 @@
+# Generated by Django 3.2.13 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_books_title_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['book', 'time_creation', 'id'], name='core_comments_book_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['time_creation', 'id'], name='core_comments_time_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.13 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+def normalize_author_key(surname, name, patronymic):
+    # Копия core.models.normalize_author_key на момент миграции
+    parts = (surname or '', name or '', patronymic or '')
+    return '|'.join(' '.join(part.split()).casefold().replace('ё', 'е') for part in parts)
+
+
+def fill_natural_key(apps, schema_editor):
+    Authors = apps.get_model('core', 'Authors')
+    authors = list(Authors.objects.only('id', 'surname', 'name', 'patronymic'))
+    for author in authors:
+        author.natural_key = normalize_author_key(author.surname, author.name, author.patronymic)
+    Authors.objects.bulk_update(authors, ['natural_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_comments_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authors',
+            name='natural_key',
+            field=models.CharField(default='', editable=False, max_length=160, verbose_name='Ключ ФИО'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_natural_key, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='authors',
+            name='natural_key',
+            field=models.CharField(db_index=True, editable=False, max_length=160, verbose_name='Ключ ФИО'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-18 12:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_authors_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authors',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата-время изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='books',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата-время изменения'),
+            preserve_default=False,
+        ),
+    ]
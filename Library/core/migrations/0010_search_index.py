@@ -0,0 +1,95 @@
+# Generated by Django 3.2.13 on 2026-10-18 13:20
+
+from django.db import migrations
+
+# Полнотекстовый индекс FTS5 (см. core/search.py). Только для SQLite.
+NORMALIZE = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+BOOK_AUTHORS = '''(
+    SELECT coalesce(group_concat({name}, ' '), '')
+    FROM core_authors AS a JOIN core_books_authors AS ba ON ba.authors_id = a.id
+    WHERE ba.books_id = {{book_id}}
+)'''.format(name=NORMALIZE.format("a.surname || ' ' || a.name || coalesce(' ' || a.patronymic, '')"))
+
+FORWARD_SQL = (
+    '''CREATE VIRTUAL TABLE core_search USING fts5(
+        title, authors, content,
+        kind UNINDEXED, object_id UNINDEXED, book_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )''',
+
+    f'''CREATE TRIGGER core_search_book_insert AFTER INSERT ON core_books BEGIN
+        INSERT INTO core_search (rowid, title, authors, content, kind, object_id, book_id)
+        VALUES (new.id * 2, {NORMALIZE.format('new.title')}, '', '', 'book', new.id, new.id);
+    END''',
+    f'''CREATE TRIGGER core_search_book_update AFTER UPDATE OF title ON core_books BEGIN
+        UPDATE core_search SET title = {NORMALIZE.format('new.title')} WHERE rowid = new.id * 2;
+    END''',
+    '''CREATE TRIGGER core_search_book_delete AFTER DELETE ON core_books BEGIN
+        DELETE FROM core_search WHERE rowid = old.id * 2;
+    END''',
+
+    f'''CREATE TRIGGER core_search_link_insert AFTER INSERT ON core_books_authors BEGIN
+        UPDATE core_search SET authors = {BOOK_AUTHORS.format(book_id='new.books_id')}
+        WHERE rowid = new.books_id * 2;
+    END''',
+    f'''CREATE TRIGGER core_search_link_delete AFTER DELETE ON core_books_authors BEGIN
+        UPDATE core_search SET authors = {BOOK_AUTHORS.format(book_id='old.books_id')}
+        WHERE rowid = old.books_id * 2;
+    END''',
+    f'''CREATE TRIGGER core_search_author_update AFTER UPDATE OF surname, name, patronymic ON core_authors BEGIN
+        UPDATE core_search SET authors = {BOOK_AUTHORS.format(book_id='core_search.book_id')}
+        WHERE rowid IN (SELECT books_id * 2 FROM core_books_authors WHERE authors_id = new.id);
+    END''',
+
+    f'''CREATE TRIGGER core_search_comment_insert AFTER INSERT ON core_comments BEGIN
+        INSERT INTO core_search (rowid, title, authors, content, kind, object_id, book_id)
+        VALUES (new.id * 2 + 1, '', '', {NORMALIZE.format('new.content')}, 'comment', new.id, new.book_id);
+    END''',
+    f'''CREATE TRIGGER core_search_comment_update AFTER UPDATE OF content ON core_comments BEGIN
+        UPDATE core_search SET content = {NORMALIZE.format('new.content')} WHERE rowid = new.id * 2 + 1;
+    END''',
+    '''CREATE TRIGGER core_search_comment_delete AFTER DELETE ON core_comments BEGIN
+        DELETE FROM core_search WHERE rowid = old.id * 2 + 1;
+    END''',
+
+    f'''INSERT INTO core_search (rowid, title, authors, content, kind, object_id, book_id)
+        SELECT b.id * 2, {NORMALIZE.format('b.title')}, {BOOK_AUTHORS.format(book_id='b.id')}, '', 'book', b.id, b.id
+        FROM core_books AS b''',
+    f'''INSERT INTO core_search (rowid, title, authors, content, kind, object_id, book_id)
+        SELECT c.id * 2 + 1, '', '', {NORMALIZE.format('c.content')}, 'comment', c.id, c.book_id
+        FROM core_comments AS c''',
+)
+
+BACKWARD_SQL = (
+    'DROP TRIGGER IF EXISTS core_search_book_insert',
+    'DROP TRIGGER IF EXISTS core_search_book_update',
+    'DROP TRIGGER IF EXISTS core_search_book_delete',
+    'DROP TRIGGER IF EXISTS core_search_link_insert',
+    'DROP TRIGGER IF EXISTS core_search_link_delete',
+    'DROP TRIGGER IF EXISTS core_search_author_update',
+    'DROP TRIGGER IF EXISTS core_search_comment_insert',
+    'DROP TRIGGER IF EXISTS core_search_comment_update',
+    'DROP TRIGGER IF EXISTS core_search_comment_delete',
+    'DROP TABLE IF EXISTS core_search',
+)
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(FORWARD_SQL), run_sqlite(BACKWARD_SQL)),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.13 on 2026-10-18 13:50
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Триггеры поискового индекса из 0010 ссылаются на core_books и core_authors, а AddField в SQLite пересоздаёт
+# таблицу - на время миграции они снимаются и ставятся заново (SQL - как в 0010)
+search_index = import_module('core.migrations.0010_search_index')
+CREATE_TRIGGERS_SQL = tuple(sql for sql in search_index.FORWARD_SQL if sql.startswith('CREATE TRIGGER'))
+DROP_TRIGGERS_SQL = tuple(sql for sql in search_index.BACKWARD_SQL if sql.startswith('DROP TRIGGER'))
+
+
+def fill_denormalized(apps, schema_editor):
+    Books = apps.get_model('core', 'Books')
+    Authors = apps.get_model('core', 'Authors')
+
+    authors = list(Authors.objects.only('id', 'surname', 'name', 'patronymic'))
+    for author in authors:
+        author.full_name = f'{author.surname} {author.name} {author.patronymic}'
+    Authors.objects.bulk_update(authors, ['full_name'], batch_size=1000)
+
+    names = {}
+    for book_id, full_name in (Books.authors.through.objects.order_by('books_id', 'authors_id')
+                               .values_list('books_id', 'authors__full_name')):
+        names.setdefault(book_id, []).append(full_name)
+    books = list(Books.objects.annotate(total=Count('comments')).only('id'))
+    for book in books:
+        book.authors_display = names.get(book.pk, [])
+        book.comments_count = book.total
+    Books.objects.bulk_update(books, ['authors_display', 'comments_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(search_index.run_sqlite(DROP_TRIGGERS_SQL), search_index.run_sqlite(CREATE_TRIGGERS_SQL)),
+        migrations.AddField(
+            model_name='authors',
+            name='full_name',
+            field=models.CharField(default='', editable=False, max_length=160, verbose_name='ФИО'),
+        ),
+        migrations.AddField(
+            model_name='books',
+            name='authors_display',
+            field=models.JSONField(default=list, editable=False, verbose_name='ФИО авторов'),
+        ),
+        migrations.AddField(
+            model_name='books',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_denormalized, migrations.RunPython.noop),
+        migrations.RunPython(search_index.run_sqlite(CREATE_TRIGGERS_SQL), search_index.run_sqlite(DROP_TRIGGERS_SQL)),
+    ]
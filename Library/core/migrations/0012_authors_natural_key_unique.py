@@ -0,0 +1,67 @@
+# Generated by Django 3.2.13 on 2026-10-18 12:41
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+# Уникальный ключ ФИО: сначала дубликаты объединяются (связи с книгами переносятся на автора с меньшим id,
+# пустой год рождения берётся у дубликата), затем AlterField. Объединение идёт при включённых триггерах поиска,
+# чтобы индекс обновил авторов книг; на время пересоздания core_authors триггеры снимаются (см. 0011).
+search_index = import_module('core.migrations.0010_search_index')
+CREATE_TRIGGERS_SQL = tuple(sql for sql in search_index.FORWARD_SQL if sql.startswith('CREATE TRIGGER'))
+DROP_TRIGGERS_SQL = tuple(sql for sql in search_index.BACKWARD_SQL if sql.startswith('DROP TRIGGER'))
+
+
+def merge_duplicate_authors(apps, schema_editor):
+    Books = apps.get_model('core', 'Books')
+    Authors = apps.get_model('core', 'Authors')
+    through = Books.authors.through
+
+    groups = (Authors.objects.values('natural_key')
+              .annotate(total=Count('id'), keeper_id=Min('id'))
+              .filter(total__gt=1))
+    changed_book_ids = set()
+    for group in list(groups):
+        duplicates = list(Authors.objects.filter(natural_key=group['natural_key'])
+                          .exclude(pk=group['keeper_id']).order_by('pk'))
+        duplicate_ids = [author.pk for author in duplicates]
+        book_ids = set(through.objects.filter(authors_id__in=duplicate_ids).values_list('books_id', flat=True))
+        through.objects.bulk_create((through(books_id=book_id, authors_id=group['keeper_id']) for book_id in book_ids),
+                                    ignore_conflicts=True)
+        keeper = Authors.objects.get(pk=group['keeper_id'])
+        if keeper.year is None:
+            keeper.year = next((author.year for author in duplicates if author.year is not None), None)
+            keeper.save(update_fields=['year'])
+        through.objects.filter(authors_id__in=duplicate_ids).delete()
+        Authors.objects.filter(pk__in=duplicate_ids).delete()
+        changed_book_ids |= book_ids
+
+    if not changed_book_ids:
+        return
+    names = {pk: [] for pk in changed_book_ids}
+    for book_id, full_name in (through.objects.filter(books_id__in=changed_book_ids).order_by('books_id', 'authors_id')
+                               .values_list('books_id', 'authors__full_name')):
+        names[book_id].append(full_name)
+    now = timezone.now()
+    Books.objects.bulk_update([Books(pk=pk, authors_display=value, updated_at=now) for pk, value in names.items()],
+                              ['authors_display', 'updated_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_denormalized_read_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_authors, migrations.RunPython.noop),
+        migrations.RunPython(search_index.run_sqlite(DROP_TRIGGERS_SQL), search_index.run_sqlite(CREATE_TRIGGERS_SQL)),
+        migrations.AlterField(
+            model_name='authors',
+            name='natural_key',
+            field=models.CharField(editable=False, max_length=160, unique=True, verbose_name='Ключ ФИО'),
+        ),
+        migrations.RunPython(search_index.run_sqlite(CREATE_TRIGGERS_SQL), search_index.run_sqlite(DROP_TRIGGERS_SQL)),
+    ]
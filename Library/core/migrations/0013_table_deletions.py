@@ -0,0 +1,34 @@
+# Generated by Django 3.2.13 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+# Строки счётчиков для таблиц списков сразу: валидаторы списка - один запрос (core.conditional.table_state)
+TABLES = ('core_books', 'core_authors')
+
+
+def create_counters(apps, schema_editor):
+    TableDeletions = apps.get_model('core', 'TableDeletions')
+    TableDeletions.objects.bulk_create([TableDeletions(table=table) for table in TABLES], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_authors_natural_key_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableDeletions',
+            fields=[
+                ('table', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('deletions', models.PositiveBigIntegerField(default=0, verbose_name='Число удалений')),
+                ('deleted_at', models.DateTimeField(null=True, verbose_name='Дата-время последнего удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаления из таблицы',
+                'verbose_name_plural': 'Удаления из таблиц',
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
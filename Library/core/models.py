@@ -1,4 +1,25 @@
 from django.db import models
+from django.dispatch import Signal
+
+# Удаление комментариев вне каскада от книги: book_counts - id книги -> число удалённых комментариев.
+# Вместо post_delete у Comments: с его обработчиками Django удалял бы комментарии книги по одному, без fast-delete.
+comments_deleted = Signal()
+
+
+def normalize_author_key(surname, name, patronymic):
+    """
+    Нормализованный натуральный ключ автора: регистр и лишние пробелы не учитываются, "ё" равна "е",
+    отсутствующее отчество (None) и пустое отчество совпадают.
+    """
+    parts = (surname or '', name or '', patronymic or '')
+    return '|'.join(' '.join(part.split()).casefold().replace('ё', 'е') for part in parts)
+
+
+def author_full_name(surname, name, patronymic):
+    """
+    ФИО в одну строку в том виде, в котором его всегда выдавало API (в т.ч. "None" при пустом отчестве)
+    """
+    return f'{surname} {name} {patronymic}'
 
 
 class Books(models.Model):
@@ -8,12 +29,21 @@ class Books(models.Model):
     title = models.TextField(verbose_name='Наименование', null=False)
     year = models.PositiveSmallIntegerField(verbose_name='Год издания', null=True)
     authors = models.ManyToManyField('Authors', verbose_name='Автор книг', related_name='books')
+    updated_at = models.DateTimeField(verbose_name='Дата-время изменения', auto_now=True, db_index=True)
+
+    # Денормализованные поля для чтения, поддерживаются сигналами (core.signals), проверка - check_denormalized
+    authors_display = models.JSONField(verbose_name='ФИО авторов', default=list, editable=False)
+    comments_count = models.PositiveIntegerField(verbose_name='Число комментариев', default=0, editable=False)
 
     def __str__(self):
         return f'{self.id}: "{self.title}"'
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            # Ключ пагинации списка книг (BooksCursorPagination)
+            models.Index(fields=['title', 'id'], name='core_books_title_id_idx'),
+        ]
         verbose_name = 'Книга'
         verbose_name_plural = 'Книги'
 
@@ -26,15 +56,35 @@ class Authors(models.Model):
     name = models.CharField(max_length=50, verbose_name='Имя', null=False)
     patronymic = models.CharField(max_length=50, verbose_name='Отчество', null=True)
     year = models.PositiveSmallIntegerField(verbose_name='Год рождения', null=True)
+    natural_key = models.CharField(max_length=160, verbose_name='Ключ ФИО', unique=True, editable=False)
+    full_name = models.CharField(max_length=160, verbose_name='ФИО', default='', editable=False)
+    updated_at = models.DateTimeField(verbose_name='Дата-время изменения', auto_now=True, db_index=True)
 
     def __str__(self):
         return f'{self.id}: {self.surname} {self.name} {self.patronymic}'
 
+    def save(self, *args, **kwargs):
+        self.natural_key = normalize_author_key(self.surname, self.name, self.patronymic)
+        self.full_name = author_full_name(self.surname, self.name, self.patronymic)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'natural_key', 'full_name'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Автор'
         verbose_name_plural = 'Авторы'
 
 
+class CommentsQuerySet(models.QuerySet):
+    def delete(self):
+        book_counts = dict(self.order_by().values_list('book').annotate(count=models.Count('pk')))
+        deleted = super().delete()
+        if book_counts:
+            comments_deleted.send(sender=self.model, book_counts=book_counts)
+        return deleted
+
+
 class Comments(models.Model):
     """
     Комментарии
@@ -44,9 +94,35 @@ class Comments(models.Model):
     book = models.ForeignKey(Books, verbose_name='Комментируемая книга', null=False, on_delete=models.CASCADE,
                              related_name='comments')
 
+    objects = CommentsQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.id}: к книге {self.book.title}'
 
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        comments_deleted.send(sender=type(self), book_counts={self.book_id: 1})
+        return deleted
+
     class Meta:
+        indexes = [
+            # Ключи ленты комментариев (CommentsCursorPagination): по книге и общая
+            models.Index(fields=['book', 'time_creation', 'id'], name='core_comments_book_time_idx'),
+            models.Index(fields=['time_creation', 'id'], name='core_comments_time_idx'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+
+
+class TableDeletions(models.Model):
+    """
+    Удаления из таблицы - для валидаторов условного GET списков (core.conditional.table_state):
+    удаление не меняет MAX(updated_at) оставшихся строк
+    """
+    table = models.CharField(max_length=64, primary_key=True, verbose_name='Таблица')
+    deletions = models.PositiveBigIntegerField(default=0, verbose_name='Число удалений')
+    deleted_at = models.DateTimeField(null=True, verbose_name='Дата-время последнего удаления')
+
+    class Meta:
+        verbose_name = 'Удаления из таблицы'
+        verbose_name_plural = 'Удаления из таблиц'
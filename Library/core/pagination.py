@@ -0,0 +1,245 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, Max, Min
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (keyset/cursor): вместо OFFSET страница выбирается условием
+    "строго после/до граничной записи" по уникальному набору полей сортировки,
+    поэтому глубокие страницы стоят столько же, сколько первая, и не нужен COUNT(*).
+
+    Курсор - base64 от JSON {"p": значения полей граничной записи, "r": направление назад, "n": номер страницы}.
+    Для "последней страницы" передаётся курсор без позиции в обратном направлении.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse, self.pagenum = self.decode_cursor(request, queryset.model)
+
+        ordering = self.get_ordering(reverse)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position, reverse))
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+            if not has_more:
+                # Дошли до начала: номер из курсора (в т.ч. из оценки числа страниц) уточняется
+                self.pagenum = 1
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return self.ordering
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def get_keyset_filter(self, position, reverse):
+        """
+        (f1, f2, ...) > (v1, v2, ...) в виде OR-цепочки: f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...
+        Направление сравнения каждого поля берётся из ordering.
+        """
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {self.field_name(prev): value for prev, value in zip(self.ordering[:i], position)}
+            conditions.append(Q(**equal, **{f'{self.field_name(field)}__{lookup}': position[i]}))
+        return reduce(or_, conditions)
+
+    @staticmethod
+    def field_name(field):
+        return field.lstrip('-')
+
+    def get_position(self, obj):
+        values = []
+        for field in self.ordering:
+            # obj - модель или словарь из values() (core.readers)
+            name = self.field_name(field)
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def decode_cursor(self, request, model):
+        """
+        (позиция, назад, номер страницы) из параметра cursor. Значения позиции приводятся полями сортировки
+        модели (to_python); любой неверный курсор - 404
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False, 1
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(data, dict):
+                raise ValueError
+            position, pagenum = data.get('p'), data.get('n')
+            if position is not None:
+                if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+                    raise ValueError
+                position = [model._meta.get_field(self.field_name(field)).to_python(value)
+                            for field, value in zip(self.ordering, position)]
+            if pagenum is not None and (not isinstance(pagenum, int) or isinstance(pagenum, bool)):
+                raise ValueError
+            return position, bool(data.get('r')), pagenum
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse, pagenum):
+        data = {'p': position, 'r': int(reverse), 'n': pagenum}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def shift_pagenum(self, delta):
+        return self.pagenum + delta if self.pagenum is not None else None
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False, self.shift_pagenum(1))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True, self.shift_pagenum(-1))
+
+    def get_last_link(self, total_pages=None):
+        return self.encode_cursor(None, True, total_pages)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+class BooksCursorPagination(KeysetPagination):
+    """
+    Пагинация списка книг по ключу (title, id), опирается на индекс core_books_title_id_idx.
+    total_pages считается по настройке BOOKS_TOTAL_PAGES:
+        'estimated' - оценка по статистике БД без просмотра таблицы (по умолчанию),
+        'exact' - COUNT(*) на каждой странице,
+        None - не выдаётся.
+    """
+    ordering = ('title', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = getattr(settings, 'BOOKS_PAGE_SIZE', 3)
+        self.max_page_size = getattr(settings, 'BOOKS_MAX_PAGE_SIZE', 100)
+        self.total_pages_mode = getattr(settings, 'BOOKS_TOTAL_PAGES', 'estimated')
+        rows = super().paginate_queryset(queryset, request, view)
+        self.total_pages = self.get_total_pages(queryset) if self.total_pages_mode else None
+        return rows
+
+    def get_total_pages(self, queryset):
+        if self.total_pages_mode == 'estimated':
+            count = estimate_count(queryset)
+        else:
+            count = queryset.count()
+        return max(-(-count // self.page_size), 1)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'last': self.get_last_link(self.total_pages),
+            'pagenum': self.pagenum,
+            'results': data
+        }
+        if self.total_pages is not None:
+            response['total_pages'] = self.total_pages
+        return Response(response)
+
+
+class CommentsCursorPagination(KeysetPagination):
+    """
+    Лента комментариев от новых к старым по ключу (time_creation, id).
+    Для ленты книги используется индекс core_comments_book_time_idx, для общей ленты - core_comments_time_idx.
+    """
+    ordering = ('-time_creation', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = getattr(settings, 'COMMENTS_PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'COMMENTS_MAX_PAGE_SIZE', 100)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class BooksListPagination(PageNumberPagination):
+    """
+    Пагинация списка книг по номеру страницы (COUNT + OFFSET)
+    """
+    page_size = 3
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'pagenum': int(self.request.query_params.get('page', 1)),
+            'total_pages': self.page.paginator.num_pages,
+            'results': data
+        })
+
+
+def estimate_count(queryset):
+    """
+    Приблизительное число строк в таблице модели queryset без полного просмотра (в БД, куда он направлен роутером):
+    статистика планировщика (reltuples / sqlite_stat1), иначе разница крайних первичных ключей.
+    На SQLite без ANALYZE - один запрос: наличие sqlite_stat1 и крайние ключи вместе.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'), "
+                           f'MIN({pk}), MAX({pk}) FROM {connection.ops.quote_name(table)}')
+            has_stat, low, high = cursor.fetchone()
+            if has_stat:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            return high - low + 1 if low is not None else 0
+    bounds = model._default_manager.using(queryset.db).aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    return bounds['high'] - bounds['low'] + 1
@@ -0,0 +1,226 @@
+import asyncio
+import cProfile
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import route_label
+
+# Профилирование отдельных запросов и журнал медленных SQL.
+# Запрос профилируется под cProfile, если у него заголовок X-Profile с подписанным токеном
+# (manage.py perf_report --token) или он попал в долю PROFILE_SAMPLE_RATE. В PROFILE_DIR сохраняются
+# <имя>.prof (pstats) и <имя>.collapsed (свёрнутые стеки для flamegraph.pl / speedscope), имя - в заголовке
+# ответа X-Profile-Id. SQL дольше SLOW_QUERY_MS пишется в PROFILE_DIR/slow_queries.jsonl и в лог core.profiling
+# вместе с EXPLAIN QUERY PLAN. Сводка - manage.py perf_report.
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'core.profiling'
+SLOW_QUERIES_FILE = 'slow_queries.jsonl'
+
+# Порог, ниже которого ветви не попадают в свёрнутые стеки, микросекунды
+COLLAPSED_MIN_US = 10
+
+_sequence = itertools.count()
+
+slow_queries = ContextVar('slow_queries', default=None)
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def make_token():
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def token_is_valid(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT,
+                             max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def should_profile(request):
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        return token_is_valid(token)
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return bool(rate) and random.random() < rate
+
+
+def function_name(function):
+    filename, line, name = function
+    if filename == '~':
+        return name
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+def collapsed_stacks(stats):
+    """
+    Свёрнутые стеки "корень;...;функция время_мкс" из pstats. cProfile хранит только пары вызывающий-вызываемый,
+    поэтому время функции делится между путями пропорционально времени по каждому ребру графа вызовов
+    (приближённо, рекурсия обрезается).
+    """
+    callees = {}
+    roots = []
+    for function, (_, calls, _, _, callers) in stats.stats.items():
+        # Корни - функции, вызванные (в т.ч.) вне профилируемого кода, например get_response
+        if calls > sum(caller_calls for _, caller_calls, _, _ in callers.values()):
+            roots.append(function)
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative))
+
+    lines = []
+
+    def walk(function, path, share):
+        own, total = stats.stats[function][2], stats.stats[function][3]
+        if total <= 0:
+            return
+        path = path + (function_name(function),)
+        own_us = int(own * share * 1e6)
+        if own_us >= COLLAPSED_MIN_US:
+            lines.append(f"{';'.join(path)} {own_us}")
+        for callee, cumulative in callees.get(function, ()):
+            callee_share = cumulative * share / stats.stats[callee][3] if stats.stats[callee][3] else 0
+            if function_name(callee) not in path and cumulative * share * 1e6 >= COLLAPSED_MIN_US:
+                walk(callee, path, callee_share)
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return '\n'.join(lines) + '\n'
+
+
+def save_profile(profile, request):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    route = re.sub(r'[^\w]+', '_', route_label(request)).strip('_') or 'root'
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{next(_sequence)}-{request.method}-{route}"
+    profile.create_stats()
+    stats = pstats.Stats(profile)
+    stats.dump_stats(os.path.join(directory, f'{name}.prof'))
+    with open(os.path.join(directory, f'{name}.collapsed'), 'w', encoding='utf-8') as file:
+        file.write(collapsed_stacks(stats))
+    return name
+
+
+def explain(connection, sql, params):
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class SlowQueryLogger:
+    """
+    Обёртка курсора (connection.execute_wrapper): запросы дольше threshold секунд - в журнал с планом
+    """
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold and not many and not sql.startswith('EXPLAIN'):
+                self.log(context['connection'], sql, params, elapsed)
+
+    def log(self, connection, sql, params, elapsed):
+        try:
+            plan = explain(connection, sql, params)
+        except Exception as exc:
+            plan = [f'EXPLAIN не выполнен: {exc}']
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'route': route_label(self.request),
+            'ms': round(elapsed * 1000, 2),
+            'sql': sql,
+            'plan': plan,
+        }
+        logger.warning('Медленный SQL (%.1f мс, %s): %s\n%s', entry['ms'], entry['route'], sql, '\n'.join(plan))
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, SLOW_QUERIES_FILE), 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def log_slow_query(execute, sql, params, many, context):
+    """
+    Обёртка курсора каждого соединения (core.signals): журнал медленных SQL текущего запроса
+    (логгер - в контексте, как разбивка в core.metrics.count_query)
+    """
+    slow_query_logger = slow_queries.get()
+    if slow_query_logger is None:
+        return execute(sql, params, many, context)
+    return slow_query_logger(execute, sql, params, many, context)
+
+
+_async_profile = threading.Lock()
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Профилирование запроса под cProfile (по токену или выборке) и журнал медленных SQL (SLOW_QUERY_MS)
+    """
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with slow_query_log(request):
+            if not should_profile(request):
+                return self.get_response(request)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            response['X-Profile-Id'] = save_profile(profile, request)
+            return response
+
+    async def __acall__(self, request):
+        with slow_query_log(request):
+            if not should_profile(request) or not _async_profile.acquire(blocking=False):
+                return await self.get_response(request)
+            try:
+                # Под ASGI синхронные представления и ORM выполняются в общем потоке sync_to_async - профилируется
+                # он. Туда же попадает синхронный код параллельных запросов, поэтому профиль под ASGI - один за раз
+                profile = cProfile.Profile()
+                await sync_to_async(profile.enable)()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    await sync_to_async(profile.disable)()
+            finally:
+                _async_profile.release()
+            response['X-Profile-Id'] = await sync_to_async(save_profile, thread_sensitive=False)(profile, request)
+            return response
+
+
+@contextmanager
+def slow_query_log(request):
+    threshold = getattr(settings, 'SLOW_QUERY_MS', None)
+    token = slow_queries.set(SlowQueryLogger(request, threshold / 1000) if threshold is not None else None)
+    try:
+        yield
+    finally:
+        slow_queries.reset(token)
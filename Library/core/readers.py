@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .fieldsets import BOOK_COLUMNS, BookFieldset, top_comments
+from .models import Books
+
+# Быстрый путь чтения для списков и карточек: вместо полей ModelSerializer строки берутся через values(),
+# связанные данные - одним запросом на страницу с группировкой за один проход.
+# Вывод совпадает с соответствующими сериализаторами core.serializers (проверяется в тестах
+# и командой benchmark_serializers). Включается атрибутом представления fast_serializer_class
+# (core.views.FastReadMixin) и настройкой FAST_READ_ENABLED.
+
+DATETIME = serializers.DateTimeField(read_only=True)
+
+
+class ValuesSerializer:
+    """
+    Минимальный интерфейс сериализатора DRF для чтения: ValuesSerializer(instance, many=...).data.
+    instance - словарь из values() или список таких словарей.
+    """
+    values = ()
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        return queryset.values(*cls.values)
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        items = self.to_representation(rows)
+        return items if self.many else items[0]
+
+    def to_representation(self, rows):
+        raise NotImplementedError
+
+
+class BooksValuesSerializer(ValuesSerializer):
+    """
+    Как BooksSerializer: книга с полями по параметрам fields и expand запроса (core.fieldsets)
+    """
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        return queryset.values(*BookFieldset.from_request(request).columns)
+
+    def to_representation(self, rows):
+        fieldset = BookFieldset.from_request(self.context.get('request'))
+        book_ids = [row['id'] for row in rows]
+        # Развёрнутые связи: id книги -> список
+        related = {}
+        if fieldset.expands('authors'):
+            related['authors'] = self.authors_of(book_ids)
+        if fieldset.expands('comments'):
+            related['comments'] = self.latest_comments_of(book_ids)
+        return [
+            {field: related[field][row['id']] if field in related else row[BOOK_COLUMNS.get(field, field)]
+             for field in fieldset.fields}
+            for row in rows
+        ]
+
+    @staticmethod
+    def authors_of(book_ids):
+        authors = defaultdict(list)
+        if book_ids:
+            rows = (Books.authors.through.objects.filter(books_id__in=book_ids).order_by('books_id', 'authors_id')
+                    .values_list('books_id', 'authors_id', 'authors__full_name', 'authors__year'))
+            for book_id, pk, full_name, year in rows:
+                authors[book_id].append({'id': pk, 'full_name': full_name, 'year': year})
+        return authors
+
+    @staticmethod
+    def latest_comments_of(book_ids):
+        comments = defaultdict(list)
+        for book_id, pk, time_creation, content in top_comments(book_ids).values_list(
+                'book_id', 'id', 'time_creation', 'content'):
+            comments[book_id].append(
+                {'id': pk, 'time_creation': DATETIME.to_representation(time_creation), 'content': content})
+        return comments
+
+
+class AuthorsValuesSerializer(ValuesSerializer):
+    """
+    Как AuthorsReadSerializer: автор и его книги
+    """
+    values = ('id', 'full_name', 'year')
+
+    def to_representation(self, rows):
+        books = defaultdict(list)
+        if rows:
+            books_rows = (Books.authors.through.objects.filter(authors_id__in=[row['id'] for row in rows])
+                          .order_by('books__title', 'books_id')
+                          .values_list('authors_id', 'books_id', 'books__title', 'books__year'))
+            for author_id, pk, title, year in books_rows:
+                books[author_id].append({'id': pk, 'title': title, 'year': year})
+        return [
+            {'id': row['id'], 'full_name': row['full_name'], 'year': row['year'], 'books': books[row['id']]}
+            for row in rows
+        ]
+
+
+class CommentsValuesSerializer(ValuesSerializer):
+    """
+    Как CommentsListSerializer: комментарий и его книга (JOIN в том же запросе)
+    """
+    values = ('id', 'time_creation', 'content', 'book_id', 'book__title', 'book__year')
+
+    def to_representation(self, rows):
+        return [
+            {
+                'id': row['id'],
+                'time_creation': DATETIME.to_representation(row['time_creation']),
+                'content': row['content'],
+                'book': {'id': row['book_id'], 'title': row['book__title'], 'year': row['book__year']},
+            }
+            for row in rows
+        ]
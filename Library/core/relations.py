@@ -0,0 +1,245 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Books, Authors, author_full_name, normalize_author_key
+
+# Сколько натуральных ключей помещается в один запрос (длина OR-цепочки ограничена глубиной выражения SQLite)
+KEYS_PER_QUERY = 200
+
+AUTHOR_KEY = ('natural_key',)
+BOOK_KEY = ('title', 'year')
+
+
+def key_of(data, key_fields):
+    return tuple(data.get(field) for field in key_fields)
+
+
+def key_filter(key_fields, keys):
+    """
+    OR-условие по набору натуральных ключей. None сравнивается через IS NULL.
+    Ключ из одного поля ищется через IN.
+    """
+    if len(key_fields) == 1 and all(key[0] is not None for key in keys):
+        return Q(**{f'{key_fields[0]}__in': [key[0] for key in keys]})
+    conditions = []
+    for key in keys:
+        lookups = {}
+        for field, value in zip(key_fields, key):
+            if value is None:
+                lookups[f'{field}__isnull'] = True
+            else:
+                lookups[field] = value
+        conditions.append(Q(**lookups))
+    return reduce(or_, conditions)
+
+
+def fetch_by_keys(model, key_fields, keys):
+    """
+    Словарь ключ -> список найденных записей, по одному запросу на KEYS_PER_QUERY ключей.
+    """
+    keys = list(keys)
+    found = {}
+    for start in range(0, len(keys), KEYS_PER_QUERY):
+        chunk = keys[start:start + KEYS_PER_QUERY]
+        for obj in model.objects.filter(key_filter(key_fields, chunk)):
+            found.setdefault(key_of(obj.__dict__, key_fields), []).append(obj)
+    return found
+
+
+def get_or_create_by_keys(model, key_fields, items):
+    """
+    Находит записи по натуральному ключу одним запросом, недостающие создаёт одним bulk_create.
+    Как и раньше, при нескольких записях с одинаковым ключом возвращаются все.
+    Возвращает словарь ключ -> список записей в порядке входных данных.
+    """
+    items_by_key = {}
+    for item in items:
+        items_by_key.setdefault(key_of(item, key_fields), item)
+    if not items_by_key:
+        return {}
+
+    found = fetch_by_keys(model, key_fields, items_by_key)
+    missing = {key: item for key, item in items_by_key.items() if key not in found}
+    found.update(create_by_keys(model, key_fields, missing))
+    return {key: found.get(key, []) for key in items_by_key}
+
+
+def create_by_keys(model, key_fields, items_by_key):
+    """
+    Создаёт записи из словаря ключ -> данные одним bulk_create и дочитывает их. При уникальном ключе
+    (Authors.natural_key) запись мог уже создать параллельный запрос - конфликт пропускается, дочитывается
+    существующая. Дочитывание нужно в любом случае: SQLite в Django 3.2 не возвращает id из bulk_create,
+    а с ignore_conflicts их не возвращает ни одна БД.
+    """
+    if not items_by_key:
+        return {}
+    model.objects.bulk_create((model(**item) for item in items_by_key.values()), ignore_conflicts=True)
+    return fetch_by_keys(model, key_fields, items_by_key)
+
+
+def get_or_create_bulk(model, key_fields, items):
+    """
+    То же, что get_or_create_by_keys, но плоским списком записей без повторов
+    """
+    result, seen = [], set()
+    for objs in get_or_create_by_keys(model, key_fields, items).values():
+        for obj in objs:
+            if obj.pk not in seen:
+                seen.add(obj.pk)
+                result.append(obj)
+    return result
+
+
+class AuthorsResolverCache:
+    """
+    Ограниченный LRU-кэш в памяти процесса: нормализованный ключ ФИО -> id авторов.
+    Сбрасывается сигналами сохранения/удаления автора (core.signals) только в своём процессе,
+    поэтому resolve_authors_by_key сверяет id из кэша с БД.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._keys_by_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, ids):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (tuple(ids), time.monotonic() + self.ttl)
+            for pk in ids:
+                self._keys_by_id.setdefault(pk, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._pop(next(iter(self._data)))
+
+    def evict(self, pk=None, key=None):
+        with self._lock:
+            for cached_key in self._keys_by_id.pop(pk, set()) | ({key} if key else set()):
+                self._pop(cached_key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys_by_id.clear()
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            for pk in entry[0]:
+                keys = self._keys_by_id.get(pk)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys_by_id[pk]
+
+
+authors_cache = AuthorsResolverCache(getattr(settings, 'AUTHORS_RESOLVER_CACHE_SIZE', 10000),
+                                     getattr(settings, 'AUTHORS_RESOLVER_CACHE_TTL', 300))
+
+
+def author_item(author_data):
+    """
+    Данные автора для поиска/создания по нормализованному ключу ФИО (с производными полями, которые
+    при bulk_create не заполнит Authors.save)
+    """
+    item = dict(author_data)
+    item.setdefault('patronymic', None)
+    item['natural_key'] = normalize_author_key(item['surname'], item['name'], item['patronymic'])
+    item['full_name'] = author_full_name(item['surname'], item['name'], item['patronymic'])
+    return item
+
+
+def resolve_authors(authors_data):
+    """
+    id авторов по ФИО, ненайденные создаются (resolve_authors_by_key)
+    """
+    ids_by_key = resolve_authors_by_key(authors_data)
+    return list(dict.fromkeys(pk for ids in ids_by_key.values() for pk in ids))
+
+
+def resolve_authors_by_key(authors_data):
+    """
+    Словарь нормализованный ключ ФИО -> id авторов, ненайденные создаются.
+    Один запрос: поиск промахов authors_cache по ключу и проверка id из кэша - другой процесс мог
+    переименовать или удалить автора, и его кэш об этом не знает. Устаревшие ключи ищутся заново.
+    Кэш пополняется после фиксации транзакции.
+    """
+    items_by_key, cached_by_key = {}, {}
+    for item in map(author_item, authors_data):
+        key = item['natural_key']
+        if key in items_by_key:
+            continue
+        items_by_key[key] = item
+        cached = authors_cache.get(key)
+        if cached is not None:
+            cached_by_key[key] = cached
+
+    if not items_by_key:
+        return {}
+    missing_keys = [key for key in items_by_key if key not in cached_by_key]
+    cached_ids = [pk for ids in cached_by_key.values() for pk in ids]
+    key_by_pk = dict(Authors.objects.filter(Q(pk__in=cached_ids) | Q(natural_key__in=missing_keys))
+                     .values_list('pk', 'natural_key'))
+
+    ids_by_key = {}
+    for key, ids in cached_by_key.items():
+        if all(key_by_pk.get(pk) == key for pk in ids):
+            ids_by_key[key] = list(ids)
+        else:
+            authors_cache.evict(key=key)
+    for pk, key in key_by_pk.items():
+        if key in items_by_key and key not in cached_by_key:
+            ids_by_key.setdefault(key, []).append(pk)
+    # Не найденные по ключу и устаревшие в кэше; если устаревший ключ уже занят, create_by_keys его дочитает
+    unresolved = {(key,): item for key, item in items_by_key.items() if key not in ids_by_key}
+    for (key,), objs in create_by_keys(Authors, AUTHOR_KEY, unresolved).items():
+        ids_by_key[key] = [obj.pk for obj in objs]
+    for key, ids in ids_by_key.items():
+        if key not in cached_by_key:
+            transaction.on_commit(lambda key=key, ids=ids: authors_cache.set(key, ids))
+    return ids_by_key
+
+
+@contextmanager
+def unique_author_key():
+    """
+    Запись авторов в блоке: нарушение уникального Authors.natural_key (такой автор уже есть) - 400, а не 500
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise ValidationError({'non_field_errors': ['Автор с таким ФИО уже есть']})
+
+
+def resolve_books(books_data):
+    """
+    Книги по (title, year), ненайденные создаются
+    """
+    return get_or_create_bulk(Books, BOOK_KEY, books_data)
+
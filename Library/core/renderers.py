@@ -0,0 +1,43 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import add_render_time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer через orjson, если он установлен (pip install orjson), иначе - обычный json.
+    Вывод побайтно совпадает с JSONRenderer: компактные разделители, UTF-8 без \\u-экранирования,
+    \\u2028/\\u2029 экранируются, даты и прочие нестандартные типы - кодировщиком DRF.
+    С отступами (indent, Browsable API) и при ошибке orjson (например, целое больше 64 бит)
+    рендерит стандартный JSONRenderer.
+    Время рендеринга учитывается в метриках запроса (core.metrics).
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return self.render_json(data, accepted_media_type, renderer_context)
+        finally:
+            add_render_time(time.perf_counter() - started)
+
+    def render_json(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                               | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,97 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+# Чтение с реплик. Модели core читаются с реплики, только пока её выбрал ReplicaRoutingMiddleware
+# для безопасного запроса к представлению с replica_reads = True. Всё остальное идёт в 'default':
+# запись, транзакции записи, другие приложения и запросы вне HTTP (команды, сигналы).
+# После записи клиент на REPLICA_STICKY_SECONDS закрепляется за основной БД (cookie), чтобы видеть свои изменения.
+# Реплики - DATABASE_REPLICAS в Library/settings.py, обновление копий - manage.py refresh_replicas.
+
+read_database = ContextVar('read_database', default=None)
+
+STICKY_COOKIE = 'db_primary_until'
+
+
+class PrimaryReplicaRouter:
+    """
+    DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'core':
+            return read_database.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики - копии основной БД вместе со схемой
+        return db not in getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def reset_read_database(request):
+    token = getattr(request, '_read_database_token', None)
+    if token is not None:
+        read_database.reset(token)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    GET/HEAD к представлениям с атрибутом replica_reads = True читают со случайной реплики,
+    если клиент не закреплён за основной БД. Запрос на запись закрепляет клиента на REPLICA_STICKY_SECONDS.
+    request.db_sticky - клиент закреплён: ответы из кэша для него тоже могут быть собраны по отстающей реплике.
+    """
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        self.process_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_read_database(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            # process_view под ASGI выполняется в sync_to_async: реплика попадает в контекст запроса копией,
+            # токен от другого контекста - сбрасывается значением
+            if getattr(request, '_read_database_token', None) is not None:
+                read_database.set(None)
+        return self.process_response(request, response)
+
+    def process_request(self, request):
+        request.db_sticky = bool(getattr(settings, 'DATABASE_REPLICAS', ())) and self.is_sticky(request)
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            window = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            if getattr(settings, 'DATABASE_REPLICAS', ()) and window:
+                response.set_cookie(STICKY_COOKIE, str(int(time.time() + window)), max_age=window,
+                                    httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        view = getattr(view_func, 'view_class', view_func)
+        if (replicas and request.method in ('GET', 'HEAD') and getattr(view, 'replica_reads', False)
+                and not request.db_sticky):
+            request._read_database_token = read_database.set(random.choice(replicas))
+        return None
+
+    @staticmethod
+    def is_sticky(request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,160 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+# Полнотекстовый индекс SQLite FTS5. Документы двух видов:
+#     книга (rowid = id * 2): title - наименование, authors - ФИО всех авторов,
+#     комментарий (rowid = id * 2 + 1): content - текст.
+# Таблица и триггеры создаются миграцией 0010_search_index, индекс поддерживается триггерами,
+# поэтому в нём сразу оказываются и записи из bulk_create (import_catalog). "ё" заменяется на "е"
+# и в индексе, и в запросе.
+# SQLite пересоздаёт таблицу при изменении столбцов, и триггеры, ссылающиеся на неё, ломают миграцию:
+# такие миграции снимают триггеры в начале и ставят заново в конце (как 0011_denormalized_read_columns).
+# TRIGGERS_SQL - те же триггеры для команд, которые снимают их на время массовой записи (seed_library).
+SEARCH_TABLE = 'core_search'
+
+# Веса столбцов для bm25: совпадение в наименовании важнее, чем в авторах, и тем более в комментарии
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def build_match_query(text):
+    """
+    Строка поиска -> выражение MATCH: каждое слово ищется по префиксу ("книг" найдёт "книга", "книги"),
+    все слова обязательны. Спецсимволы FTS5 из пользовательского ввода не попадают в запрос.
+    """
+    words = WORD_RE.findall(normalize(text))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def search(text, limit, offset=0):
+    """
+    Найденные книги и комментарии по убыванию релевантности.
+    Фрагмент (snippet) экранирован, совпадения выделены <mark>.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+    sql = f'''
+        SELECT s.kind, s.object_id, s.book_id, b.title,
+               snippet({SEARCH_TABLE}, -1, %s, %s, '…', 12),
+               bm25({SEARCH_TABLE}, %s, %s, %s) AS rank
+        FROM {SEARCH_TABLE} AS s
+        JOIN core_books AS b ON b.id = s.book_id
+        WHERE {SEARCH_TABLE} MATCH %s
+        ORDER BY rank
+        LIMIT %s OFFSET %s
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [SNIPPET_START, SNIPPET_END, *COLUMN_WEIGHTS, match, limit, offset])
+        rows = cursor.fetchall()
+    return [
+        {
+            'type': kind,
+            'id': object_id,
+            'book_id': book_id,
+            'title': title,
+            'snippet': escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'),
+            'rank': round(-rank, 6),
+        }
+        for kind, object_id, book_id, title, snippet, rank in rows
+    ]
+
+
+def rebuild():
+    """
+    Полная пересборка индекса из таблиц книг, авторов и комментариев
+    """
+    install_triggers()
+    with connection.cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
+
+
+def table_exists(using=connection):
+    return using.vendor == 'sqlite' and SEARCH_TABLE in using.introspection.table_names()
+
+
+def install_triggers(using=connection):
+    if not table_exists(using):
+        return
+    with using.cursor() as cursor:
+        for sql in TRIGGERS_SQL.values():
+            cursor.execute(sql)
+
+
+def drop_triggers(using=connection):
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        for name in TRIGGERS_SQL:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+NORMALIZE_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+BOOK_AUTHORS_SQL = '''(
+    SELECT coalesce(group_concat({name}, ' '), '')
+    FROM core_authors AS a JOIN core_books_authors AS ba ON ba.authors_id = a.id
+    WHERE ba.books_id = {{book_id}}
+)'''.format(name=NORMALIZE_SQL.format("a.surname || ' ' || a.name || coalesce(' ' || a.patronymic, '')"))
+
+REBUILD_SQL = (
+    f"DELETE FROM {SEARCH_TABLE}",
+    f'''INSERT INTO {SEARCH_TABLE} (rowid, title, authors, content, kind, object_id, book_id)
+        SELECT b.id * 2, {NORMALIZE_SQL.format('b.title')}, {BOOK_AUTHORS_SQL.format(book_id='b.id')}, '',
+               'book', b.id, b.id
+        FROM core_books AS b''',
+    f'''INSERT INTO {SEARCH_TABLE} (rowid, title, authors, content, kind, object_id, book_id)
+        SELECT c.id * 2 + 1, '', '', {NORMALIZE_SQL.format('c.content')}, 'comment', c.id, c.book_id
+        FROM core_comments AS c''',
+)
+
+TRIGGERS_SQL = {
+    'core_search_book_insert': f'''CREATE TRIGGER IF NOT EXISTS core_search_book_insert AFTER INSERT ON core_books BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, authors, content, kind, object_id, book_id)
+        VALUES (new.id * 2, {NORMALIZE_SQL.format('new.title')}, '', '', 'book', new.id, new.id);
+    END''',
+    'core_search_book_update': f'''CREATE TRIGGER IF NOT EXISTS core_search_book_update AFTER UPDATE OF title ON core_books BEGIN
+        UPDATE {SEARCH_TABLE} SET title = {NORMALIZE_SQL.format('new.title')} WHERE rowid = new.id * 2;
+    END''',
+    'core_search_book_delete': f'''CREATE TRIGGER IF NOT EXISTS core_search_book_delete AFTER DELETE ON core_books BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2;
+    END''',
+    'core_search_link_insert': f'''CREATE TRIGGER IF NOT EXISTS core_search_link_insert AFTER INSERT ON core_books_authors BEGIN
+        UPDATE {SEARCH_TABLE} SET authors = {BOOK_AUTHORS_SQL.format(book_id='new.books_id')}
+        WHERE rowid = new.books_id * 2;
+    END''',
+    'core_search_link_delete': f'''CREATE TRIGGER IF NOT EXISTS core_search_link_delete AFTER DELETE ON core_books_authors BEGIN
+        UPDATE {SEARCH_TABLE} SET authors = {BOOK_AUTHORS_SQL.format(book_id='old.books_id')}
+        WHERE rowid = old.books_id * 2;
+    END''',
+    'core_search_author_update': f'''CREATE TRIGGER IF NOT EXISTS core_search_author_update
+        AFTER UPDATE OF surname, name, patronymic ON core_authors BEGIN
+        UPDATE {SEARCH_TABLE} SET authors = {BOOK_AUTHORS_SQL.format(book_id=f'{SEARCH_TABLE}.book_id')}
+        WHERE rowid IN (SELECT books_id * 2 FROM core_books_authors WHERE authors_id = new.id);
+    END''',
+    'core_search_comment_insert': f'''CREATE TRIGGER IF NOT EXISTS core_search_comment_insert AFTER INSERT ON core_comments BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, authors, content, kind, object_id, book_id)
+        VALUES (new.id * 2 + 1, '', '', {NORMALIZE_SQL.format('new.content')}, 'comment', new.id, new.book_id);
+    END''',
+    'core_search_comment_update': f'''CREATE TRIGGER IF NOT EXISTS core_search_comment_update
+        AFTER UPDATE OF content ON core_comments BEGIN
+        UPDATE {SEARCH_TABLE} SET content = {NORMALIZE_SQL.format('new.content')} WHERE rowid = new.id * 2 + 1;
+    END''',
+    'core_search_comment_delete': f'''CREATE TRIGGER IF NOT EXISTS core_search_comment_delete AFTER DELETE ON core_comments BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1;
+    END''',
+}
@@ -1,7 +1,13 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Prefetch
 from django.http import Http404
 from rest_framework import serializers
 
+from .fieldsets import BookFieldset, top_comments
 from .models import Books, Authors, Comments
+from .relations import resolve_authors, resolve_books, unique_author_key
 
 
 class BooksWriteSerializer(serializers.ModelSerializer):
@@ -26,17 +32,13 @@ class AuthorsWriteSerializer(serializers.ModelSerializer):
         model = Authors
         fields = ('id', 'surname', 'name', 'patronymic', 'year', 'books')
 
+    @transaction.atomic
     def create(self, validated_data):
         books_data = validated_data.pop('books')
-        author = Authors.objects.create(**validated_data)
-        for book_data in books_data:
-            list_exist_books = Books.objects.filter(title=book_data['title'], year=book_data['year'])
-            if list_exist_books:
-                for exist_book in list_exist_books:
-                    author.books.add(exist_book)
-            else:
-                new_book = Books.objects.create(**book_data)
-                author.books.add(new_book)
+        with unique_author_key():
+            author = Authors.objects.create(**validated_data)
+        if books_data:
+            author.books.add(*resolve_books(books_data))
         return author
 
 
@@ -55,24 +57,38 @@ class AuthorsReadSerializer(serializers.ModelSerializer):
     Вывод списка авторов с объединением ФИО в строку
     GET /lib/api/authors/
     """
-    full_name = serializers.SerializerMethodField()
+    full_name = serializers.CharField(read_only=True)
     books = BooksReadSerializer(read_only=True, many=True)
 
-    def get_full_name(self, obj):
-        return f'{obj.surname} {obj.name} {obj.patronymic}'
+    @staticmethod
+    def setup_eager_loading(queryset, request=None):
+        """
+        Подгружает книги авторов одним запросом (только поля BooksReadSerializer)
+        """
+        return queryset.only('id', 'full_name', 'year').prefetch_related(
+            Prefetch('books', queryset=Books.objects.only(*BooksReadSerializer.Meta.fields).order_by('title', 'id'))
+        )
 
     class Meta:
         model = Authors
         fields = ('id', 'full_name', 'year', 'books')
 
 
-class AuthorsListingField(serializers.RelatedField):
+class BookPrimaryKeyField(serializers.PrimaryKeyRelatedField):
     """
-    Выводит имя автора в одну строку в связанном поле
-    GET /lib/api/books/
+    id книги. При пакетной записи книги всех элементов загружены заранее одним запросом
+    и переданы в context['books'] (core.batch), запроса на каждый элемент нет.
     """
-    def to_representation(self, value):
-        return f'{value.surname} {value.name} {value.patronymic}'
+    def to_internal_value(self, data):
+        books = self.context.get('books')
+        if books is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool) or not str(data).isdigit():
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        book = books.get(int(data))
+        if book is None:
+            self.fail('does_not_exist', pk_value=data)
+        return book
 
 
 class CommentsWriteSerializer(serializers.ModelSerializer):
@@ -80,6 +96,7 @@ class CommentsWriteSerializer(serializers.ModelSerializer):
     Используется при записи комментария
     POST /lib/api/comments/
     """
+    book = BookPrimaryKeyField(queryset=Books.objects.all())
 
     class Meta:
         model = Comments
@@ -94,6 +111,14 @@ class CommentsListSerializer(serializers.ModelSerializer):
     """
     book = BooksReadSerializer(many=False)
 
+    @staticmethod
+    def setup_eager_loading(queryset, request=None):
+        """
+        Книга комментария подтягивается JOIN-ом в том же запросе
+        """
+        book_fields = [f'book__{field}' for field in BooksReadSerializer.Meta.fields]
+        return queryset.select_related('book').only('id', 'time_creation', 'content', 'book', *book_fields)
+
     class Meta:
         model = Comments
         fields = ('id', 'time_creation', 'content', 'book')
@@ -101,7 +126,7 @@ class CommentsListSerializer(serializers.ModelSerializer):
 
 class CommentsSerializer(serializers.ModelSerializer):
     """
-    Используется при выводе информации о книге
+    Используется при выводе информации о книге (?expand=comments)
     GET /lib/api/books/
     """
     class Meta:
@@ -109,18 +134,89 @@ class CommentsSerializer(serializers.ModelSerializer):
         fields = ('id', 'time_creation', 'content')
 
 
+def comments_by_book(book_ids):
+    """
+    Словарь id книги -> последние комментарии (top_comments), один запрос
+    """
+    comments = defaultdict(list)
+    for comment in top_comments(book_ids).only(*CommentsSerializer.Meta.fields, 'book'):
+        comments[comment.book_id].append(comment)
+    return comments
+
+
+class TopCommentsField(serializers.Field):
+    """
+    Последние BOOK_LATEST_COMMENTS комментариев книги. Для страницы книг они выбираются одним запросом
+    на всю страницу (BooksListSerializer кладёт их в context['top_comments']), для одной книги - её запросом.
+    """
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, book):
+        comments = self.context.get('top_comments')
+        if comments is None:
+            comments = comments_by_book([book.pk])
+        return CommentsSerializer(comments.get(book.pk, []), many=True).data
+
+
+class BooksListSerializer(serializers.ListSerializer):
+    """
+    Страница книг: последние комментарии всех книг страницы - одним запросом (TopCommentsField)
+    """
+    def to_representation(self, data):
+        if 'comments' in self.child.fields:
+            data = list(data)
+            self.context['top_comments'] = comments_by_book([book.pk for book in data])
+        return super().to_representation(data)
+
+
+class BookAuthorsSerializer(serializers.ModelSerializer):
+    """
+    Авторы книги объектами (?expand=authors)
+    GET /lib/api/books/
+    """
+    class Meta:
+        model = Authors
+        fields = ('id', 'full_name', 'year')
+
+
 class BooksSerializer(serializers.ModelSerializer):
     """
-    Вывод информации о книге с использованием сериализатора об авторе "в одну строку"
+    Вывод информации о книге с авторами "в одну строку"
     Используется при удалении книги, а также при выводе полной информации
     GET /lib/api/books/
-    """
-    authors = AuthorsListingField(many=True, read_only=True)
-    comments = CommentsSerializer(many=True, read_only=True)
+    Состав полей - по параметрам fields и expand запроса (core.fieldsets)
+    """
+    authors = serializers.ListField(source='authors_display', child=serializers.CharField(), read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+    comments = TopCommentsField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = BookFieldset.from_request(self.context.get('request'))
+        for name in set(self.fields) - set(fieldset.fields):
+            self.fields.pop(name)
+        if fieldset.expands('authors'):
+            self.fields['authors'] = BookAuthorsSerializer(many=True, read_only=True)
+
+    @staticmethod
+    def setup_eager_loading(queryset, request=None):
+        """
+        Только колонки запрошенных полей; авторы - из денормализованного authors_display той же строки
+        или (?expand=authors) одним запросом на страницу; последние комментарии выбирает TopCommentsField
+        """
+        fieldset = BookFieldset.from_request(request)
+        queryset = queryset.only(*fieldset.columns)
+        if fieldset.expands('authors'):
+            queryset = queryset.prefetch_related(
+                Prefetch('authors', queryset=Authors.objects.only(*BookAuthorsSerializer.Meta.fields).order_by('id')))
+        return queryset
 
     class Meta:
         model = Books
-        fields = ('id', 'title', 'year', 'authors', 'comments')
+        fields = ('id', 'title', 'year', 'authors', 'comments_count', 'comments')
+        list_serializer_class = BooksListSerializer
 
 
 class AuthorsSerializer(serializers.ModelSerializer):
@@ -145,17 +241,10 @@ class BookSerializer(serializers.ModelSerializer):
         model = Books
         fields = ('id', 'title', 'year', 'authors')
 
+    @transaction.atomic
     def create(self, validated_data):
         authors_data = validated_data.pop('authors')
         book = Books.objects.create(**validated_data)
-        for author_data in authors_data:
-            list_author_exist = Authors.objects.filter(surname=author_data['surname'],
-                                                       name=author_data['name'],
-                                                       patronymic=author_data['patronymic'])
-            if list_author_exist:
-                for author_exist in list_author_exist:
-                    book.authors.add(author_exist)
-            else:
-                new_author = Authors.objects.create(**author_data)
-                book.authors.add(new_author)
+        if authors_data:
+            book.authors.add(*resolve_authors(authors_data))
         return book
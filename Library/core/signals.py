@@ -0,0 +1,205 @@
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics, profiling, sqlite
+from .cache import response_cache
+from .conditional import record_deletion
+from .denormalize import refresh_authors_display
+from .fragments import fragment_cache
+from .models import Books, Authors, Comments, comments_deleted
+from .relations import KEYS_PER_QUERY, authors_cache
+from .streams import comments_hub
+
+
+@receiver(post_save, sender=Authors)
+@receiver(post_delete, sender=Authors)
+def evict_resolved_author(sender, instance, **kwargs):
+    """
+    Сохранение/удаление автора сбрасывает его старый и новый ключ в кэше поиска авторов
+    """
+    authors_cache.evict(pk=instance.pk, key=instance.natural_key)
+
+
+@receiver(post_save, sender=Books)
+@receiver(post_save, sender=Authors)
+@receiver(post_save, sender=Comments)
+@receiver(post_delete, sender=Books)
+@receiver(post_delete, sender=Authors)
+@receiver(comments_deleted, sender=Comments)
+@receiver(m2m_changed, sender=Books.authors.through)
+def invalidate_responses(sender, **kwargs):
+    """
+    Любое изменение каталога делает устаревшими закэшированные ответы API
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        response_cache.invalidate()
+
+
+@receiver(post_delete, sender=Books)
+@receiver(post_delete, sender=Authors)
+def count_deletion(sender, **kwargs):
+    """
+    Удаление меняет список, но не отметки оставшихся строк - счётчик удалений для валидаторов списка
+    """
+    record_deletion(sender)
+
+
+def touch(model, pks):
+    """
+    Отметка изменения без save(): для условного GET (ETag/Last-Modified) родительских ответов.
+    pks - queryset (уходит в запрос подзапросом) или набор id (обновляется порциями по KEYS_PER_QUERY).
+    """
+    now = timezone.now()
+    if isinstance(pks, QuerySet):
+        model.objects.filter(pk__in=pks).update(updated_at=now)
+        return
+    pks = list(pks)
+    for start in range(0, len(pks), KEYS_PER_QUERY):
+        model.objects.filter(pk__in=pks[start:start + KEYS_PER_QUERY]).update(updated_at=now)
+
+
+@receiver(post_save, sender=Books)
+@receiver(post_delete, sender=Books)
+def bump_book_fragments(sender, instance, **kwargs):
+    """
+    Наименование и год книги выводятся во фрагменте страницы книги (core.fragments)
+    """
+    fragment_cache.bump('book', [instance.pk])
+
+
+@receiver(post_save, sender=Comments)
+def touch_commented_book(sender, instance, created, **kwargs):
+    """
+    Комментарии выводятся в составе книги: отметка изменения и счётчик comments_count одним UPDATE
+    """
+    changes = {'updated_at': timezone.now()}
+    if created:
+        changes['comments_count'] = F('comments_count') + 1
+    Books.objects.filter(pk=instance.book_id).update(**changes)
+
+
+@receiver(comments_deleted, sender=Comments)
+def touch_books_of_deleted_comments(sender, book_counts, **kwargs):
+    """
+    То же при удалении комментариев: один UPDATE на каждые KEYS_PER_QUERY книг с одинаковым числом удалённых.
+    Каскад от удаляемой книги сюда не попадает - её комментарии удаляются одним DELETE.
+    """
+    by_count = {}
+    for book_id, count in book_counts.items():
+        by_count.setdefault(count, []).append(book_id)
+    now = timezone.now()
+    for count, book_ids in by_count.items():
+        for start in range(0, len(book_ids), KEYS_PER_QUERY):
+            Books.objects.filter(pk__in=book_ids[start:start + KEYS_PER_QUERY]).update(
+                updated_at=now, comments_count=F('comments_count') - count)
+
+
+@receiver(post_save, sender=Comments)
+def publish_new_comment(sender, instance, created, **kwargs):
+    """
+    Новый комментарий уходит подписчикам потока книги (core.streams) после фиксации транзакции
+    """
+    if created:
+        comment = {'id': instance.pk, 'time_creation': instance.time_creation, 'content': instance.content}
+        transaction.on_commit(lambda: comments_hub.publish(instance.book_id, comment))
+
+
+@receiver(m2m_changed, sender=Books.authors.through)
+def touch_related(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Связь книга-автор меняет ответы обеих сторон
+    """
+    if action in ('post_add', 'post_remove'):
+        related_pks = pk_set
+    elif action == 'pre_clear':
+        related_pks = (instance.books if reverse else instance.authors).values_list('pk', flat=True)
+    else:
+        return
+    touch(type(instance), [instance.pk])
+    touch(model, related_pks)
+
+
+@receiver(post_save, sender=Authors)
+def update_author_books(sender, instance, created, **kwargs):
+    """
+    ФИО автора выводится в составе его книг: отметка изменения и authors_display
+    """
+    if not created:
+        book_ids = list(instance.books.values_list('pk', flat=True))
+        touch(Books, book_ids)
+        refresh_authors_display(book_ids)
+        fragment_cache.bump('book', book_ids)
+
+
+@receiver(post_save, sender=Books)
+def touch_book_authors(sender, instance, created, **kwargs):
+    """
+    Наименование и год книги выводятся в составе её авторов: отметка изменения авторов
+    """
+    if not created:
+        touch(Authors, instance.authors.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Authors)
+def remember_books_of_deleted_author(sender, instance, **kwargs):
+    # Связи удаляются вместе с автором без m2m_changed - книги запоминаем заранее
+    instance._deleted_book_ids = list(instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Authors)
+def update_books_of_deleted_author(sender, instance, **kwargs):
+    book_ids = getattr(instance, '_deleted_book_ids', [])
+    touch(Books, book_ids)
+    refresh_authors_display(book_ids)
+    fragment_cache.bump('book', book_ids)
+
+
+@receiver(pre_delete, sender=Books)
+def touch_authors_of_deleted_book(sender, instance, **kwargs):
+    touch(Authors, instance.authors.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Books.authors.through)
+def refresh_books_authors_display(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Books.authors_display и фрагменты страниц (core.fragments) обновляются для книг, чьи связи с авторами изменились
+    """
+    if action == 'pre_clear' and reverse:
+        instance._cleared_book_ids = list(instance.books.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            book_ids = [instance.pk]
+        elif action == 'post_clear':
+            book_ids = getattr(instance, '_cleared_book_ids', [])
+        else:
+            book_ids = pk_set
+        refresh_authors_display(book_ids)
+        fragment_cache.bump('book', book_ids)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Прагмы профиля БД (WAL, synchronous, busy_timeout, ...) для каждого нового соединения
+    """
+    sqlite.apply_pragmas(connection)
+
+
+@receiver(connection_created)
+def wrap_connection_queries(sender, connection, **kwargs):
+    """
+    Обёртки курсора для метрик и журнала медленных SQL (core.metrics, core.profiling), одни на соединение
+    """
+    for wrapper in (metrics.count_query, profiling.log_slow_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    sqlite.check_connections(connections)
@@ -0,0 +1,45 @@
+import sqlite3
+
+# Настройка соединений SQLite по профилю БД (DATABASES в Library/settings.py):
+#     PRAGMAS - прагмы, выполняемые при открытии каждого соединения (сигнал connection_created, core.signals),
+#     LIBRARY_CONN_CHECKS - постоянное соединение (CONN_MAX_AGE) проверяется перед каждым запросом
+#     и переоткрывается, если перестало отвечать. Имя своё, не CONN_HEALTH_CHECKS из Django 4.1+: после обновления
+#     Django ключ не включит вдобавок встроенную проверку. Ключи - рядом с ENGINE, а не в OPTIONS:
+#     OPTIONS целиком передаются в sqlite3.connect.
+
+
+def apply_pragmas(connection):
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+def is_alive(connection):
+    """
+    Проверка открытого соединения запросом SELECT 1 (is_usable у SQLite всегда True)
+    """
+    try:
+        connection.connection.execute('SELECT 1').fetchone()
+    except (sqlite3.Error, AttributeError):
+        return False
+    return True
+
+
+def check_connections(connections):
+    """
+    Закрывает постоянные соединения с LIBRARY_CONN_CHECKS, не прошедшие проверку: следующий запрос откроет новое
+    """
+    for connection in connections.all():
+        if (connection.vendor == 'sqlite' and connection.settings_dict.get('LIBRARY_CONN_CHECKS')
+                and connection.connection is not None and not connection.in_atomic_block
+                and not is_alive(connection)):
+            connection.close()
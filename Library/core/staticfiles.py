@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import mimetypes
+import os
+import posixpath
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Статика для продакшена (manage.py collectstatic в STATIC_ROOT):
+#     CompressedManifestStaticFilesStorage - имена с хэшем содержимого (js/vue.3d1c0a.js, ссылки url() в CSS
+#         переписываются) и рядом сжатые варианты .gz и .br (brotli - если установлен, pip install brotli);
+#     PrecompressedStaticMiddleware - отдаёт STATIC_URL из STATIC_ROOT: вариант по Accept-Encoding,
+#         файлы с хэшем - с Cache-Control immutable на год, остальные - с проверкой по Last-Modified.
+# Пока collectstatic не выполнялся, {% static %} выдаёт имена без хэшей, а статику отдаёт runserver, как раньше.
+
+# Что сжимать: шрифты woff2 и картинки уже сжаты
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.ttf', '.eot')
+
+# Вариант сохраняется, только если он заметно меньше исходного файла
+COMPRESSED_MIN_RATIO = 0.95
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Кодировка Content-Encoding -> суффикс файла варианта, в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(path):
+    """
+    Пишет path.gz и path.br (если brotli установлен), когда вариант меньше исходного. Возвращает суффиксы.
+    """
+    with open(path, 'rb') as file:
+        content = file.read()
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    written = []
+    for suffix, data in variants.items():
+        if len(data) < len(content) * COMPRESSED_MIN_RATIO:
+            with open(path + suffix, 'wb') as file:
+                file.write(data)
+            written.append(suffix)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage со сжатыми вариантами собранных файлов (исходные имена и имена с хэшем)
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                compress(self.path(name))
+
+    def url(self, name, force=False):
+        # До первого collectstatic манифеста нет - ссылки без хэшей, как у StaticFilesStorage
+        if not self.hashed_files and not force:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+
+def accepted_encodings(request):
+    """
+    Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)
+    """
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticMiddleware(MiddlewareMixin):
+    """
+    Отдача собранной статики из STATIC_ROOT раньше остальных middleware (описание - в начале модуля).
+    Файлы, которых в STATIC_ROOT нет, проходят дальше как обычные запросы.
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self._immutable = None
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if self.is_static(request):
+            response = self.serve(request, request.path_info[len(settings.STATIC_URL):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            response = await sync_to_async(self.serve, thread_sensitive=False)(
+                request, request.path_info[len(settings.STATIC_URL):])
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    @staticmethod
+    def is_static(request):
+        return (request.method in ('GET', 'HEAD') and bool(getattr(settings, 'STATIC_ROOT', None))
+                and request.path_info.startswith(settings.STATIC_URL))
+
+    @property
+    def immutable(self):
+        """
+        Имена файлов с хэшем из манифеста collectstatic
+        """
+        if self._immutable is None:
+            self._immutable = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._immutable
+
+    def serve(self, request, name):
+        name = posixpath.normpath(unquote(name)).lstrip('/')
+        try:
+            path = safe_join(str(settings.STATIC_ROOT), name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        hashed = name in self.immutable
+        if not hashed and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                                 stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+
+        content_type, _ = mimetypes.guess_type(name)
+        accepted = accepted_encodings(request)
+        encoding, served = None, path
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, served = coding, path + suffix
+                break
+
+        response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+        if 'Content-Disposition' in response:
+            del response['Content-Disposition']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if encoding or any(os.path.isfile(path + suffix) for _, suffix in ENCODINGS):
+            response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if hashed else 'no-cache'
+        return response
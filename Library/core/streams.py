@@ -0,0 +1,249 @@
+import asyncio
+import re
+import threading
+from collections import defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .models import Books, Comments
+from .readers import DATETIME
+from .renderers import FastJSONRenderer
+
+# Поток новых комментариев книги (server-sent events): GET /lib/api/comments/<book_id>/stream/
+# Соединение - корутина и очередь в памяти рабочего процесса ASGI, без потока на клиента.
+# Новые комментарии рассылаются после фиксации транзакции (core.signals) всем подписчикам книги
+# в этом процессе (comments_hub). Клиент, переподключившийся с Last-Event-ID, и клиент,
+# не успевающий разбирать очередь, дочитывают пропущенное из БД. Комментарии фиксируются не обязательно
+# в порядке id, поэтому повторы отсекаются по множеству отправленных id (SentIds), а не по последнему id.
+# Под WSGI поток недоступен: представление отвечает 204, и EventSource больше не переподключается.
+
+STREAM_PATH_RE = re.compile(r'^/lib/api/comments/(?P<book_id>\d+)/stream/$')
+
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+    (b'access-control-allow-origin', b'*'),
+]
+
+
+def comment_event(comment):
+    """
+    Событие SSE: id - id комментария, данные - как элемент comments в BooksSerializer
+    """
+    data = FastJSONRenderer().render({
+        'id': comment['id'],
+        'time_creation': DATETIME.to_representation(comment['time_creation']),
+        'content': comment['content'],
+    })
+    return b'id: %d\nevent: comment\ndata: %s\n\n' % (comment['id'], data)
+
+
+class Subscription:
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        # Элементы очереди - (id комментария, событие). Очередь переполнялась - часть событий потеряна:
+        # наименьший id потерянного, с него нужно дочитать из БД
+        self.missed_from = None
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.missed_from is None or event[0] < self.missed_from:
+                self.missed_from = event[0]
+
+
+class SentIds:
+    """
+    id последних size отправленных клиенту комментариев
+    """
+    def __init__(self, size):
+        self._order = deque()
+        self._ids = set()
+        self.size = size
+
+    def __contains__(self, event_id):
+        return event_id in self._ids
+
+    def add(self, event_id):
+        if len(self._order) >= self.size:
+            self._ids.discard(self._order.popleft())
+        self._order.append(event_id)
+        self._ids.add(event_id)
+
+
+class CommentsHub:
+    """
+    Рассылка событий подписчикам книги внутри процесса.
+    publish можно вызывать из любого потока: событие кладётся в очередь в цикле событий подписчика.
+    Событие кодируется один раз на всех подписчиков.
+    """
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, book_id, queue_size=None):
+        subscription = Subscription(asyncio.get_running_loop(),
+                                    queue_size or getattr(settings, 'COMMENTS_STREAM_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscribers[book_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, book_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(book_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[book_id]
+
+    def has_subscribers(self, book_id):
+        return book_id in self._subscribers
+
+    def publish(self, book_id, comment):
+        with self._lock:
+            subscribers = list(self._subscribers.get(book_id, ()))
+        if not subscribers:
+            return
+        event = (comment['id'], comment_event(comment))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self.unsubscribe(book_id, subscription)
+        self.published += 1
+
+    def stats(self):
+        with self._lock:
+            return {'books': len(self._subscribers),
+                    'subscribers': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                    'published': self.published}
+
+
+comments_hub = CommentsHub()
+
+
+def close_old_connections():
+    # Как django.db.close_old_connections, но не трогает соединения внутри транзакции
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+def database(function):
+    """
+    ORM из ASGI-приложения вне цикла запроса Django: в потоке sync_to_async,
+    с закрытием устаревших соединений до и после, как это делают сигналы запроса
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run)
+
+
+@database
+def book_exists(book_id):
+    return Books.objects.filter(pk=book_id).exists()
+
+
+@database
+def comments_after(book_id, after_id, limit):
+    return list(Comments.objects.filter(book_id=book_id, id__gt=after_id).order_by('id')
+                .values('id', 'time_creation', 'content')[:limit])
+
+
+def last_event_id(scope):
+    for name, value in scope.get('headers', ()):
+        if name == b'last-event-id':
+            value = value.decode('latin-1').strip()
+            return int(value) if value.isdigit() else None
+    return None
+
+
+async def comments_stream(scope, receive, send):
+    """
+    ASGI-приложение потока комментариев книги (подключается в Library/asgi.py)
+    """
+    if scope['method'] not in ('GET', 'HEAD'):
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET, HEAD')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    book_id = int(STREAM_PATH_RE.match(scope['path']).group('book_id'))
+    if not await book_exists(book_id):
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
+        return
+
+    if scope['method'] == 'HEAD':
+        # Только заголовки потока, без подписки: ответ на HEAD должен завершиться
+        await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    heartbeat = getattr(settings, 'COMMENTS_STREAM_HEARTBEAT', 15)
+    catch_up_limit = getattr(settings, 'COMMENTS_STREAM_QUEUE_SIZE', 100)
+    # Подписка до чтения из БД: комментарий, добавленный между ними, не потеряется (повтор отсекается по id).
+    # Отправленные id помнятся с запасом на очередь и порцию дочитывания
+    subscription = comments_hub.subscribe(book_id)
+    sent = SentIds(2 * catch_up_limit)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        last_id = last_event_id(scope)
+        if last_id is not None:
+            await send_missed(send, book_id, last_id, catch_up_limit, sent)
+
+        while not disconnected.done():
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not done:
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+
+            event_id, event = getter.result()
+            if event_id not in sent:
+                await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+                sent.add(event_id)
+            if subscription.missed_from is not None:
+                after_id, subscription.missed_from = subscription.missed_from - 1, None
+                await send_missed(send, book_id, after_id, catch_up_limit, sent)
+    finally:
+        comments_hub.unsubscribe(book_id, subscription)
+        disconnected.cancel()
+
+
+async def send_missed(send, book_id, after_id, limit, sent):
+    """
+    Комментарии после after_id из БД, порциями по limit, кроме уже отправленных (sent)
+    """
+    while True:
+        comments = await comments_after(book_id, after_id, limit)
+        for comment in comments:
+            if comment['id'] not in sent:
+                await send({'type': 'http.response.body', 'body': comment_event(comment), 'more_body': True})
+                sent.add(comment['id'])
+            after_id = comment['id']
+        if len(comments) < limit:
+            return
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
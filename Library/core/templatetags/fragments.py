@@ -0,0 +1,30 @@
+from django import template
+
+from core.fragments import fragment_cache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, pk):
+        self.nodelist = nodelist
+        self.name = name
+        self.pk = pk
+
+    def render(self, context):
+        return fragment_cache.render(self.name.resolve(context), self.pk.resolve(context),
+                                     lambda: self.nodelist.render(context))
+
+
+@register.tag('cachefragment')
+def do_cachefragment(parser, token):
+    """
+    {% cachefragment 'book' book_id %} ... {% endcachefragment %} - содержимое из core.fragments.fragment_cache,
+    переменные внутри блока вычисляются только при перерисовке
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' ожидает имя фрагмента и id записи")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
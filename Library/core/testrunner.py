@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тесты с кэшами и корзинами ограничителя записи (core.throttling) в памяти процесса: их файлы SQLite общие
+    с запущенным сервером и переживают прогон - в них попали бы ответы и фрагменты тестовой БД
+    и записи тестов (как EMAIL_BACKEND у Django)
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = {
+            alias: {**config, 'BACKEND': LOCMEM_BACKEND, 'LOCATION': alias}
+            if config['BACKEND'] == 'core.cache.SQLiteCache' else config
+            for alias, config in settings.CACHES.items()
+        }
+        self._settings = override_settings(CACHES=caches, WRITE_THROTTLE_LOCATION=None)
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1526 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from Library.asgi import application as asgi_application
+
+from . import metrics, profiling, sqlite, throttling
+from .batch import bulk_create_with_ids
+from .cache import SQLiteCache, response_cache
+from .fieldsets import top_comments
+from .fragments import fragment_cache
+from .models import Books, Authors, Comments
+from .relations import authors_cache, resolve_authors
+from .renderers import FastJSONRenderer
+from .routers import STICKY_COOKIE, PrimaryReplicaRouter
+from .streams import comments_hub
+from .writebehind import CommentWriter, WriteQueueFull, comment_writer
+
+
+def cursor_param(data):
+    """
+    Параметр cursor с произвольным JSON (core.pagination.KeysetPagination)
+    """
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+def create_books(count, authors_per_book=2, comments_per_book=2):
+    """
+    Наполняет БД книгами с авторами и комментариями
+    """
+    books = []
+    # ФИО авторов уникальны (Authors.natural_key) - номера продолжаются после уже созданных книг
+    start = Books.objects.count()
+    for i in range(count):
+        book = Books.objects.create(title=f'Книга {i}', year=2000 + i)
+        for j in range(authors_per_book):
+            book.authors.add(Authors.objects.create(surname=f'Фамилия {start + i}-{j}', name='Имя',
+                                                    patronymic='Отчество'))
+        for j in range(comments_per_book):
+            Comments.objects.create(content=f'Комментарий {i}-{j}', book=book)
+        books.append(book)
+    return books
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Число запросов у читающих endpoint-ов не зависит от количества записей.
+    Первый запрос каждого endpoint-а - валидаторы условного GET.
+    """
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertQueriesConstant(self, url, expected, sizes=(1, 5)):
+        for size in sizes:
+            Books.objects.all().delete()
+            Authors.objects.all().delete()
+            create_books(size)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_books_list(self):
+        # валидаторы (ETag) + оценка числа книг + книги (с authors_display и comments_count)
+        self.assertQueriesConstant('/lib/api/books/', 3)
+        # + авторы + последние комментарии
+        self.assertQueriesConstant('/lib/api/books/?expand=comments,authors', 5)
+
+    def test_book_detail(self):
+        for size in (1, 5):
+            book = create_books(1, authors_per_book=size, comments_per_book=size)[0]
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/lib/api/book/{book.pk}/')
+            self.assertEqual(len(response.data['authors']), size)
+            self.assertEqual(response.data['comments_count'], size)
+            with self.assertNumQueries(3):
+                response = self.client.get(f'/lib/api/book/{book.pk}/?expand=comments')
+            self.assertEqual(len(response.data['comments']), size)
+
+    def test_authors_list(self):
+        self.assertQueriesConstant('/lib/api/authors/', 3)
+
+    def test_author_detail(self):
+        author = create_books(1)[0].authors.first()
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/lib/api/author/{author.pk}/')
+        self.assertEqual(response.data['books'][0]['title'], 'Книга 0')
+
+    def test_comments_list(self):
+        self.assertQueriesConstant('/lib/api/comments/', 2)
+
+    def test_comments_of_book(self):
+        book = create_books(3, comments_per_book=4)[1]
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/lib/api/comments/{book.pk}/')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(response.data['results'][0]['book']['title'], book.title)
+
+    def test_comment_detail(self):
+        comment = create_books(1)[0].comments.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/lib/api/comment/{comment.pk}/')
+        self.assertEqual(response.data['book']['id'], comment.book_id)
+
+
+class BooksCursorPaginationTests(TestCase):
+    """
+    Курсорная пагинация списка книг по ключу (title, id)
+    """
+    def setUp(self):
+        self.client = APIClient()
+        # Одинаковые наименования проверяют, что ключ дополняется id
+        for i in range(7):
+            Books.objects.create(title=f'Книга {i // 2}', year=2000 + i)
+        self.expected = list(Books.objects.order_by('title', 'id').values_list('id', flat=True))
+
+    def walk(self, url, link):
+        ids, pagenums = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(book['id'] for book in response.data['results'])
+            pagenums.append(response.data['pagenum'])
+            url = response.data[link]
+        return ids, pagenums
+
+    def test_forward(self):
+        ids, pagenums = self.walk('/lib/api/books/', 'next')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pagenums, [1, 2, 3])
+
+    def test_backward_from_last(self):
+        last = self.client.get('/lib/api/books/').data['last']
+        response = self.client.get(last)
+        self.assertEqual(response.data['pagenum'], 3)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([book['id'] for book in response.data['results']], self.expected[-3:])
+        previous = self.client.get(response.data['previous']).data
+        self.assertEqual([book['id'] for book in previous['results']], self.expected[-6:-3])
+
+    def test_backward_walk_from_last(self):
+        # Страницы от последней выровнены по концу: первая неполная, строки не повторяются
+        ids, pagenums = self.walk(self.client.get('/lib/api/books/').data['last'], 'previous')
+        self.assertEqual(ids, self.expected[4:] + self.expected[1:4] + self.expected[:1])
+        self.assertEqual(pagenums, [3, 2, 1])
+
+    def test_page_size(self):
+        response = self.client.get('/lib/api/books/?page_size=5')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['total_pages'], 2)
+        next_page = self.client.get(response.data['next']).data
+        self.assertEqual([book['id'] for book in next_page['results']], self.expected[5:])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/lib/api/books/?cursor=bad').status_code, 404)
+        for data in ([1], 5, {'p': 'ab'}, {'p': ['Книга', 'x']}, {'p': ['Книга', None]}, {'n': 'x'}):
+            response = self.client.get('/lib/api/books/', {'cursor': cursor_param(data)})
+            self.assertEqual(response.status_code, 404, data)
+
+    def test_total_pages_modes(self):
+        with self.settings(BOOKS_TOTAL_PAGES=None, RESPONSE_CACHE_ENABLED=False):
+            with self.assertNumQueries(2):
+                response = self.client.get('/lib/api/books/')
+            self.assertNotIn('total_pages', response.data)
+        with self.settings(BOOKS_TOTAL_PAGES='estimated', RESPONSE_CACHE_ENABLED=False):
+            with self.assertNumQueries(3):
+                self.assertEqual(self.client.get('/lib/api/books/').data['total_pages'], 3)
+        with self.settings(BOOKS_TOTAL_PAGES='exact', RESPONSE_CACHE_ENABLED=False):
+            self.assertEqual(self.client.get('/lib/api/books/').data['total_pages'], 3)
+
+    def test_page_mode(self):
+        with self.settings(BOOKS_PAGINATION='page'):
+            response = self.client.get('/lib/api/books/?page=3')
+        self.assertEqual(response.data['pagenum'], 3)
+        self.assertEqual([book['id'] for book in response.data['results']], self.expected[6:])
+
+
+class CommentsFeedTests(TestCase):
+    """
+    Постраничная лента комментариев с догрузкой новых
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book, self.other = create_books(2, comments_per_book=0)
+        self.comments = [Comments.objects.create(content=f'Комментарий {i}', book=self.book) for i in range(5)]
+        Comments.objects.create(content='Чужой', book=self.other)
+
+    def test_pages_newest_first(self):
+        ids, url = [], f'/lib/api/comments/{self.book.pk}/?page_size=2'
+        while url:
+            data = self.client.get(url).data
+            self.assertLessEqual(len(data['results']), 2)
+            ids.extend(comment['id'] for comment in data['results'])
+            url = data['next']
+        self.assertEqual(ids, [comment.id for comment in reversed(self.comments)])
+
+    def test_after_id(self):
+        response = self.client.get(f'/lib/api/comments/{self.book.pk}/?after_id={self.comments[2].id}')
+        self.assertEqual([c['id'] for c in response.data['results']], [self.comments[4].id, self.comments[3].id])
+
+    def test_since(self):
+        since = self.comments[3].time_creation.isoformat()
+        response = self.client.get(f'/lib/api/comments/{self.book.pk}/', {'since': since})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.comments[4].id])
+        self.assertEqual(self.client.get('/lib/api/comments/?since=вчера').status_code, 400)
+
+    def test_invalid_cursor(self):
+        for data in ({'p': ['zzz', 1]}, {'p': [self.comments[0].time_creation.isoformat(), 'x']}):
+            response = self.client.get(f'/lib/api/comments/{self.book.pk}/', {'cursor': cursor_param(data)})
+            self.assertEqual(response.status_code, 404, data)
+
+    def test_all_comments_paged(self):
+        with self.settings(COMMENTS_PAGE_SIZE=4):
+            data = self.client.get('/lib/api/comments/').data
+        self.assertEqual(len(data['results']), 4)
+        self.assertIsNotNone(data['next'])
+
+
+class BatchedRelationsTests(TestCase):
+    """
+    Запись книги/автора: авторы (книги) ищутся одним запросом, связи меняются разницей
+    """
+    def setUp(self):
+        self.client = APIClient()
+
+    @staticmethod
+    def authors_payload(count, start=0):
+        return [{'surname': f'Фамилия {i}', 'name': 'Имя', 'patronymic': 'Отчество'} for i in range(start, start + count)]
+
+    def test_create_book_query_count_is_constant(self):
+        Authors.objects.create(surname='Фамилия 0', name='Имя', patronymic='Отчество')
+        for count in (2, 20):
+            payload = {'title': f'Книга {count}', 'year': 2000, 'authors': self.authors_payload(count)}
+            # savepoint + книга + поиск авторов + bulk_create + дочитывание + проверка связей + вставка связей
+            # + отметки updated_at книги и авторов + пересчёт authors_display (чтение и запись) + авторы для ответа
+            with self.assertNumQueries(13):
+                response = self.client.post('/lib/api/books/', payload, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(Books.objects.get(title=f'Книга {count}').authors.count(), count)
+        self.assertEqual(Authors.objects.count(), 20)
+
+    def test_put_book_applies_diff(self):
+        book = Books.objects.create(title='Книга', year=2000)
+        book.authors.add(*[Authors.objects.create(surname=f'Фамилия {i}', name='Имя', patronymic='Отчество')
+                           for i in range(3)])
+        kept = set(book.authors.filter(surname__in=['Фамилия 1', 'Фамилия 2']).values_list('id', flat=True))
+
+        payload = {'title': 'Книга', 'year': 2001, 'authors': self.authors_payload(3, start=1)}
+        response = self.client.put(f'/lib/api/book/{book.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        current = set(book.authors.values_list('id', flat=True))
+        self.assertTrue(kept < current)
+        self.assertEqual(len(current), 3)
+        self.assertFalse(book.authors.filter(surname='Фамилия 0').exists())
+
+    def test_null_patronymic_matches_existing(self):
+        Authors.objects.create(surname='Гомер', name='Гомер', patronymic=None)
+        payload = {'title': 'Илиада', 'year': None,
+                   'authors': [{'surname': 'Гомер', 'name': 'Гомер', 'patronymic': None}]}
+        self.client.post('/lib/api/books/', payload, format='json')
+        self.assertEqual(Authors.objects.count(), 1)
+
+    def test_put_author_books(self):
+        author = Authors.objects.create(surname='Перумов', name='Николай', patronymic='Даниилович')
+        author.books.add(Books.objects.create(title='Старая', year=1990))
+        payload = {'surname': 'Перумов', 'name': 'Николай', 'patronymic': 'Даниилович', 'year': 1963,
+                   'books': [{'title': 'Эльфийский клинок', 'year': 1993}, {'title': 'Старая', 'year': 1990}]}
+        response = self.client.put(f'/lib/api/author/{author.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(author.books.values_list('title', flat=True)), ['Старая', 'Эльфийский клинок'])
+
+
+class ImportCatalogTests(TestCase):
+    """
+    manage.py import_catalog
+    """
+    def run_import(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command('import_catalog', file.name, *args, stdout=io.StringIO())
+
+    def test_jsonl_deduplicates(self):
+        Authors.objects.create(surname='Лукьяненко', name='Сергей', patronymic='Васильевич')
+        rows = [
+            {'title': 'Геном', 'year': 1999,
+             'authors': [{'surname': 'Лукьяненко', 'name': 'Сергей', 'patronymic': 'Васильевич'}]},
+            {'title': 'Ночной дозор', 'year': 1998,
+             'authors': [{'surname': 'Лукьяненко', 'name': 'Сергей', 'patronymic': 'Васильевич'},
+                         {'surname': 'Васильев', 'name': 'Владимир', 'patronymic': None}]},
+            {'title': 'Геном', 'year': 1999, 'authors': []},
+            {'title': '', 'year': 2000, 'authors': []},
+        ]
+        content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows)
+        self.run_import(content, '.jsonl', '--batch-size', '2')
+        self.run_import(content, '.jsonl')
+
+        self.assertEqual(Books.objects.count(), 2)
+        self.assertEqual(Authors.objects.count(), 2)
+        night_watch = Books.objects.get(title='Ночной дозор')
+        self.assertEqual(sorted(night_watch.authors.values_list('surname', flat=True)), ['Васильев', 'Лукьяненко'])
+
+    def test_csv(self):
+        content = 'title,year,authors\nНе время для драконов,1997,Перумов Николай Даниилович;Лукьяненко Сергей\n'
+        self.run_import(content, '.csv')
+        book = Books.objects.get()
+        self.assertEqual(book.year, 1997)
+        self.assertEqual(book.authors.count(), 2)
+        self.assertIsNone(Authors.objects.get(surname='Лукьяненко').patronymic)
+
+
+class AuthorsNaturalKeyTests(TestCase):
+    """
+    Нормализованный ключ ФИО, кэш поиска авторов и объединение дубликатов
+    """
+    def setUp(self):
+        authors_cache.clear()
+        self.addCleanup(authors_cache.clear)
+
+    def test_normalized_key_matches(self):
+        author = Authors.objects.create(surname='Лукьяненко', name='Сергей', patronymic=None)
+        ids = resolve_authors([{'surname': ' лукьяненко ', 'name': 'СЕРГЕЙ', 'patronymic': ''}])
+        self.assertEqual(ids, [author.pk])
+
+    def test_cache_checked_against_database(self):
+        author = Authors.objects.create(surname='Пелевин', name='Виктор', patronymic='Олегович')
+        data = [{'surname': 'Пелевин', 'name': 'Виктор', 'patronymic': 'Олегович'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_authors(data)
+        # id из кэша сверяется с БД одним запросом
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_authors(data), [author.pk])
+
+        # Переименование в другом процессе (без сигналов в этом): устаревший id из кэша не используется
+        Authors.objects.filter(pk=author.pk).update(surname='Пелевин-Старший',
+                                                    natural_key='пелевин-старший|виктор|олегович')
+        ids = resolve_authors(data)
+        self.assertNotEqual(ids, [author.pk])
+        self.assertEqual(Authors.objects.get(pk=ids[0]).surname, 'Пелевин')
+
+        # Удаление в другом процессе: кэш указывает на несуществующий id
+        authors_cache.set(author.natural_key, [999999])
+        self.assertEqual(resolve_authors(data), ids)
+
+    def test_duplicate_author_rejected(self):
+        Authors.objects.create(surname='Стругацкий', name='Аркадий', patronymic='Натанович')
+        client = APIClient()
+        payload = {'surname': 'Стругацкий', 'name': 'аркадий', 'patronymic': 'Натанович', 'year': 1925, 'books': []}
+        self.assertEqual(client.post('/lib/api/authors/', payload, format='json').status_code, 400)
+        self.assertEqual(client.post('/lib/api/authors/', [payload], format='json').status_code, 400)
+        other = Authors.objects.create(surname='Стругацкий', name='Борис', patronymic='Натанович')
+        self.assertEqual(client.put(f'/lib/api/author/{other.pk}/', payload, format='json').status_code, 400)
+        self.assertEqual(Authors.objects.count(), 2)
+
+
+class MergeDuplicateAuthorsMigrationTests(TransactionTestCase):
+    """
+    Миграция 0012: дубликаты по ключу ФИО объединяются перед уникальным ограничением
+    """
+    def tearDown(self):
+        call_command('migrate', 'core', verbosity=0)
+
+    def test_merge(self):
+        call_command('migrate', 'core', '0011', verbosity=0)
+        loader = MigrationExecutor(connections['default']).loader
+        apps = loader.project_state(('core', '0011_denormalized_read_columns')).apps
+        HistoricalBooks, HistoricalAuthors = apps.get_model('core', 'Books'), apps.get_model('core', 'Authors')
+        keeper = HistoricalAuthors.objects.create(surname='Стругацкий', name='Аркадий', patronymic='Натанович',
+                                                  natural_key='стругацкий|аркадий|натанович')
+        duplicate = HistoricalAuthors.objects.create(surname='Стругацкий', name='аркадий', patronymic='Натанович',
+                                                     natural_key='стругацкий|аркадий|натанович', year=1925)
+        book = HistoricalBooks.objects.create(title='Пикник на обочине', year=1972)
+        book.authors.add(keeper, duplicate)
+
+        call_command('migrate', 'core', '0012', verbosity=0)
+
+        self.assertEqual(list(Authors.objects.values_list('pk', 'year')), [(keeper.pk, 1925)])
+        self.assertEqual(list(Books.objects.get(pk=book.pk).authors.values_list('pk', flat=True)), [keeper.pk])
+
+
+class ResponseCacheTests(TestCase):
+    """
+    Кэш ответов читающих API с поколениями
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = create_books(1)[0]
+
+    def test_hit_after_miss(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    def test_writes_invalidate(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        self.client.get(url)
+        self.client.post('/lib/api/comments/', {'content': 'Новый', 'book': self.book.pk}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['comments_count'], 3)
+
+        self.client.get('/lib/api/authors/')
+        payload = {'title': 'Новое название', 'year': 2000, 'authors': []}
+        self.client.put(url, payload, format='json')
+        self.assertEqual(self.client.get(url).json()['title'], 'Новое название')
+
+    def test_sticky_client_bypasses_cache(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        self.client.get(url)
+        self.client.cookies[STICKY_COOKIE] = str(int(time.time()) + 60)
+        hits = response_cache.hits
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'BYPASS')
+        self.assertEqual(response_cache.hits, hits)
+
+    def test_no_html_or_logged_in_responses(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        self.client.force_login(User.objects.create_user('rv_alice'))
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response['X-Cache'], 'BYPASS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'BYPASS')
+        self.client.logout()
+
+        # HTML browsable API не кэшируется и без входа
+        for _ in range(2):
+            response = self.client.get(url, HTTP_ACCEPT='text/html')
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertNotContains(response, 'rv_alice')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_stats(self):
+        self.client.get('/lib/api/authors/')
+        self.client.get('/lib/api/authors/')
+        stats = self.client.get('/lib/api/stats/cache/').json()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['invalidations'], 1)
+
+    def test_stats_access(self):
+        remote = {'REMOTE_ADDR': '203.0.113.5'}
+        self.assertEqual(self.client.get('/lib/api/stats/cache/', **remote).status_code, 403)
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/lib/api/stats/cache/', HTTP_AUTHORIZATION='Bearer secret', **remote)
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get('/lib/api/stats/cache/', **remote).status_code, 403)
+
+
+class SQLiteCacheTests(TestCase):
+    """
+    Бэкенд кэша в файле SQLite
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(os.path.join(directory.name, 'cache.sqlite3'),
+                                 {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 5}})
+
+    def test_operations(self):
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('n', 1))
+        self.assertEqual(self.cache.incr('n', 2), 3)
+        self.assertEqual(self.cache.get_many(['a', 'n', 'missing']), {'a': {'x': 1}, 'n': 3})
+        self.cache.set('old', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('old'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_cull_counts_evictions(self):
+        for i in range(15):
+            self.cache.set(f'key{i}', i, timeout=100 + i)
+        self.assertGreater(self.cache.evictions, 0)
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(self.cache.get('key14'), 14)
+
+
+class ConditionalGetTests(TestCase):
+    """
+    ETag / Last-Modified / 304
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = create_books(1)[0]
+
+    def assertNotModifiedAfter(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.settings(RESPONSE_CACHE_ENABLED=False), self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(not_modified.status_code, 304)
+        return etag
+
+    def test_every_read_view(self):
+        author = self.book.authors.first()
+        comment = self.book.comments.first()
+        for url in ('/lib/api/books/', f'/lib/api/book/{self.book.pk}/', '/lib/api/authors/',
+                    f'/lib/api/author/{author.pk}/', '/lib/api/comments/', f'/lib/api/comments/{self.book.pk}/',
+                    f'/lib/api/comment/{comment.pk}/', f'/lib/book/{self.book.pk}/'):
+            with self.subTest(url=url):
+                self.assertNotModifiedAfter(url)
+
+    def test_cached_response_answers_304(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_validators_without_count(self):
+        older_author = self.book.authors.first()
+        create_books(1)
+        for url, deleted in (('/lib/api/books/', self.book), ('/lib/api/authors/', older_author)):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.settings(RESPONSE_CACHE_ENABLED=False), \
+                        CaptureQueriesContext(connections['default']) as queries:
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertEqual(len(queries), 1)
+                self.assertNotIn('COUNT', queries[0]['sql'])
+                # Удаление строки, изменённой не последней, - тоже новое состояние списка
+                deleted.delete()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_update_etag(self):
+        url = f'/lib/api/book/{self.book.pk}/'
+        etag = self.client.get(url)['ETag']
+        Comments.objects.create(content='Новый', book=self.book)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        author = self.book.authors.first()
+        author.name = 'Другое имя'
+        author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Другое имя', response.json()['authors'][0])
+
+        # Наименование книги - в ответах её авторов
+        author = self.book.authors.first()
+        author_url = f'/lib/api/author/{author.pk}/'
+        etags = {url: self.client.get(url)['ETag'] for url in (author_url, '/lib/api/authors/')}
+        self.assertEqual(self.client.get(author_url, HTTP_IF_NONE_MATCH=etags[author_url]).status_code, 304)
+        payload = {'title': 'Переименованная', 'year': self.book.year, 'authors': self.book.authors_display}
+        self.assertEqual(self.client.put(url, payload, format='json').status_code, 200)
+        for target, etag in etags.items():
+            response = self.client.get(target, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Переименованная', response.content.decode())
+
+        etag = self.client.get('/lib/api/authors/')['ETag']
+        self.book.authors.remove(author)
+        self.assertEqual(self.client.get('/lib/api/authors/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DenormalizedFieldsTests(TestCase):
+    """
+    Authors.full_name, Books.authors_display и Books.comments_count следуют за изменениями
+    """
+    def setUp(self):
+        self.book = create_books(1, authors_per_book=2, comments_per_book=3)[0]
+        self.author = self.book.authors.order_by('pk').first()
+
+    def display(self):
+        return Books.objects.values_list('authors_display', 'comments_count').get(pk=self.book.pk)
+
+    def test_comments_count(self):
+        self.assertEqual(self.display()[1], 3)
+        Comments.objects.create(content='Ещё', book=self.book)
+        self.book.comments.first().delete()
+        self.assertEqual(self.display()[1], 3)
+        self.book.comments.filter(content='Ещё').delete()
+        self.assertEqual(self.display()[1], 2)
+
+    def test_book_deletes_comments_at_once(self):
+        other = create_books(1, comments_per_book=20)[0]
+        with CaptureQueriesContext(connections['default']) as context:
+            other.delete()
+        deletes = [query['sql'] for query in context.captured_queries if 'DELETE FROM "core_comments"' in query['sql']]
+        self.assertEqual(len(deletes), 1)
+        self.assertNotIn('"core_comments"."id" IN', deletes[0])
+        self.assertEqual(self.display()[1], 3)
+
+    def test_authors_display(self):
+        self.assertEqual(self.display()[0], ['Фамилия 0-0 Имя Отчество', 'Фамилия 0-1 Имя Отчество'])
+
+        self.author.surname = 'Другая'
+        self.author.save()
+        self.assertEqual(self.display()[0][0], 'Другая Имя Отчество')
+
+        self.book.authors.remove(self.author)
+        self.assertEqual(self.display()[0], ['Фамилия 0-1 Имя Отчество'])
+        self.author.books.add(self.book)
+        self.assertEqual(len(self.display()[0]), 2)
+
+        self.author.delete()
+        self.assertEqual(self.display()[0], ['Фамилия 0-1 Имя Отчество'])
+
+    def test_check_and_repair(self):
+        Books.objects.filter(pk=self.book.pk).update(authors_display=[], comments_count=0)
+        Authors.objects.filter(pk=self.author.pk).update(full_name='')
+
+        out = io.StringIO()
+        call_command('check_denormalized', stdout=out)
+        self.assertIn('авторов - 1, книг - 1', out.getvalue())
+
+        call_command('check_denormalized', '--repair', stdout=io.StringIO())
+        self.assertEqual(self.display(), (['Фамилия 0-0 Имя Отчество', 'Фамилия 0-1 Имя Отчество'], 3))
+        out = io.StringIO()
+        call_command('check_denormalized', stdout=out)
+        self.assertIn('Расхождений нет', out.getvalue())
+
+
+class FastReadTests(TestCase):
+    """
+    Быстрый путь чтения (core.readers, FastJSONRenderer) выдаёт те же байты, что и сериализаторы DRF
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = create_books(4, authors_per_book=2, comments_per_book=3)[1]
+        Books.objects.create(title='Без года\u2028и авторов', year=None)
+        Comments.objects.create(content='Строка\u2029"кавычки"', book=self.book)
+
+    def test_same_bytes(self):
+        author = self.book.authors.first()
+        comment = self.book.comments.first()
+        for url in ('/lib/api/books/', '/lib/api/books/?page_size=10', f'/lib/api/book/{self.book.pk}/',
+                    '/lib/api/books/?fields=title,comments&expand=authors',
+                    f'/lib/api/book/{self.book.pk}/?expand=comments,authors',
+                    '/lib/api/authors/', f'/lib/api/author/{author.pk}/', '/lib/api/comments/',
+                    f'/lib/api/comments/{self.book.pk}/', f'/lib/api/comment/{comment.pk}/'):
+            with self.subTest(url=url):
+                with self.settings(RESPONSE_CACHE_ENABLED=False, FAST_READ_ENABLED=True):
+                    fast = self.client.get(url)
+                with self.settings(RESPONSE_CACHE_ENABLED=False, FAST_READ_ENABLED=False):
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {'date': self.book.updated_at, 1: [None, 'ё\u2028'], 'big': 2 ** 70, 'nested': {'x': (1, 2)}}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertIn(b'\n', FastJSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_serializers', '--sizes', '5', '--repeat', '1', stdout=out)
+        self.assertIn('comments', out.getvalue())
+        self.assertFalse(Books.objects.filter(title__startswith='Бенчмарк').exists())
+
+
+class AsyncReadTests(TestCase):
+    """
+    Асинхронные представления и поток комментариев (server-sent events)
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_books(2, comments_per_book=3)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_same_responses(self):
+        for sync_url, async_url in ((f'/lib/api/book/{self.book.pk}/', f'/lib/api/async/book/{self.book.pk}/'),
+                                    (f'/lib/api/comments/{self.book.pk}/?page_size=2',
+                                     f'/lib/api/async/comments/{self.book.pk}/?page_size=2')):
+            with self.subTest(url=async_url), self.settings(RESPONSE_CACHE_ENABLED=False):
+                response = self.client.get(async_url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content.replace(b'/async', b''), self.client.get(sync_url).content)
+                not_modified = self.client.get(async_url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(not_modified.status_code, 304)
+
+        self.assertEqual(self.client.get('/lib/api/async/book/0/').status_code, 404)
+        self.assertEqual(self.client.get(f'/lib/api/async/comments/{self.book.pk}/?after_id=x').status_code, 400)
+
+    def test_cached_book(self):
+        url = f'/lib/api/async/book/{self.book.pk}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_stream_without_asgi(self):
+        self.assertEqual(self.client.get(f'/lib/api/comments/{self.book.pk}/stream/').status_code, 204)
+
+    def create_comment(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Comments.objects.create(content=content, book=self.book)
+
+    def stream(self, book_id, last_event_id=None):
+        headers = [(b'last-event-id', str(last_event_id).encode())] if last_event_id is not None else []
+        return ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'method': 'GET', 'path': f'/lib/api/comments/{book_id}/stream/',
+            'query_string': b'', 'headers': headers,
+        })
+
+    async def test_stream_pushes_new_comments(self):
+        first = await sync_to_async(self.book.comments.order_by('id').first)()
+        communicator = self.stream(self.book.pk, last_event_id=first.pk)
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertIn(b'retry:', (await communicator.receive_output(1))['body'])
+
+        # Пропущенные после Last-Event-ID - из БД
+        missed = [(await communicator.receive_output(1))['body'] for _ in range(2)]
+        self.assertTrue(all(event.startswith(b'id: ') for event in missed))
+
+        comment = await sync_to_async(self.create_comment)('Новый\nкомментарий')
+        event = (await communicator.receive_output(1))['body']
+        self.assertTrue(event.startswith(f'id: {comment.pk}\nevent: comment\ndata: '.encode()))
+        self.assertEqual(json.loads(event.split(b'data: ', 1)[1])['content'], 'Новый\nкомментарий')
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+        self.assertFalse(comments_hub.has_subscribers(self.book.pk))
+
+    async def test_stream_out_of_order_commits(self):
+        create = sync_to_async(lambda: [Comments.objects.create(content=f'Поздний {i}', book=self.book)
+                                        for i in range(3)])
+        with self.settings(COMMENTS_STREAM_QUEUE_SIZE=2):
+            communicator = self.stream(self.book.pk)
+            await communicator.send_input({'type': 'http.request'})
+            await communicator.receive_output(1)
+            await communicator.receive_output(1)
+            low, middle, high = await create()
+            # Фиксируются в обратном порядке id; третий не помещается в очередь и дочитывается из БД
+            for comment in (high, middle, low):
+                comments_hub.publish(self.book.pk, {'id': comment.pk, 'time_creation': comment.time_creation,
+                                                    'content': comment.content})
+            events = [(await communicator.receive_output(1))['body'] for _ in range(3)]
+            self.assertTrue(await communicator.receive_nothing(0.2))
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(1)
+        self.assertEqual([int(event.split(b'\n', 1)[0][4:]) for event in events], [high.pk, low.pk, middle.pk])
+
+    async def test_stream_head(self):
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'method': 'HEAD', 'path': f'/lib/api/comments/{self.book.pk}/stream/',
+            'query_string': b'', 'headers': []})
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual((await communicator.receive_output(1)), {'type': 'http.response.body', 'body': b''})
+        await communicator.wait(1)
+        self.assertFalse(comments_hub.has_subscribers(self.book.pk))
+
+    def test_middleware_not_adapted(self):
+        # Под ASGI цепочка middleware асинхронная: асинхронные представления не уходят в поток
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_async_view_through_middleware(self):
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'method': 'GET', 'path': f'/lib/api/async/book/{self.book.pk}/',
+            'query_string': b'', 'headers': [(b'host', b'testserver')]})
+        with self.settings(METRICS_SAMPLE_RATE=1.0, RESPONSE_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver']):
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        # Запросы из потока sync_to_async учтены в разбивке
+        self.assertIn(b'desc="2 queries"', dict(start['headers'])[b'Server-Timing'])
+
+    async def test_stream_unknown_book(self):
+        communicator = self.stream(0)
+        await communicator.send_input({'type': 'http.request'})
+        self.assertEqual((await communicator.receive_output(1))['status'], 404)
+
+
+class SQLiteProfileTests(TestCase):
+    """
+    Профиль БД 'production': прагмы, BEGIN IMMEDIATE, проверка постоянных соединений
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'profile.sqlite3')
+        connections.databases['profile'] = {**settings.DATABASE_PROFILES['production'], 'NAME': self.path}
+        self.addCleanup(connections.databases.pop, 'profile')
+        self.db = connections['profile']
+        self.addCleanup(connections.__delitem__, 'profile')
+        self.addCleanup(self.db.close)
+
+    def test_pragmas(self):
+        self.db.ensure_connection()
+        self.assertEqual(sqlite.pragma(self.db, 'journal_mode'), 'wal')
+        self.assertEqual(sqlite.pragma(self.db, 'synchronous'), 1)
+        self.assertEqual(sqlite.pragma(self.db, 'busy_timeout'), 20000)
+        self.assertEqual(sqlite.pragma(self.db, 'temp_store'), 2)
+
+    def test_atomic_takes_write_lock(self):
+        with transaction.atomic(using='profile'):
+            self.db.cursor().execute('SELECT 1')
+            other = sqlite3.connect(self.path, timeout=0)
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+            other.close()
+
+    def test_health_check_reopens_connection(self):
+        self.db.ensure_connection()
+        self.db.connection.close()
+        sqlite.check_connections(connections)
+        self.assertIsNone(self.db.connection)
+        self.assertEqual(self.db.cursor().execute('SELECT 1').fetchone(), (1,))
+
+    def test_stress_command(self):
+        out = io.StringIO()
+        call_command('stress_sqlite', '--seconds', '0.3', '--readers', '2', '--writers', '2', stdout=out)
+        production = out.getvalue().splitlines()[-1].split()
+        self.assertEqual(production[0], 'production')
+        self.assertEqual(production[-1], '0.0%')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплики, закрепление за основной БД после записи.
+    TransactionTestCase: backup API копирует только зафиксированные данные.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica_test'] = {**settings.DATABASE_PROFILES['default'],
+                                                 'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        self.addCleanup(connections.databases.pop, 'replica_test')
+        self.addCleanup(connections.__delitem__, 'replica_test')
+        self.addCleanup(lambda: connections['replica_test'].close())
+        replicas = self.settings(DATABASE_REPLICAS=['replica_test'], RESPONSE_CACHE_ENABLED=False)
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+
+        self.old = Books.objects.create(title='Старая', year=2000)
+        call_command('refresh_replicas', stdout=io.StringIO())
+        self.new = Books.objects.create(title='Новая', year=2001)
+
+    def titles(self):
+        return [book['title'] for book in self.client.get('/lib/api/books/?page_size=10').data['results']]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.titles(), ['Старая'])
+        self.assertEqual(self.client.get(f'/lib/api/book/{self.new.pk}/').status_code, 404)
+        # Представления без replica_reads читают основную БД
+        self.assertEqual(self.client.get(f'/lib/api/async/book/{self.new.pk}/').status_code, 200)
+
+    def test_total_pages_from_replica(self):
+        self.assertEqual(self.client.get('/lib/api/books/?page_size=1').data['total_pages'], 1)
+
+    def test_write_sticks_to_primary(self):
+        response = self.client.post('/lib/api/comments/', {'content': 'Свой', 'book': self.new.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.titles(), ['Новая', 'Старая'])
+        self.assertEqual(self.client.get(f'/lib/api/comments/{self.new.pk}/').data['results'][0]['content'], 'Свой')
+
+        self.client.cookies[STICKY_COOKIE] = '0'
+        self.assertEqual(self.titles(), ['Старая'])
+
+    def test_migrations_skip_replicas(self):
+        router = PrimaryReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica_test', 'core'))
+        self.assertTrue(router.allow_migrate('default', 'core'))
+
+
+class SearchTests(TestCase):
+    """
+    Полнотекстовый поиск /lib/api/search/
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = Books.objects.create(title='Ёжик в тумане', year=1975)
+        self.book.authors.add(Authors.objects.create(surname='Козлов', name='Сергей', patronymic='Григорьевич'))
+        self.other = Books.objects.create(title='Ночной дозор', year=1998)
+        self.comment = Comments.objects.create(content='Про ёжика и лошадь', book=self.other)
+
+    def search(self, query):
+        response = self.client.get('/lib/api/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_cyrillic_prefix_and_yo(self):
+        results = self.search('ЕЖИК')
+        self.assertEqual([(r['type'], r['id']) for r in results], [('book', self.book.pk), ('comment', self.comment.pk)])
+        self.assertIn('<mark>', results[0]['snippet'])
+        self.assertEqual(results[1]['title'], 'Ночной дозор')
+
+    def test_triggers_follow_changes(self):
+        self.assertEqual(self.search('козлов')[0]['id'], self.book.pk)
+        author = self.book.authors.get()
+        author.surname = 'Норштейн'
+        author.save()
+        self.assertEqual(self.search('козлов'), [])
+        self.assertEqual(self.search('норштейн')[0]['id'], self.book.pk)
+
+        self.book.authors.clear()
+        self.assertEqual(self.search('норштейн'), [])
+        self.comment.delete()
+        self.assertEqual(self.search('лошадь'), [])
+
+    def test_rebuild_and_escaping(self):
+        Comments.objects.create(content='<script>дозор</script>', book=self.other)
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        snippets = [r['snippet'] for r in self.search('дозор')]
+        self.assertTrue(all('<script>' not in snippet for snippet in snippets))
+        self.assertEqual(len(snippets), 2)
+
+    def test_paging_and_bad_query(self):
+        for i in range(3):
+            Books.objects.create(title=f'Дозор {i}')
+        response = self.client.get('/lib/api/search/', {'q': 'дозор', 'page_size': 2}).json()
+        self.assertEqual(len(response['results']), 2)
+        self.assertEqual(len(self.client.get(response['next']).json()['results']), 2)
+        self.assertEqual(self.client.get('/lib/api/search/', {'q': ''}).status_code, 400)
+        self.assertEqual(self.search('" OR *'), [])
+
+
+class SeedAndBenchmarkTests(TestCase):
+    """
+    manage.py seed_library и benchmark_endpoints
+    """
+    def seed(self, *args):
+        call_command('seed_library', '--books', '30', '--authors', '20', '--comments', '200', '--batch-size', '7',
+                     *args, stdout=io.StringIO())
+
+    def snapshot(self):
+        return (list(Books.objects.order_by('id').values_list('title', 'year', 'authors_display', 'comments_count')),
+                list(Comments.objects.order_by('id').values_list('time_creation', 'content', 'book__title')))
+
+    def test_seed_is_deterministic_and_consistent(self):
+        self.seed()
+        self.assertEqual((Books.objects.count(), Authors.objects.count(), Comments.objects.count()), (30, 20, 200))
+        first = self.snapshot()
+        out = io.StringIO()
+        call_command('check_denormalized', stdout=out)
+        self.assertIn('Расхождений нет', out.getvalue())
+
+        Books.objects.all().delete()
+        Authors.objects.all().delete()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        self.seed('--seed', '2')
+        self.assertNotEqual(self.snapshot()[0][30:], first[0])
+        self.assertEqual(Authors.objects.values('natural_key').distinct().count(), 40)
+
+    def test_benchmark_baseline(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_endpoints', '--requests', '2', '--output', path, stdout=io.StringIO())
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+            out = io.StringIO()
+            call_command('benchmark_endpoints', '--requests', '2', '--compare', path, stdout=out)
+
+        endpoints = baseline['endpoints']
+        self.assertIn('api/book/<int:pk>/', endpoints)
+        self.assertNotIn('api/comments/<int:book_id>/stream/', endpoints)
+        self.assertEqual(endpoints['api/books/']['queries'], 3)
+        self.assertTrue(all(result['p99_ms'] >= result['p50_ms'] > 0 for result in endpoints.values()))
+        self.assertIn('p95 ', out.getvalue())
+
+
+class MetricsTests(TestCase):
+    """
+    core.metrics: Server-Timing и /metrics
+    """
+    def setUp(self):
+        create_books(2)
+        for histogram in metrics.HISTOGRAMS:
+            histogram.reset()
+
+    def test_server_timing_and_exposition(self):
+        with self.settings(METRICS_SAMPLE_RATE=1.0):
+            response = self.client.get('/lib/api/books/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="3 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        labels = 'method="GET",route="lib/api/books/"'
+        self.assertIn(f'library_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'library_request_sql_queries_bucket{{{labels},le="2"}} 0', text)
+        self.assertIn(f'library_request_sql_queries_bucket{{{labels},le="3"}} 1', text)
+        self.assertIn(f'library_response_size_bytes_sum{{{labels}}}', text)
+
+    def test_sampling(self):
+        with self.settings(METRICS_SAMPLE_RATE=0):
+            response = self.client.get(f'/lib/book/{Books.objects.first().pk}/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        text = metrics.exposition()
+        self.assertIn('library_request_duration_seconds_count{method="GET",route="book-detail"} 1', text)
+        self.assertNotIn('library_request_sql_queries_count', text)
+
+    def test_access(self):
+        remote = {'REMOTE_ADDR': '203.0.113.5', 'HTTP_X_FORWARDED_FOR': '127.0.0.1'}
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics', **remote).status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong', **remote).status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret', **remote).status_code, 200)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer None', **remote).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics', **remote).status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """
+    core.profiling и manage.py perf_report
+    """
+    def setUp(self):
+        create_books(2)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_profile_by_token_only(self):
+        with self.settings(PROFILE_DIR=self.directory, SLOW_QUERY_MS=None):
+            forged = self.client.get('/lib/api/comments/', HTTP_X_PROFILE='подделка')
+            self.assertFalse(forged.has_header('X-Profile-Id'))
+            response = self.client.get('/lib/api/comments/', HTTP_X_PROFILE=profiling.make_token())
+        name = response['X-Profile-Id']
+        self.assertTrue(name.endswith('GET-lib_api_comments'))
+        self.assertEqual(sorted(os.listdir(self.directory)), [f'{name}.collapsed', f'{name}.prof'])
+        with open(os.path.join(self.directory, f'{name}.collapsed'), encoding='utf-8') as file:
+            stack, microseconds = file.readline().rsplit(' ', 1)
+        self.assertGreater(int(microseconds), 0)
+
+        out = io.StringIO()
+        call_command('perf_report', '--dir', self.directory, stdout=out)
+        self.assertIn('Профилей: 1', out.getvalue())
+        self.assertIn('views.py', out.getvalue())
+
+    async def test_profile_under_asgi(self):
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'http', 'method': 'GET', 'path': '/lib/api/authors/', 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'x-profile', profiling.make_token().encode())]})
+        with self.settings(PROFILE_DIR=self.directory, SLOW_QUERY_MS=0, ALLOWED_HOSTS=['testserver'],
+                           RESPONSE_CACHE_ENABLED=False), self.assertLogs('core.profiling', 'WARNING') as logs:
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(1)
+        self.assertEqual(start['status'], 200)
+        # Синхронное представление профилируется в потоке sync_to_async, его запросы - в журнале медленных SQL
+        name = dict(start['headers'])[b'X-Profile-Id'].decode()
+        with open(os.path.join(self.directory, f'{name}.collapsed'), encoding='utf-8') as file:
+            self.assertIn('views.py', file.read())
+        self.assertIn('SCAN core_authors', '\n'.join(logs.output))
+
+    def test_slow_queries_and_full_scans(self):
+        with self.settings(PROFILE_DIR=self.directory, SLOW_QUERY_MS=0), \
+                self.assertLogs('core.profiling', 'WARNING') as logs:
+            self.client.get('/lib/api/authors/')
+        self.assertIn('SCAN core_authors', '\n'.join(logs.output))
+        with open(os.path.join(self.directory, profiling.SLOW_QUERIES_FILE), encoding='utf-8') as file:
+            entries = [json.loads(line) for line in file]
+        self.assertTrue(all(entry['route'] == 'lib/api/authors/' and entry['plan'] for entry in entries))
+
+        out = io.StringIO()
+        call_command('perf_report', '--dir', self.directory, stdout=out)
+        self.assertIn('Полные просмотры таблиц: 1', out.getvalue())
+        self.assertIn('SCAN core_authors', out.getvalue())
+
+
+class SparseFieldsTests(TestCase):
+    """
+    ?fields= и ?expand= для книг (core.fieldsets)
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = create_books(1, authors_per_book=2, comments_per_book=7)[0]
+        self.url = f'/lib/api/book/{self.book.pk}/'
+
+    def test_default_has_no_nested_data(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(list(data), ['id', 'title', 'year', 'authors', 'comments_count'])
+        self.assertEqual(data['authors'], list(self.book.authors.order_by('id').values_list('full_name', flat=True)))
+        self.assertEqual(data['comments_count'], 7)
+
+    def test_fields_select_columns(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), self.settings(FAST_READ_ENABLED=fast, RESPONSE_CACHE_ENABLED=False):
+                with CaptureQueriesContext(connections['default']) as queries:
+                    data = self.client.get(self.url, {'fields': 'year,id'}).json()
+                self.assertEqual(data, {'id': self.book.pk, 'year': self.book.year})
+                self.assertNotIn('authors_display', queries[-1]['sql'])
+                self.assertNotIn('comments_count', queries[-1]['sql'])
+
+    def test_expand(self):
+        with self.settings(BOOK_LATEST_COMMENTS=3):
+            data = self.client.get(self.url, {'fields': 'title', 'expand': 'comments,authors'}).json()
+        self.assertEqual(list(data), ['title', 'authors', 'comments'])
+        self.assertEqual([author['full_name'] for author in data['authors']],
+                         list(self.book.authors.order_by('id').values_list('full_name', flat=True)))
+        latest = list(self.book.comments.order_by('-time_creation', '-id').values_list('id', flat=True)[:3])
+        self.assertEqual([comment['id'] for comment in data['comments']], latest)
+
+        page = self.client.get('/lib/api/books/', {'fields': 'comments'}).json()
+        self.assertEqual(len(page['results'][0]['comments']), 5)
+        self.assertIsNotNone(page['last'])
+
+    def test_unknown_names(self):
+        response = self.client.get(self.url, {'fields': 'id,isbn', 'expand': 'publisher'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+        response = self.client.get(f'/lib/api/async/book/{self.book.pk}/', {'expand': 'publisher'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchTests(TestCase):
+    """
+    Пакетные GET ?ids= и POST массива (core.batch)
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.books = create_books(3, authors_per_book=2, comments_per_book=2)
+
+    def test_fetch_by_ids(self):
+        ids = [self.books[2].pk, 999999, self.books[0].pk]
+        for fast in (True, False):
+            with self.subTest(fast=fast), self.settings(FAST_READ_ENABLED=fast, RESPONSE_CACHE_ENABLED=False):
+                data = self.client.get('/lib/api/books/', {'ids': ','.join(map(str, ids))}).json()
+                self.assertEqual([book['id'] for book in data['results']], [ids[0], ids[2]])
+                self.assertEqual(data['missing'], [999999])
+
+                author_ids = list(self.books[0].authors.values_list('pk', flat=True))
+                data = self.client.get('/lib/api/authors/', {'ids': ','.join(map(str, author_ids))}).json()
+                self.assertEqual([author['id'] for author in data['results']], author_ids)
+
+        response = self.client.get('/lib/api/comments/', {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+        with self.settings(BATCH_MAX_SIZE=2):
+            self.assertEqual(self.client.get('/lib/api/books/', {'ids': '1,2,3'}).status_code, 400)
+
+    def test_bulk_create_with_ids(self):
+        books = bulk_create_with_ids(Books, [Books(title=f'Пакетная {i}') for i in range(3)])
+        self.assertEqual([Books.objects.get(pk=book.pk).title for book in books], [book.title for book in books])
+
+    def test_create_books_and_authors(self):
+        author = {'surname': 'Пакетов', 'name': 'Пётр', 'patronymic': 'Петрович'}
+        response = self.client.post('/lib/api/books/', [
+            {'title': 'Первая', 'year': 2001, 'authors': [author]},
+            {'title': 'Вторая', 'year': 2002, 'authors': [author, {'surname': 'Новиков', 'name': 'Ян'}]},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([book['title'] for book in results], ['Первая', 'Вторая'])
+        self.assertEqual(Authors.objects.filter(surname='Пакетов').count(), 1)
+        second = Books.objects.get(pk=results[1]['id'])
+        self.assertEqual(second.authors_display, ['Пакетов Пётр Петрович', 'Новиков Ян None'])
+
+        response = self.client.post('/lib/api/authors/', [
+            {'surname': 'Авторов', 'name': 'Ариан', 'year': 1950, 'books': [{'title': 'Первая', 'year': 2001}]},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        first = Books.objects.get(pk=results[0]['id'])
+        self.assertEqual(first.authors_display, ['Пакетов Пётр Петрович', 'Авторов Ариан None'])
+        self.assertEqual(response.json()['results'][0]['books'], [{'title': 'Первая', 'year': 2001}])
+
+    def test_create_comments(self):
+        book = self.books[0]
+        items = [{'content': f'Пакет {i}', 'book': book.pk} for i in range(5)]
+        items.append({'content': 'Ещё', 'book': self.books[1].pk})
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post('/lib/api/comments/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 10)
+        results = response.json()['results']
+        self.assertEqual([comment['content'] for comment in results], [item['content'] for item in items])
+        self.assertEqual(list(Comments.objects.filter(pk__in=[comment['id'] for comment in results])
+                              .order_by('pk').values_list('content', flat=True)), [item['content'] for item in items])
+        book.refresh_from_db()
+        self.assertEqual(book.comments_count, 7)
+
+    def test_invalid_item_writes_nothing(self):
+        response = self.client.post('/lib/api/comments/', [
+            {'content': 'Хороший', 'book': self.books[0].pk},
+            {'content': 'Без книги', 'book': 999999},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('book', errors[1])
+        self.assertFalse(Comments.objects.filter(content='Хороший').exists())
+
+
+class TopCommentsTests(TestCase):
+    """
+    Последние комментарии книг одним запросом с ROW_NUMBER() (core.fieldsets.top_comments)
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.books = create_books(4, authors_per_book=1, comments_per_book=6)
+
+    def test_top_comments_per_book(self):
+        book_ids = [book.pk for book in self.books[:3]]
+        with CaptureQueriesContext(connections['default']) as queries:
+            rows = list(top_comments(book_ids, limit=2).values_list('book_id', 'id'))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('ROW_NUMBER() OVER', queries[0]['sql'])
+        expected = [(book.pk, pk) for book in self.books[:3]
+                    for pk in book.comments.order_by('-time_creation', '-id').values_list('id', flat=True)[:2]]
+        self.assertEqual(rows, expected)
+        self.assertFalse(top_comments([]).exists())
+
+    def test_serializers_agree(self):
+        url = '/lib/api/books/?expand=comments&page_size=3'
+        pages = []
+        for fast in (True, False):
+            with self.settings(FAST_READ_ENABLED=fast, RESPONSE_CACHE_ENABLED=False, BOOK_LATEST_COMMENTS=2):
+                pages.append(self.client.get(url).json())
+        self.assertEqual(pages[0], pages[1])
+        self.assertTrue(all(len(book['comments']) == 2 for book in pages[0]['results']))
+
+
+class StaticAssetsTests(TestCase):
+    """
+    Сборка статики с хэшами и сжатыми вариантами, отдача из STATIC_ROOT (core.staticfiles)
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = self.settings(STATIC_ROOT=self.directory, ALLOWED_HOSTS=['testserver'])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.vue = staticfiles_storage.stored_name('js/vue.js')
+
+    def test_collected_names_and_variants(self):
+        self.assertRegex(self.vue, r'^js/vue\.[0-9a-f]{12}\.js$')
+        with open(os.path.join(self.directory, self.vue), 'rb') as file, \
+                gzip.open(os.path.join(self.directory, self.vue + '.gz')) as compressed:
+            self.assertEqual(compressed.read(), file.read())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'fonts/MaterialIcons-Regular.woff2.gz')))
+        css = os.path.join(self.directory, staticfiles_storage.stored_name('css/core.css'))
+        font = os.path.basename(staticfiles_storage.stored_name('fonts/MaterialIcons-Regular.woff2'))
+        with open(css, encoding='utf-8') as file:
+            self.assertIn(f'../fonts/{font}', file.read())
+
+        response = self.client.get('/lib/books/')
+        self.assertContains(response, f'/static/{self.vue}')
+
+    def test_serving(self):
+        url = f'/static/{self.vue}'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', response['Content-Type'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content))[:8], b'var Vue=')
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        response = self.client.get('/static/js/vue.js')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response = self.client.get('/static/js/vue.js', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+
+class InitialDataTests(TestCase):
+    """
+    Первая страница данных встроена в HTML-страницы (json_script) и совпадает с ответом API
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.books = create_books(4, authors_per_book=2, comments_per_book=3)
+        settings_override = self.settings(ALLOWED_HOSTS=['testserver'], RESPONSE_CACHE_ENABLED=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_books_list(self):
+        response = self.client.get('/lib/books/')
+        self.assertEqual(response.context['books_initial'], self.client.get('/lib/api/books/').json())
+        self.assertContains(response, '<script id="books_initial" type="application/json">')
+        self.assertIn('/lib/api/books/?cursor=', response.context['books_initial']['next'])
+
+        response = self.client.get('/lib/books/', {'fields': 'isbn'})
+        self.assertIsNone(response.context['books_initial'])
+
+    def test_book_detail(self):
+        book = self.books[0]
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(f'/lib/book/{book.pk}/')
+        # Валидаторы условного GET, книга, страница комментариев
+        self.assertEqual(len(queries), 3)
+        api = self.client.get(f'/lib/api/comments/{book.pk}/').json()
+        self.assertEqual(response.context['comments_initial'], api)
+        for full_name in book.authors.values_list('full_name', flat=True):
+            self.assertContains(response, full_name)
+        # Без JavaScript - та же первая страница комментариев
+        noscript = response.content.decode().split('<noscript>')[1].split('</noscript>')[0]
+        for comment in api['results']:
+            self.assertIn(comment['content'], noscript)
+
+
+class FragmentCacheTests(TestCase):
+    """
+    Блок книги и авторов на странице книги - из кэша фрагментов по версии книги (core.fragments)
+    """
+    def setUp(self):
+        self.book = create_books(1, authors_per_book=2, comments_per_book=1)[0]
+        self.url = f'/lib/book/{self.book.pk}/'
+        settings_override = self.settings(ALLOWED_HOSTS=['testserver'])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(self.url)
+        book_queries = [query for query in queries if 'authors_display' in query['sql']]
+        return response, len(book_queries)
+
+    def test_book_read_only_on_change(self):
+        self.assertEqual(self.get()[1], 1)
+        response, book_queries = self.get()
+        self.assertEqual(book_queries, 0)
+        self.assertContains(response, self.book.title)
+
+        # Комментарии фрагмент не затрагивают
+        Comments.objects.create(content='Новый', book=self.book)
+        self.assertEqual(self.get()[1], 0)
+
+        self.book.title = 'Переименованная'
+        self.book.save()
+        response, book_queries = self.get()
+        self.assertEqual(book_queries, 1)
+        self.assertContains(response, 'Переименованная')
+
+        author = self.book.authors.first()
+        author.surname = 'Другая'
+        author.save()
+        self.assertContains(self.get()[0], 'Другая Имя Отчество')
+
+        self.book.authors.remove(author)
+        self.assertNotContains(self.get()[0], 'Другая Имя Отчество')
+
+    def test_stale_while_revalidate(self):
+        key = fragment_cache.fragment_key('book', self.book.pk)
+        with self.settings(FRAGMENT_CACHE_TIMEOUT=0):
+            self.get()
+            # Перерисовкой занят другой запрос - устаревший фрагмент без обращения к книге
+            fragment_cache.backend.add(f'{key}:refresh', 1, 10)
+            stale = fragment_cache.stale
+            response, book_queries = self.get()
+            self.assertEqual(book_queries, 0)
+            self.assertEqual(fragment_cache.stale, stale + 1)
+            self.assertContains(response, self.book.title)
+
+            fragment_cache.backend.delete(f'{key}:refresh')
+            refreshes = fragment_cache.refreshes
+            self.assertEqual(self.get()[1], 1)
+            self.assertEqual(fragment_cache.refreshes, refreshes + 1)
+
+    def test_own_cache(self):
+        self.get()
+        # Вытеснение и очистка кэша ответов фрагменты не затрагивают
+        self.assertIsNot(fragment_cache.backend, response_cache.backend)
+        response_cache.backend.clear()
+        self.assertEqual(self.get()[1], 0)
+
+    def test_deleted_book(self):
+        self.get()
+        Books.objects.filter(pk=self.book.pk).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class WriteBehindTests(TransactionTestCase):
+    """
+    Отложенная запись комментариев пакетами (core.writebehind).
+    TransactionTestCase: поток записи пишет своим соединением, данные теста должны быть зафиксированы.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.book = Books.objects.create(title='Обсуждаемая', year=2020)
+        self.addCleanup(comment_writer.stop)
+
+    def test_wait_mode(self):
+        with self.settings(COMMENTS_WRITE_BEHIND='wait', COMMENTS_WRITE_BEHIND_INTERVAL=0.2):
+            responses = []
+            threads = [threading.Thread(target=lambda i=i: responses.append(self.client.post(
+                '/lib/api/comments/', {'content': f'Всплеск {i}', 'book': self.book.pk}, format='json')))
+                for i in range(5)]
+            batches = comment_writer.batches
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        ids = sorted(response.json()['id'] for response in responses)
+        self.assertEqual(ids, sorted(Comments.objects.values_list('pk', flat=True)))
+        self.assertLess(comment_writer.batches - batches, 5)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.comments_count, 5)
+
+    def test_provisional_mode_and_drain(self):
+        with self.settings(COMMENTS_WRITE_BEHIND='provisional'):
+            response = self.client.post('/lib/api/comments/', {'content': 'Сразу', 'book': self.book.pk},
+                                        format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.json()['id'])
+        self.assertTrue(response.json()['provisional_id'])
+        comment_writer.stop()
+        self.assertTrue(Comments.objects.filter(content='Сразу').exists())
+
+    def test_backpressure(self):
+        writer = CommentWriter()
+        writer.queue = queue.Queue(1)
+        writer.start = lambda: None
+        data = {'content': 'Лишний', 'book': self.book}
+        writer.submit(data)
+        with self.settings(COMMENTS_WRITE_BEHIND_PUT_TIMEOUT=0.01), self.assertRaises(WriteQueueFull):
+            writer.submit(data)
+        self.assertEqual(writer.rejected, 1)
+
+
+class WriteThrottleTests(TestCase):
+    """
+    Корзины токенов для записи (core.throttling) в файле SQLite
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'throttle.sqlite3')
+        override = self.settings(WRITE_THROTTLE_LOCATION=self.location, ALLOWED_HOSTS=['testserver'])
+        override.enable()
+        self.addCleanup(override.disable)
+        throttling.DECISIONS.reset()
+        self.client = APIClient()
+        self.book = Books.objects.create(title='Обсуждаемая', year=2020)
+
+    def post(self, address='10.0.0.1'):
+        return self.client.post('/lib/api/comments/', {'content': 'Ещё', 'book': self.book.pk}, format='json',
+                                REMOTE_ADDR=address)
+
+    def test_client_bucket(self):
+        with self.settings(WRITE_THROTTLE_RATES={'comments': '2/min'}, WRITE_THROTTLE_GLOBAL_RATES={}):
+            self.assertEqual([self.post().status_code for _ in range(2)], [200, 200])
+            response = self.post()
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+            self.assertEqual(self.client.get(f'/lib/api/comments/{self.book.pk}/').status_code, 200)
+            self.assertEqual(self.post('10.0.0.2').status_code, 200)
+        self.assertEqual(Comments.objects.count(), 3)
+        decisions = throttling.DECISIONS.values()
+        self.assertEqual(decisions[(('scope', 'comments'), ('bucket', 'client'), ('result', 'allowed'))], 3)
+        self.assertEqual(decisions[(('scope', 'comments'), ('bucket', 'client'), ('result', 'throttled'))], 1)
+        self.assertIn('library_throttle_decisions_total{scope="comments",bucket="client",result="throttled"} 1',
+                      metrics.exposition())
+
+    def test_global_bucket_shared_between_processes(self):
+        with self.settings(WRITE_THROTTLE_RATES={'comments': '10/min'},
+                           WRITE_THROTTLE_GLOBAL_RATES={'comments': '2/min'}):
+            self.assertEqual([self.post(f'10.0.0.{i}').status_code for i in range(3)], [200, 200, 429])
+            # Другой процесс с тем же файлом видит ту же пустую корзину
+            wait, empty = throttling.SQLiteBucketStore(self.location).take([('comments:all', 2, 2 / 60, 'all')])
+            self.assertEqual(empty, 'all')
+            self.assertGreater(wait, 0)
+            stats = self.client.get('/lib/api/stats/throttle/').json()
+        self.assertEqual(stats['store'], 'sqlite')
+        self.assertEqual(stats['scopes']['comments']['all_throttled'], 1)
+        self.assertLess(stats['scopes']['comments']['all_tokens'], 1)
+        self.assertEqual(self.client.get('/lib/api/stats/throttle/', REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    def test_forwarded_for_not_trusted_without_proxies(self):
+        with self.settings(WRITE_THROTTLE_RATES={'comments': '2/min'}, WRITE_THROTTLE_GLOBAL_RATES={}):
+            statuses = [self.client.post('/lib/api/comments/', {'content': 'Ещё', 'book': self.book.pk}, format='json',
+                                         REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}').status_code
+                        for i in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            # За своим прокси клиент - последний адрес X-Forwarded-For
+            with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+                response = self.client.post('/lib/api/comments/', {'content': 'Ещё', 'book': self.book.pk},
+                                            format='json', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='192.0.2.9')
+            self.assertEqual(response.status_code, 200)
+
+    def test_batch_costs_token_per_item(self):
+        batch = [{'content': f'Пакетный {i}', 'book': self.book.pk} for i in range(3)]
+        with self.settings(WRITE_THROTTLE_RATES={'comments': '5/min'}, WRITE_THROTTLE_GLOBAL_RATES={}):
+            self.assertEqual(self.client.post('/lib/api/comments/', batch, format='json').status_code, 201)
+            self.assertEqual(self.client.post('/lib/api/comments/', batch, format='json').status_code, 429)
+            self.assertEqual(self.post('127.0.0.1').status_code, 200)
+            # Пакет больше ёмкости проходит при полной корзине и опустошает её
+            big = [{'content': f'Большой {i}', 'book': self.book.pk} for i in range(8)]
+            self.assertEqual(self.client.post('/lib/api/comments/', big, format='json',
+                                              REMOTE_ADDR='10.0.0.3').status_code, 201)
+            self.assertEqual(self.post('10.0.0.3').status_code, 429)
+        self.assertEqual(Comments.objects.count(), 12)
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('120/min'), (120, 2.0))
+        with self.assertRaises(ValueError):
+            throttling.parse_rate('10/week')
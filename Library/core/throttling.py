@@ -0,0 +1,247 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import Counter
+
+# Ограничение частоты записи (POST/PUT/PATCH/DELETE) API корзинами токенов, чтобы поток записей одного клиента
+# не занимал SQLite и чтение оставалось быстрым. WriteThrottle подключён в REST_FRAMEWORK, группа эндпоинтов -
+# атрибут throttle_scope представления ('books', 'authors', 'comments'). Запись тратит токены в двух корзинах:
+#     клиента в группе - WRITE_THROTTLE_RATES, клиент - пользователь или адрес;
+#     всей группы      - WRITE_THROTTLE_GLOBAL_RATES, общий предел записи в группу для всех клиентов.
+# Адрес - REMOTE_ADDR; X-Forwarded-For учитывается, только если REST_FRAMEWORK['NUM_PROXIES'] задан (число
+# своих прокси перед приложением): иначе клиент сменой заголовка получал бы новую корзину на каждый запрос.
+# Одна запись - один токен, пакетный POST массива (core.batch) - по токену на элемент, но не больше ёмкости
+# корзины: пакет в BATCH_MAX_SIZE элементов проходит при полной корзине.
+# Норма '60/min' - корзина на 60 токенов, пополняется равномерно (1 токен в секунду): всплеск до 60 записей,
+# дальше - не чаще нормы. Без токена - 429 с Retry-After (через сколько секунд токен появится), токены не тратятся.
+# Чтение корзины не проверяет и хранилище не трогает.
+# Хранилище корзин - WRITE_THROTTLE_LOCATION: файл SQLite, общий для всех рабочих процессов на машине
+# (None - память процесса, у каждого процесса свои корзины). Счётчики решений - в GET /metrics
+# и GET /lib/api/stats/throttle/ (по процессу).
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600,
+           'd': 86400, 'day': 86400}
+
+# Корзина, не менявшаяся дольше суток, заведомо полна - такие строки хранилища удаляются
+IDLE_SECONDS = 86400
+
+# Раз во сколько списаний хранилище удаляет простаивающие корзины
+CLEANUP_EVERY = 1000
+
+DECISIONS = Counter('library_throttle_decisions_total', 'Решения ограничителя записи по корзинам',
+                    ('scope', 'bucket', 'result'))
+
+
+def parse_rate(rate):
+    """
+    '60/min' -> (ёмкость 60, пополнение 1.0 токен/с)
+    """
+    count, _, period = rate.partition('/')
+    if period not in PERIODS or not count.isdigit() or int(count) == 0:
+        raise ValueError(f'Норма записи вида "60/min" ожидается, получено {rate!r}')
+    return int(count), int(count) / PERIODS[period]
+
+
+def refill(tokens, updated, capacity, per_second, now):
+    if tokens is None:
+        return float(capacity)
+    return min(float(capacity), tokens + max(now - updated, 0) * per_second)
+
+
+def take_tokens(current, buckets, now, cost=1):
+    """
+    Решение по корзинам [(ключ, ёмкость, токенов/с, имя)] с текущими значениями current {ключ: (токены, время)}
+    о списании cost токенов (не больше ёмкости корзины):
+    (новые значения или None, если токенов не хватает, секунды ожидания, имя пустой корзины)
+    """
+    updated, wait, empty = {}, 0.0, None
+    for key, capacity, per_second, name in buckets:
+        tokens = refill(*current.get(key, (None, None)), capacity, per_second, now)
+        need = min(cost, capacity)
+        if tokens < need:
+            if (need - tokens) / per_second > wait:
+                wait, empty = (need - tokens) / per_second, name
+        updated[key] = (tokens - need, now)
+    if empty is not None:
+        return None, wait, empty
+    return updated, 0.0, None
+
+
+class MemoryBucketStore:
+    """
+    Корзины в памяти процесса
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def take(self, buckets, cost=1):
+        with self._lock:
+            now = time.time()
+            updated, wait, empty = take_tokens(self._buckets, buckets, now, cost)
+            if updated is not None:
+                self._buckets.update(updated)
+                self._takes += 1
+                if self._takes % CLEANUP_EVERY == 0:
+                    self._buckets = {key: value for key, value in self._buckets.items()
+                                     if value[1] >= now - IDLE_SECONDS}
+            return wait, empty
+
+    def tokens(self, key, capacity, per_second):
+        with self._lock:
+            return refill(*self._buckets.get(key, (None, None)), capacity, per_second, time.time())
+
+
+class SQLiteBucketStore:
+    """
+    Корзины в файле SQLite (WAL): чтение и списание - одна IMMEDIATE-транзакция, атомарно для всех процессов
+    """
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self._path = str(path)
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            self._local.connection = connection
+        return connection
+
+    def take(self, buckets, cost=1):
+        connection = self._connection()
+        keys = [bucket[0] for bucket in buckets]
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            placeholders = ','.join('?' * len(keys))
+            rows = connection.execute(f'SELECT key, tokens, updated FROM buckets WHERE key IN ({placeholders})', keys)
+            updated, wait, empty = take_tokens({key: (tokens, at) for key, tokens, at in rows}, buckets, now, cost)
+            if updated is not None:
+                connection.executemany('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                                       [(key, tokens, at) for key, (tokens, at) in updated.items()])
+                self._takes += 1
+                if self._takes % CLEANUP_EVERY == 0:
+                    connection.execute('DELETE FROM buckets WHERE updated < ?', (now - IDLE_SECONDS,))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait, empty
+
+    def tokens(self, key, capacity, per_second):
+        row = self._connection().execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        return refill(*(row or (None, None)), capacity, per_second, time.time())
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def bucket_store():
+    """
+    Хранилище корзин по WRITE_THROTTLE_LOCATION (одно на расположение в процессе)
+    """
+    location = getattr(settings, 'WRITE_THROTTLE_LOCATION', None)
+    location = str(location) if location else None
+    with _stores_lock:
+        store = _stores.get(location)
+        if store is None:
+            store = _stores[location] = SQLiteBucketStore(location) if location else MemoryBucketStore()
+        return store
+
+
+def scope_rates(scope):
+    """
+    Нормы группы: (норма клиента, норма всей группы), None - без ограничения
+    """
+    client = getattr(settings, 'WRITE_THROTTLE_RATES', {}).get(scope)
+    overall = getattr(settings, 'WRITE_THROTTLE_GLOBAL_RATES', {}).get(scope)
+    return (parse_rate(client) if client else None), (parse_rate(overall) if overall else None)
+
+
+class WriteThrottle(BaseThrottle):
+    """
+    Корзины токенов для записи в группу эндпоинтов throttle_scope (описание - в начале модуля)
+    """
+    def __init__(self):
+        self._wait = None
+
+    def get_client(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        if api_settings.NUM_PROXIES is None:
+            return f'ip:{request.META.get("REMOTE_ADDR")}'
+        return f'ip:{self.get_ident(request)}'
+
+    @staticmethod
+    def get_cost(request):
+        """
+        Токенов за запрос: по одному на элемент пакетного POST массива, иначе один
+        """
+        if request.method == 'POST' and isinstance(request.data, list):
+            return max(len(request.data), 1)
+        return 1
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if request.method in SAFE_METHODS or scope is None or not getattr(settings, 'WRITE_THROTTLE_ENABLED', True):
+            return True
+        client_rate, overall_rate = scope_rates(scope)
+        buckets = []
+        if client_rate:
+            buckets.append((f'{scope}:{self.get_client(request)}', *client_rate, 'client'))
+        if overall_rate:
+            buckets.append((f'{scope}:all', *overall_rate, 'all'))
+        if not buckets:
+            return True
+
+        try:
+            self._wait, empty = bucket_store().take(buckets, self.get_cost(request))
+        except sqlite3.Error:
+            # Недоступное хранилище корзин не должно останавливать запись
+            logger.exception('Хранилище корзин недоступно, запись в %s пропущена без проверки', scope)
+            return True
+        if empty is not None:
+            DECISIONS.inc((('scope', scope), ('bucket', empty), ('result', 'throttled')))
+            return False
+        for *_, name in buckets:
+            DECISIONS.inc((('scope', scope), ('bucket', name), ('result', 'allowed')))
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+def stats():
+    """
+    Счётчики решений процесса и токены общих корзин групп сейчас
+    """
+    result = {}
+    for labels, value in DECISIONS.values().items():
+        labels = dict(labels)
+        scope = result.setdefault(labels['scope'], {})
+        scope[f'{labels["bucket"]}_{labels["result"]}'] = value
+    store = bucket_store()
+    for scope in getattr(settings, 'WRITE_THROTTLE_GLOBAL_RATES', {}):
+        _, overall_rate = scope_rates(scope)
+        result.setdefault(scope, {})['all_tokens'] = round(store.tokens(f'{scope}:all', *overall_rate), 3)
+    return {'store': store.name, 'scopes': result}
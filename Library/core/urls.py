@@ -1,7 +1,7 @@
 from django.urls import path
 
 from .views import BooksAPIList, BookAPI, AuthorAPI, AutorsAPIList, CommentsAPIList, CommentAPI, books_list, \
-    BookDetailView
+    BookDetailView, ResponseCacheStatsAPI, SearchAPI, ThrottleStatsAPI, book_async, book_comments_async, comments_stream
 
 urlpatterns = [
     path('api/book/<int:pk>/', BookAPI.as_view()),
@@ -11,6 +11,12 @@ urlpatterns = [
     path('api/comment/<int:pk>/', CommentAPI.as_view()),
     path('api/comments/', CommentsAPIList.as_view()),
     path('api/comments/<int:book_id>/', CommentsAPIList.as_view()),
+    path('api/comments/<int:book_id>/stream/', comments_stream),
+    path('api/async/book/<int:pk>/', book_async),
+    path('api/async/comments/<int:book_id>/', book_comments_async),
+    path('api/search/', SearchAPI.as_view()),
+    path('api/stats/cache/', ResponseCacheStatsAPI.as_view()),
+    path('api/stats/throttle/', ThrottleStatsAPI.as_view()),
     path('books/', books_list, name='books_list'),
     path('book/<int:pk>/', BookDetailView.as_view(), name='book-detail')
 ]
@@ -1,29 +1,117 @@
-from django.http import Http404
+import copy
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
 from django.views.generic import DetailView
-from rest_framework import generics
-from rest_framework.pagination import PageNumberPagination
+from django.views.generic.detail import SingleObjectMixin
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError, APIException, NotFound
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 
 
+from . import search, throttling
+from .batch import BatchMixin, create_authors, create_books, create_comments, fetch_in_order
+from .cache import CachedResponseMixin, response_cache
+from .conditional import ConditionalGetMixin, conditional_response, row_state, table_state
+from .metrics import MetricsAllowed, SerializerTimingMixin
 from .models import Books, Authors, Comments
+from .pagination import BooksCursorPagination, BooksListPagination, CommentsCursorPagination
+from .readers import AuthorsValuesSerializer, BooksValuesSerializer, CommentsValuesSerializer
+from .relations import resolve_authors, resolve_books, unique_author_key
+from .renderers import FastJSONRenderer
 from .serializers import BooksSerializer, BookSerializer, AuthorsReadSerializer, AuthorsWriteSerializer, \
     CommentsListSerializer, CommentsWriteSerializer
+from .writebehind import comment_writer, write_behind_mode
+
+
+class EagerLoadingMixin:
+    """
+    Строит queryset из того, что объявляет сериализатор представления (setup_eager_loading, с учётом
+    параметров запроса), чтобы связанные данные подтягивались фиксированным числом запросов, а не на каждую запись.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.request.method in SAFE_METHODS and hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset, request=self.request)
+        return queryset
+
+
+class FastReadMixin:
+    """
+    Быстрый путь чтения (core.readers): на GET вместо serializer_class используется fast_serializer_class,
+    который строит ответ из values() без полей ModelSerializer. Вывод тот же.
+    Отключается для представления fast_serializer_class = None, для всех - FAST_READ_ENABLED = False.
+    Должен стоять перед EagerLoadingMixin: queryset строится по выбранному здесь сериализатору.
+    """
+    fast_serializer_class = None
+
+    def get_serializer_class(self):
+        if (self.fast_serializer_class is not None and self.request.method in SAFE_METHODS
+                and getattr(settings, 'FAST_READ_ENABLED', True)):
+            return self.fast_serializer_class
+        return super().get_serializer_class()
 
 
-class BookDetailView(DetailView):
+def initial_data(view_class, request, path, **kwargs):
+    """
+    Ответ GET path (API-представление списка view_class) для встраивания в страницу через json_script:
+    тот же queryset, пагинация и сериализатор, ссылки пагинации ведут на API. Параметры запроса страницы
+    передаются API. При ошибке в параметрах - None, тогда страница запросит API сама.
+    """
+    api_request = copy.copy(request)
+    api_request.path = api_request.path_info = path
+    view = view_class()
+    view.setup(api_request, **kwargs)
+    view.request = view.initialize_request(api_request)
+    view.format_kwarg = None
+    try:
+        return view.list(view.request).data
+    except APIException:
+        return None
+
+
+class BookDetailView(ConditionalGetMixin, DetailView):
     """
     Страница просмотра книги.
     /lib/book/<int:pk>/
-    Данные комментариев подтягиваются ajax-запросом со страницы
+    Первая страница комментариев встроена в страницу (json_script comments_initial, как GET /lib/api/comments/<pk>/),
+    следующие подтягиваются ajax-запросами; без JavaScript она же выводится в <noscript> (отдельного запроса
+    последних комментариев нет). Авторы - из денормализованного Books.authors_display.
+    Блок книги и авторов - из кэша фрагментов (core.fragments): книга читается из БД только для его перерисовки.
     """
     model = Books
+    replica_reads = True
+    template_name = 'core/books_detail.html'
+
+    def get_validators(self, request):
+        self.validators = row_state(Books, pk=self.kwargs['pk'])
+        return self.validators
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['authors'] = Authors.objects.filter(books=self.object)
-        context['book_id'] = self.object.pk
+    def get(self, request, *args, **kwargs):
+        # Наличие книги уже проверено валидаторами условного GET
+        if self.validators is None:
+            raise Http404
+        self.object = SimpleLazyObject(self.get_object)
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    def get_context_data(self, **kwargs):
+        # Мимо SingleObjectMixin.get_context_data: он обращается к self.object и загрузил бы книгу
+        context = super(SingleObjectMixin, self).get_context_data(**kwargs)
+        book_id = self.kwargs['pk']
+        context['comments_initial'] = initial_data(CommentsAPIList, self.request, f'/lib/api/comments/{book_id}/',
+                                                   book_id=book_id)
+        context['book_id'] = book_id
         context['menu_link_1'] = {'link': reverse('books_list'), 'name': 'Список книг'}
         return context
 
@@ -32,15 +120,23 @@ def books_list(request):
     """
     "Главная страница" (Перечень книг)
     /lib/books/
+    Первая страница книг встроена в страницу (json_script books_initial, как GET /lib/api/books/)
     """
-    context = {'title': 'Библиотка ;-)'}
+    context = {'title': 'Библиотка ;-)', 'books_initial': initial_data(BooksAPIList, request, '/lib/api/books/')}
     return render(request, 'core/books_list.html', context)
 
 
-class CommentsAPIList(generics.ListCreateAPIView):
+class CommentsAPIList(ConditionalGetMixin, SerializerTimingMixin, FastReadMixin, EagerLoadingMixin, BatchMixin,
+                      generics.ListCreateAPIView):
     """
-    Список комментариев (GET)
+    Список комментариев (GET), постранично от новых к старым
     /lib/api/comments/<int:book_id>/
+    /lib/api/comments/
+    Параметры:
+        cursor - курсор страницы (ссылки next/previous в ответе),
+        page_size - размер страницы,
+        after_id - только комментарии с id больше указанного,
+        since - только комментарии, добавленные позже указанного момента (ISO 8601).
     Создание комментария (POST)
     /lib/api/comments/
     Для добавления комментария нужно отослать POST вида:
@@ -48,54 +144,97 @@ class CommentsAPIList(generics.ListCreateAPIView):
        "content": "Комментарий.... ",
         "book": 13 (id книги)
     }
+    Пакетно (core.batch): GET ?ids=1,2,3 и POST массива таких объектов.
+    Частота записи ограничена корзинами токенов группы 'comments' (core.throttling), сверх нормы - 429.
+    С COMMENTS_WRITE_BEHIND одиночный комментарий записывается пакетом в потоке записи (core.writebehind):
+    'wait' - ответ после записи, 'provisional' - сразу 202 с предварительными provisional_id и временем.
     """
     queryset = Comments.objects.all().order_by('-time_creation')
+    throttle_scope = 'comments'
+    replica_reads = True
     serializer_class = CommentsListSerializer
+    fast_serializer_class = CommentsValuesSerializer
+    pagination_class = CommentsCursorPagination
     authentication_classes = []
+    batch_serializer_class = CommentsWriteSerializer
+    batch_create = staticmethod(create_comments)
+
+    def get_validators(self, request):
+        """
+        Добавление/удаление комментария отмечается в updated_at книги (core.signals)
+        """
+        book_id = self.kwargs.get('book_id', None)
+        if book_id:
+            return row_state(Books, pk=book_id)
+        return table_state(Books)
 
     def post(self, request):
+        if isinstance(request.data, list):
+            return self.batch_post(request)
         serializer = CommentsWriteSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data)
+        mode = write_behind_mode()
+        if mode is None:
+            serializer.save()
+            return Response(serializer.data)
+
+        pending = comment_writer.submit(serializer.validated_data)
+        if mode == 'provisional':
+            return Response(pending.provisional(), status=status.HTTP_202_ACCEPTED)
+        return Response(CommentsWriteSerializer(pending.result()).data)
+
+    def get_batch_context(self, items):
+        """
+        Книги всех комментариев пакета - одним запросом (core.serializers.BookPrimaryKeyField)
+        """
+        book_ids = {str(item.get('book')) for item in items if isinstance(item, dict)}
+        return {'books': Books.objects.only('id').in_bulk([int(pk) for pk in book_ids if pk.isdigit()])}
 
     def get_queryset(self):
         """
-        Если в запросе отсутствует book_id выдаётся список всех комментариев
+        Если в запросе отсутствует book_id выдаётся лента всех комментариев
         """
-        book_id = self.kwargs.get('book_id', None)
-        if book_id:
-            return self.queryset.filter(book__id=book_id)
-        else:
-            return self.queryset.all()
+        return filter_comments(super().get_queryset(), self.kwargs.get('book_id', None), self.request.query_params)
 
 
-class CommentAPI(generics.RetrieveAPIView):
+def filter_comments(queryset, book_id, query_params):
+    """
+    Комментарии книги (или все) с фильтрами after_id и since из параметров запроса
+    """
+    if book_id:
+        queryset = queryset.filter(book__id=book_id)
+
+    after_id = query_params.get('after_id')
+    if after_id is not None:
+        if not after_id.isdigit():
+            raise ValidationError({'after_id': 'Ожидается целое число'})
+        queryset = queryset.filter(id__gt=int(after_id))
+
+    since = query_params.get('since')
+    if since is not None:
+        since_dt = parse_datetime(since)
+        if since_dt is None:
+            raise ValidationError({'since': 'Ожидается дата-время в формате ISO 8601'})
+        queryset = queryset.filter(time_creation__gt=since_dt)
+    return queryset
+
+
+class CommentAPI(ConditionalGetMixin, SerializerTimingMixin, FastReadMixin, EagerLoadingMixin,
+                 generics.RetrieveAPIView):
     """
     Полный комментарий (GET)
     /lib/api/comment/<pk>/
     """
     queryset = Comments.objects.all()
     serializer_class = CommentsListSerializer
+    fast_serializer_class = CommentsValuesSerializer
 
+    def get_validators(self, request):
+        return row_state(Books, comments__pk=self.kwargs['pk'])
 
-class BooksListPagination(PageNumberPagination):
-    """
-    Пагинация списка книг
-    """
-    page_size = 3
-
-    def get_paginated_response(self, data):
-        return Response({
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'pagenum': int(self.request.query_params.get('page', 1)),
-            'total_pages': self.page.paginator.num_pages,
-            'results': data
-        })
 
-
-class BooksAPIList(generics.ListCreateAPIView):
+class BooksAPIList(CachedResponseMixin, ConditionalGetMixin, SerializerTimingMixin, FastReadMixin, EagerLoadingMixin,
+                   BatchMixin, generics.ListCreateAPIView):
     """
     Получение списка книг (GET).
     Создание книги (POST).
@@ -114,28 +253,58 @@ class BooksAPIList(generics.ListCreateAPIView):
         ]
     }
     Массив authors можно оставить пустым, если автор не найден в БД, будет создан
+
+    Пагинация выбирается настройкой BOOKS_PAGINATION: 'cursor' (по ключу title, id) или 'page' (по номеру страницы).
+    Состав книги: ?fields=id,title,... и ?expand=comments,authors (core.fieldsets).
+    Пакетно (core.batch): GET ?ids=1,2,3 и POST массива книг.
     """
     queryset = Books.objects.all()
+    throttle_scope = 'books'
+    replica_reads = True
     serializer_class = BooksSerializer
-    pagination_class = BooksListPagination
+    fast_serializer_class = BooksValuesSerializer
+    batch_serializer_class = BookSerializer
+    batch_create = staticmethod(create_books)
+
+    def get_validators(self, request):
+        return table_state(Books)
+
+    @property
+    def pagination_class(self):
+        if getattr(settings, 'BOOKS_PAGINATION', 'cursor') == 'page':
+            return BooksListPagination
+        return BooksCursorPagination
 
     def post(self, request):
+        if isinstance(request.data, list):
+            return self.batch_post(request)
         serializer = BookSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
         return Response(serializer.data)
 
+    def get_batch_results(self, objs):
+        return fetch_in_order(Books.objects.prefetch_related('authors'), [book.pk for book in objs])[0]
+
 
-class BookAPI(generics.RetrieveUpdateDestroyAPIView):
+class BookAPI(CachedResponseMixin, ConditionalGetMixin, SerializerTimingMixin, FastReadMixin, EagerLoadingMixin,
+              generics.RetrieveUpdateDestroyAPIView):
     """
     Подробная информация о книге (GET)
     Удаление книги (DELETE)
     Обновление книги (PUT)
     /lib/api/book/<pk>/
+    Состав книги: ?fields=id,title,... и ?expand=comments,authors (core.fieldsets).
     """
     queryset = Books.objects.all()
+    throttle_scope = 'books'
+    replica_reads = True
     serializer_class = BooksSerializer
+    fast_serializer_class = BooksValuesSerializer
+
+    def get_validators(self, request):
+        return row_state(Books, pk=self.kwargs['pk'])
 
     def put(self, request, *args, **kwargs):
         """
@@ -160,38 +329,28 @@ class BookAPI(generics.RetrieveUpdateDestroyAPIView):
         authors_data = serializer.validated_data.get('authors', None)
 
         book_pk = kwargs.get('pk', None)
-        books = Books.objects.filter(pk=book_pk)
-        if not books:
-            raise Http404
+        with transaction.atomic():
+            book = Books.objects.filter(pk=book_pk).first()
+            if book is None:
+                raise Http404
+
+            # Сохраняем через save(), чтобы сработали сигналы (сброс кэша ответов)
+            book.title = request.data['title']
+            book.year = request.data['year']
+            book.save(update_fields=['title', 'year'])
 
-        books.update(title=request.data['title'], year=request.data['year'])
-
-        # Обрабатываем полученную информацию об авторах
-        # Связанные поля изменяем только если они пришли, если пришёл пустой массив - оставляем как есть, не трогаем.
-        if authors_data:
-            # Очистка поля
-            books[0].authors.clear()
-            for author_data in authors_data:
-                # Ищем каждого автора в БД
-                list_author_exist = Authors.objects.filter(surname=author_data['surname'],
-                                                           name=author_data['name'],
-                                                           patronymic=author_data['patronymic'])
-                if list_author_exist:
-                    # Если автор найден - добавляем
-                    for author_exist in list_author_exist:
-                        books[0].authors.add(author_exist)
-                else:
-                    # Если не найден - создаём, добавляем .
-                    new_author = Authors.objects.create(**author_data)
-                    books[0].authors.add(new_author)
-                books[0].save()
+            # Связанные поля изменяем только если они пришли, если пришёл пустой массив - оставляем как есть, не трогаем.
+            # Все авторы ищутся одним запросом, ненайденные создаются, связи меняются разницей (set).
+            if authors_data:
+                book.authors.set(resolve_authors(authors_data))
 
         # Возвращаем сериализатор от обновлённой книги.
-        serializer = BookSerializer(books[0])
+        serializer = BookSerializer(book)
         return Response(serializer.data)
 
 
-class AutorsAPIList(generics.ListCreateAPIView):
+class AutorsAPIList(CachedResponseMixin, ConditionalGetMixin, SerializerTimingMixin, FastReadMixin,
+                    EagerLoadingMixin, BatchMixin, generics.ListCreateAPIView):
     """
     Получение списка авторов (GET).
     Добавление информации об авторе (POST).
@@ -211,19 +370,34 @@ class AutorsAPIList(generics.ListCreateAPIView):
         ]
     }
     Массив "books" можно оставить пустым. Если "книга" не найдена в БД, будет создана.
+    Пакетно (core.batch): GET ?ids=1,2,3 и POST массива авторов.
     """
     queryset = Authors.objects.all()
+    throttle_scope = 'authors'
+    replica_reads = True
     serializer_class = AuthorsReadSerializer
+    fast_serializer_class = AuthorsValuesSerializer
+    batch_serializer_class = AuthorsWriteSerializer
+    batch_create = staticmethod(create_authors)
+
+    def get_validators(self, request):
+        return table_state(Authors)
 
     def post(self, request):
+        if isinstance(request.data, list):
+            return self.batch_post(request)
         serializer = AuthorsWriteSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
         return Response(serializer.data)
 
+    def get_batch_results(self, objs):
+        return fetch_in_order(Authors.objects.prefetch_related('books'), [author.pk for author in objs])[0]
+
 
-class AuthorAPI(generics.RetrieveUpdateDestroyAPIView):
+class AuthorAPI(CachedResponseMixin, ConditionalGetMixin, SerializerTimingMixin, FastReadMixin, EagerLoadingMixin,
+                generics.RetrieveUpdateDestroyAPIView):
     """
     Подробная информация об авторе (GET)
     Удаление автора (DELETE)
@@ -231,7 +405,12 @@ class AuthorAPI(generics.RetrieveUpdateDestroyAPIView):
     /lib/api/author/<pk>/
     """
     queryset = Authors.objects.all()
+    throttle_scope = 'authors'
     serializer_class = AuthorsReadSerializer
+    fast_serializer_class = AuthorsValuesSerializer
+
+    def get_validators(self, request):
+        return row_state(Authors, pk=self.kwargs['pk'])
 
     def put(self, request, *args, **kwargs):
         """
@@ -262,27 +441,172 @@ class AuthorAPI(generics.RetrieveUpdateDestroyAPIView):
         books_data = serializer.validated_data.get('books', None)
 
         author_pk = kwargs.get('pk', None)
-        authors = Authors.objects.filter(pk=author_pk)
-        if not authors:
-            raise Http404
-
-        authors.update(surname=request.data['surname'], name=request.data['name'],
-                       patronymic=request.data['patronymic'], year=request.data['year'])
-
-        # В связанном поле изменяем только если что-то пришло,
-        # если пришёл пустой массив - оставляем как есть, ничего не трогаем.
-        if books_data:
-            authors[0].books.clear()
-            for book_data in books_data:
-                list_book_exist = Books.objects.filter(title=book_data['title'], year=book_data['year'])
-
-                if list_book_exist:
-                    for book_exist in list_book_exist:
-                        authors[0].books.add(book_exist)
-                else:
-                    new_book = Books.objects.create(**book_data)
-                    authors[0].books.add(new_book)
-                authors[0].save()
-
-        serializer = AuthorsWriteSerializer(authors[0])
+        with transaction.atomic():
+            author = Authors.objects.filter(pk=author_pk).first()
+            if author is None:
+                raise Http404
+
+            # Сохраняем через save(), чтобы пересчитался ключ ФИО и сработали сигналы
+            author.surname = request.data['surname']
+            author.name = request.data['name']
+            author.patronymic = request.data['patronymic']
+            author.year = request.data['year']
+            with unique_author_key():
+                author.save(update_fields=['surname', 'name', 'patronymic', 'year'])
+
+            # В связанном поле изменяем только если что-то пришло,
+            # если пришёл пустой массив - оставляем как есть, ничего не трогаем.
+            if books_data:
+                author.books.set(resolve_books(books_data))
+
+        serializer = AuthorsWriteSerializer(author)
         return Response(serializer.data)
+
+
+class ResponseCacheStatsAPI(APIView):
+    """
+    Счётчики кэша ответов текущего процесса (GET)
+    /lib/api/stats/cache/
+    """
+    permission_classes = (MetricsAllowed,)
+
+    def get(self, request):
+        return Response(response_cache.stats())
+
+
+class ThrottleStatsAPI(APIView):
+    """
+    Счётчики ограничителя записи текущего процесса и токены общих корзин групп (GET)
+    /lib/api/stats/throttle/
+    """
+    permission_classes = (MetricsAllowed,)
+
+    def get(self, request):
+        return Response(throttling.stats())
+
+
+class SearchAPI(APIView):
+    """
+    Полнотекстовый поиск по наименованиям книг, ФИО авторов и комментариям (GET)
+    /lib/api/search/?q=<строка>&page=<номер>&page_size=<размер>
+    Результаты по убыванию релевантности:
+    {
+        "next": ..., "previous": ...,
+        "results": [{"type": "book" | "comment", "id": 1, "book_id": 1, "title": "...", "snippet": "...", "rank": 1.5}]
+    }
+    """
+    page_size = 10
+    max_page_size = 50
+
+    def get(self, request):
+        if not search.is_available():
+            raise APIException('Полнотекстовый поиск доступен только на SQLite (FTS5)')
+
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'Пустая строка поиска'})
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            raise ValidationError({'page': 'Ожидается целое число'})
+
+        # Одна лишняя запись показывает, есть ли следующая страница, без COUNT по индексу
+        results = search.search(query, limit=page_size + 1, offset=(page - 1) * page_size)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(results) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': results[:page_size],
+        })
+
+
+# Асинхронные читающие представления (ASGI). ORM в Django 3.2 синхронный, поэтому работа с БД
+# уходит в поток одним вызовом sync_to_async, а ответ из кэша (и 304 по нему) отдаётся
+# прямо в цикле событий, не занимая поток. Ответы те же, что у BookAPI и CommentsAPIList.
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return json_response(detail, status=exc.status_code)
+
+
+async def book_async(request, pk):
+    """
+    Подробная информация о книге (GET)
+    /lib/api/async/book/<pk>/
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if not response_cache.enabled or not response_cache.cacheable(request):
+        return await load_book(request, pk)
+
+    key, generation, cached = response_cache.respond(request)
+    if cached is not None:
+        return cached
+    response = await load_book(request, pk)
+    response['X-Cache'] = 'MISS'
+    if response_cache.storable(response):
+        response_cache.set(key, generation, response)
+    return response
+
+
+@sync_to_async
+def load_book(request, pk):
+    validators = row_state(Books, pk=pk)
+    if validators is None:
+        return error_response(NotFound())
+    not_modified, headers = conditional_response(request, validators)
+    if not_modified is not None:
+        return not_modified
+    try:
+        book = BooksValuesSerializer.setup_eager_loading(Books.objects.filter(pk=pk), request).first()
+    except APIException as exc:
+        return error_response(exc)
+    response = json_response(BooksValuesSerializer(book, context={'request': request}).data)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+async def book_comments_async(request, book_id):
+    """
+    Комментарии книги постранично от новых к старым (GET), параметры - как у CommentsAPIList
+    /lib/api/async/comments/<book_id>/
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    return await load_book_comments(request, book_id)
+
+
+@sync_to_async
+def load_book_comments(request, book_id):
+    validators = row_state(Books, pk=book_id)
+    not_modified, headers = conditional_response(request, validators) if validators else (None, {})
+    if not_modified is not None:
+        return not_modified
+
+    api_request = Request(request)
+    paginator = CommentsCursorPagination()
+    try:
+        queryset = filter_comments(Comments.objects.all(), book_id, api_request.query_params)
+        page = paginator.paginate_queryset(CommentsValuesSerializer.setup_eager_loading(queryset), api_request)
+    except APIException as exc:
+        return error_response(exc)
+    response = json_response(paginator.get_paginated_response(CommentsValuesSerializer(page, many=True).data).data)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def comments_stream(request, book_id):
+    """
+    Поток новых комментариев книги (server-sent events)
+    /lib/api/comments/<book_id>/stream/
+    Под ASGI запрос перехватывает core.streams.comments_stream (Library/asgi.py) и сюда не доходит.
+    Под WSGI поток держал бы поток сервера на каждого клиента, поэтому 204: EventSource не переподключается.
+    """
+    return HttpResponse(status=204)
@@ -0,0 +1,192 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .batch import create_comments
+from .cache import response_cache
+from .readers import DATETIME
+
+# Отложенная запись комментариев (write-behind) для всплесков нагрузки, включается COMMENTS_WRITE_BEHIND:
+#     None          - как раньше: каждый комментарий своей транзакцией в запросе;
+#     'wait'        - проверенный комментарий уходит в очередь процесса, ответ - после фиксации пакета
+#                     (настоящие id и время), несколько запросов делят одну транзакцию и один fsync;
+#     'provisional' - ответ 202 сразу после постановки в очередь: предварительные provisional_id и время,
+#                     id = null. Комментарии из очереди теряются, если процесс аварийно завершится.
+# Поток записи берёт из очереди до COMMENTS_WRITE_BEHIND_BATCH комментариев, ожидая добора не дольше
+# COMMENTS_WRITE_BEHIND_INTERVAL секунд, и пишет их одной транзакцией (core.batch.create_comments: bulk_create,
+# счётчики книг, поток комментариев). Очередь ограничена COMMENTS_WRITE_BEHIND_QUEUE: при заполнении запрос ждёт
+# место COMMENTS_WRITE_BEHIND_PUT_TIMEOUT секунд, затем 503 с Retry-After. При завершении процесса очередь
+# дописывается (atexit). COMMENTS_WRITE_BEHIND_SYNCHRONOUS - PRAGMA synchronous соединения потока записи
+# (None - как в профиле БД).
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд запрос в режиме 'wait' ждёт фиксации своего пакета
+WAIT_TIMEOUT = 30
+
+_STOP = object()
+
+
+def write_behind_mode():
+    return getattr(settings, 'COMMENTS_WRITE_BEHIND', None)
+
+
+class WriteQueueFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Очередь записи комментариев заполнена, повторите запрос позже'
+    default_code = 'write_queue_full'
+    # DRF выставляет заголовок Retry-After по атрибуту wait
+    wait = 1
+
+
+class WriteFailed(APIException):
+    default_detail = 'Комментарий не записан'
+    default_code = 'write_failed'
+
+
+class PendingComment:
+    """
+    Комментарий в очереди: проверенные данные и результат записи (comment или error после события done)
+    """
+    __slots__ = ('data', 'provisional_id', 'queued_at', 'comment', 'error', 'done')
+
+    def __init__(self, data):
+        self.data = data
+        self.provisional_id = uuid.uuid4().hex
+        self.queued_at = timezone.now()
+        self.comment = None
+        self.error = None
+        self.done = threading.Event()
+
+    def provisional(self):
+        return {
+            'id': None,
+            'provisional_id': self.provisional_id,
+            'time_creation': DATETIME.to_representation(self.queued_at),
+            'content': self.data['content'],
+            'book': self.data['book'].pk,
+        }
+
+    def result(self, timeout=WAIT_TIMEOUT):
+        if not self.done.wait(timeout):
+            raise WriteFailed('Комментарий не записан за отведённое время, он может появиться позже')
+        if self.error is not None:
+            raise WriteFailed()
+        return self.comment
+
+
+class CommentWriter:
+    """
+    Очередь комментариев и поток, записывающий их пакетами (описание - в начале модуля).
+    Поток запускается при первом комментарии.
+    """
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, data):
+        pending = PendingComment(data)
+        self.start()
+        try:
+            self.queue.put(pending, timeout=getattr(settings, 'COMMENTS_WRITE_BEHIND_PUT_TIMEOUT', 1.0))
+        except queue.Full:
+            self.rejected += 1
+            raise WriteQueueFull()
+        self.queued += 1
+        return pending
+
+    def start(self):
+        with self._lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            if self.queue is None:
+                self.queue = queue.Queue(getattr(settings, 'COMMENTS_WRITE_BEHIND_QUEUE', 1000))
+            self.thread = threading.Thread(target=self.run, name='comments-write-behind', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Дописывает очередь и останавливает поток
+        """
+        with self._lock:
+            thread = self.thread
+            if thread is None or not thread.is_alive():
+                return
+            self.queue.put(_STOP)
+        thread.join(timeout)
+
+    def run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                batch_size = getattr(settings, 'COMMENTS_WRITE_BEHIND_BATCH', 100)
+                deadline = time.monotonic() + getattr(settings, 'COMMENTS_WRITE_BEHIND_INTERVAL', 0.05)
+                while len(batch) < batch_size:
+                    try:
+                        item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self.flush(batch)
+        finally:
+            connection.close()
+
+    def flush(self, batch):
+        try:
+            synchronous = getattr(settings, 'COMMENTS_WRITE_BEHIND_SYNCHRONOUS', None)
+            if synchronous and connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'PRAGMA synchronous = {synchronous}')
+            with transaction.atomic():
+                comments = create_comments([pending.data for pending in batch])
+                response_cache.invalidate()
+        except Exception as exc:
+            logger.exception('Пакет из %d комментариев не записан', len(batch))
+            self.failed += len(batch)
+            for pending in batch:
+                pending.error = exc
+        else:
+            self.written += len(batch)
+            self.batches += 1
+            for pending, comment in zip(batch, comments):
+                pending.comment = comment
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'written': self.written,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'pending': self.queue.qsize() if self.queue is not None else 0,
+        }
+
+
+comment_writer = CommentWriter()
+
+atexit.register(comment_writer.stop)
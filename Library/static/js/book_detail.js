@@ -5,22 +5,67 @@ const app = Vue.createApp({
         return { 
             serverUrl: "http://127.0.0.1:8000",
             Comments: [],
+            commentsNext: null,
             bookId: 0,
             addCommentText: ""
         }
     },
     methods: {
         updateComments(url) {
-            // Функция обновления комментариев
+            // Функция обновления комментариев (первая страница ленты)
+            cachedGet(url)
+                .then(data => {
+                    this.Comments = data.results
+                    this.commentsNext = data.next
+                })
+                .catch(error => {
+                    console.log(error)
+                })
+
+        },
+
+        loadOlderComments() {
+            // Следующая страница ленты - более старые комментарии
             axios
-                .get(url)
+                .get(this.commentsNext)
                 .then(response => {
-                    this.Comments = response.data
+                    this.Comments = this.Comments.concat(response.data.results)
+                    this.commentsNext = response.data.next
                 })
                 .catch(error => {
                     console.log(error)
                 })
+        },
 
+        loadNewComments() {
+            // Запрашиваем только комментарии новее последнего полученного
+            const lastId = this.Comments.reduce((maxId, comment) => Math.max(maxId, comment.id), 0)
+            axios
+                .get(this.serverUrl+"/lib/api/comments/"+this.bookId+"/?after_id="+lastId)
+                .then(response => {
+                    this.prependComments(response.data.results)
+                })
+                .catch(error => {
+                    console.log(error)
+                })
+        },
+
+        prependComments(comments) {
+            // Новые комментарии в начало ленты, уже показанные (пришли и из потока, и запросом) пропускаются
+            const known = new Set(this.Comments.map(comment => comment.id))
+            this.Comments = comments.filter(comment => !known.has(comment.id)).concat(this.Comments)
+        },
+
+        listenComments() {
+            // Поток новых комментариев (server-sent events, под ASGI). Под WSGI сервер отвечает 204
+            // и браузер не переподключается - остаётся обновление после своего комментария.
+            if (!window.EventSource) {
+                return
+            }
+            const stream = new EventSource(this.serverUrl+"/lib/api/comments/"+this.bookId+"/stream/")
+            stream.addEventListener("comment", event => {
+                this.prependComments([JSON.parse(event.data)])
+            })
         },
 
         dateFilter(value) {
@@ -35,7 +80,7 @@ const app = Vue.createApp({
             axios.post(this.serverUrl+"/lib/api/comments/", {"content": this.addCommentText, "book": this.bookId})
                 .then((response) => {
                     this.addCommentText = ""        
-                    this.updateComments(this.serverUrl+"/lib/api/comments/"+this.bookId+"/")
+                    this.loadNewComments()
                 })
                 .catch((error) => {
                     console.log(error)
@@ -43,9 +88,16 @@ const app = Vue.createApp({
         }
     },
     mounted() {
-        // При загрузке страницы - получаем id книги, и обновляем список комментариев
+        // При загрузке страницы - получаем id книги и первую страницу комментариев, встроенную сервером (json_script)
         this.bookId = JSON.parse(document.querySelector('#book_id').textContent)
-        this.updateComments(this.serverUrl+"/lib/api/comments/"+this.bookId+"/")
+        const initial = JSON.parse(document.querySelector('#comments_initial').textContent)
+        if (initial) {
+            this.Comments = initial.results
+            this.commentsNext = initial.next
+        } else {
+            this.updateComments(this.serverUrl+"/lib/api/comments/"+this.bookId+"/")
+        }
+        this.listenComments()
     }
 })
 
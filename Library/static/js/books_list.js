@@ -8,6 +8,7 @@ const app = Vue.createApp({
 
             paginationNext: null, 
             paginationPrevious: null,
+            paginationLast: null,
             paginationCurrentPage: null,
             paginationTotalPage: null,
             
@@ -17,22 +18,27 @@ const app = Vue.createApp({
     },
     methods: {
         updateBookList(url) {
-            // обновление списка книг на текущей странице. Вызывается при загрузке и смене страниц (пагинации).
-            axios
-                .get(url)
-                .then(response => {
-                    this.booksList = response.data.results
-
-                    this.paginationTotalPage = response.data.total_pages
-                    this.paginationNext = response.data.next
-                    this.paginationPrevious = response.data.previous
-                    this.paginationCurrentPage = response.data.pagenum
+            // обновление списка книг на текущей странице. Вызывается при смене страниц (пагинации).
+            cachedGet(url)
+                .then(data => {
+                    this.showBooks(data)
                 })
                 .catch(error => {
                     console.log(error)
                 })
         },
 
+        showBooks(data) {
+            // Страница книг - ответ /lib/api/books/ или встроенная в страницу первая страница
+            this.booksList = data.results
+
+            this.paginationTotalPage = data.total_pages
+            this.paginationNext = data.next
+            this.paginationPrevious = data.previous
+            this.paginationLast = data.last
+            this.paginationCurrentPage = data.pagenum
+        },
+
         // Функции вызываемые при смене страниц (пагинации)
         setPreviosPage() {
             this.updateBookList(this.paginationPrevious)
@@ -44,13 +50,23 @@ const app = Vue.createApp({
             this.updateBookList(this.paginationNext)
         },
         setLastPage() {
-            this.updateBookList(this.serverUrl+"/lib/api/books/?page="+this.paginationTotalPage)
+            // При курсорной пагинации сервер сам отдаёт ссылку на последнюю страницу
+            if (this.paginationLast) {
+                this.updateBookList(this.paginationLast)
+            } else {
+                this.updateBookList(this.serverUrl+"/lib/api/books/?page="+this.paginationTotalPage)
+            }
         }
     },
 
     mounted() {
-        // При загрузке страницы - подгружаем список книг
-        this.updateBookList(this.serverUrl+"/lib/api/books/")
+        // Первая страница книг встроена сервером (json_script), API запрашивается только при смене страниц
+        const initial = JSON.parse(document.querySelector('#books_initial').textContent)
+        if (initial) {
+            this.showBooks(initial)
+        } else {
+            this.updateBookList(this.serverUrl+"/lib/api/books/")
+        }
     }
 })
 
@@ -0,0 +1,18 @@
+// Ответы API по адресу вместе с ETag: при повторном запросе сервер отвечает 304, если данные не менялись
+const apiCache = {}
+
+function cachedGet(url) {
+    const cached = apiCache[url]
+    const headers = cached ? {"If-None-Match": cached.etag} : {}
+    return axios
+        .get(url, {headers: headers, validateStatus: status => (status >= 200 && status < 300) || status === 304})
+        .then(response => {
+            if (response.status === 304) {
+                return cached.data
+            }
+            if (response.headers.etag) {
+                apiCache[url] = {etag: response.headers.etag, data: response.data}
+            }
+            return response.data
+        })
+}